@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Callable, Optional, Tuple
+
+import ratelimit
+import retry
+import storage
+from getData import PageResult
+
+try:
+    import aiohttp
+except ImportError:  # 异步下载为可选功能
+    aiohttp = None
+
+
+def is_transient(error: BaseException) -> bool:
+    """aiohttp的临时性错误: 连接失败、超时、下载不完整以及408/425/429/5xx"""
+    if isinstance(error, retry.CircuitOpenError):
+        return False
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in (408, 425, 429) or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, retry.IncompleteDownload))
+
+
+class AsyncDownloader:
+    """基于asyncio的图片下载器，用信号量限制同时进行的请求数量"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        timeout: int = 60,
+        callback: Optional[Callable[[PageResult], None]] = None,
+        manifest: Optional[storage.PageManifest] = None,
+        verify: bool = False,
+        store: Optional[storage.ContentStore] = None,
+        archive: Optional[storage.CBZWriter] = None,
+        limiter: Optional[ratelimit.RateLimiter] = None,
+        retry_policy: Optional[retry.RetryPolicy] = None,
+        breakers: Optional[retry.CircuitBreakers] = None,
+        budget: Optional[retry.RetryBudget] = None,
+    ):
+        """
+        :param max_concurrency: 同时进行的最大请求数
+        :param timeout: (单位: s) 单张图片超时时限
+        :param callback: 每完成一页调用一次
+        :param manifest: 章节的页面清单，用于跳过已完成的页面
+        :param verify: 跳过前是否校验sha256
+        :param store: 按内容寻址的图片仓库，用于去重
+        :param archive: 章节压缩包，设置后页面直接写入压缩包而不是文件
+        :param limiter: 按主机的自适应限流器，与信号量同时生效
+        :param retry_policy: 重试的退避参数，错误判断固定使用is_transient
+        :param breakers: 按主机的熔断器
+        :param budget: 所有页面共用的重试预算
+        """
+        if aiohttp is None:
+            raise RuntimeError("异步下载需要安装aiohttp: pip install aiohttp")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.callback = callback
+        self.manifest = manifest
+        self.verify = verify
+        self.store = store
+        self.archive = archive
+        self.limiter = limiter
+        self.retry_policy = (retry_policy or retry.RetryPolicy(is_transient)).using(is_transient)
+        self.breakers = breakers
+        self.budget = budget
+
+    def _slot(self, url: str):
+        return self.limiter.slot(url) if self.limiter else ratelimit.UNLIMITED
+
+    async def _retry(self, result: PageResult, func: Callable, *args):
+        """只重试这一页，重试次数计入budget"""
+        return await self.retry_policy.call_async(
+            func,
+            *args,
+            budget=self.budget,
+            breaker=self.breakers.get(result.url) if self.breakers else None,
+            describe=f'第{result.index}页',
+        )
+
+    @staticmethod
+    def _read_part(path: str) -> Tuple[int, 'hashlib._Hash']:
+        """已有临时文件的大小及其内容的sha256"""
+        hasher = hashlib.sha256()
+        if not os.path.exists(path):
+            return 0, hasher
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return os.path.getsize(path), hasher
+
+    def _finish_file(self, part: str, result: PageResult, sha256: str) -> None:
+        """下载完成的临时文件改名，或收入图片仓库后链接到目标位置"""
+        if self.store:
+            self.store.add(part, sha256, result.url)
+            self.store.materialize(sha256, result.path)
+        else:
+            os.replace(part, result.path)
+
+    async def _link_known(self, result: PageResult, name: str) -> bool:
+        """图片仓库中已有该URL时直接链接，不访问网络"""
+        loop = asyncio.get_running_loop()
+        known = await loop.run_in_executor(None, self.store.lookup, result.url)
+        if not known:
+            return False
+        await loop.run_in_executor(None, self.store.materialize, known[0], result.path)
+        if self.manifest:
+            await loop.run_in_executor(None, self.manifest.record, name, result.url, known[1], known[0])
+        result.size = known[1]
+        return True
+
+    async def _fetch_to_archive(self, session, semaphore: asyncio.Semaphore, result: PageResult) -> None:
+        """下载单页并写入章节压缩包"""
+        loop = asyncio.get_running_loop()
+        known = self.store and await loop.run_in_executor(None, self.store.lookup, result.url)
+        if known:
+            data = await loop.run_in_executor(None, self.store.read, known[0])
+        else:
+            async with semaphore, self._slot(result.url) as slot:
+                async with session.get(result.url) as response:
+                    slot.record(response.status, response.headers)
+                    response.raise_for_status()
+                    data = await response.read()
+                    expected = response.content_length
+                    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+                        expected = None
+            if expected is not None and len(data) != expected:
+                raise retry.IncompleteDownload(f'下载不完整 {len(data)}/{expected}')
+            if self.store:
+                await loop.run_in_executor(
+                    None, self.store.add_bytes, data, hashlib.sha256(data).hexdigest(), result.url
+                )
+        await loop.run_in_executor(None, self.archive.add_page, result.index, data)
+        result.size = len(data)
+
+    async def _fetch_to_file(
+        self, session, semaphore: asyncio.Semaphore, result: PageResult, name: str, part: str
+    ) -> None:
+        """下载单页到临时文件，已有临时文件时续传，完成后改名并记入清单"""
+        loop = asyncio.get_running_loop()
+        offset, hasher = await loop.run_in_executor(None, self._read_part, part)
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        async with semaphore, self._slot(result.url) as slot:
+            async with session.get(result.url, headers=headers) as response:
+                slot.record(response.status, response.headers)
+                if offset and response.status == 416:
+                    # 临时文件与服务器不一致，删除后重试时重新下载
+                    await loop.run_in_executor(None, os.remove, part)
+                    raise retry.IncompleteDownload('续传位置无效 已删除临时文件')
+                response.raise_for_status()
+                if response.status != 206:
+                    offset, hasher = 0, hashlib.sha256()
+                expected = response.content_length
+                if response.headers.get('Content-Encoding', 'identity') != 'identity':
+                    expected = None  # 压缩传输时Content-Length不是文件大小
+
+                # 每收到一段数据立即写入临时文件，中断时已收到的部分留在.part中供续传。
+                # 连接断开后aiohttp的下一次读取直接抛出ClientPayloadError，缓冲区中未读的数据会丢失，
+                # 所以两次读取之间不让出事件循环(写入本地文件很快)，尽量缩短数据停留在缓冲区的时间。
+                # 数据和断开同时到达时这部分仍会丢失，续传是尽力而为的: 从.part实际写入的位置继续
+                f = await loop.run_in_executor(None, open, part, 'ab' if offset else 'wb')
+                received = 0
+                try:
+                    async for chunk in response.content.iter_any():
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        received += len(chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+        if expected is not None and received != expected:
+            raise retry.IncompleteDownload(f'下载不完整 {received}/{expected}')
+        sha256 = hasher.hexdigest()
+        await loop.run_in_executor(None, self._finish_file, part, result, sha256)
+        result.size = offset + received
+        if self.manifest:
+            await loop.run_in_executor(
+                None, self.manifest.record, name, result.url, result.size, sha256
+            )
+
+    async def _fetch(self, session, semaphore: asyncio.Semaphore, result: PageResult) -> PageResult:
+        loop = asyncio.get_running_loop()
+        name = os.path.splitext(os.path.basename(result.path))[0]
+        part = result.path + '.part'
+        try:
+            if self.archive:
+                await self._retry(result, self._fetch_to_archive, session, semaphore, result)
+                result.success = True
+            elif self.manifest and await loop.run_in_executor(
+                None, self.manifest.is_complete, name, result.url, result.path, self.verify
+            ):
+                result.size = self.manifest.get(name)['size']
+                result.success = result.skipped = True
+            elif self.store and await self._link_known(result, name):
+                result.success = True
+            else:
+                await self._retry(result, self._fetch_to_file, session, semaphore, result, name, part)
+                result.success = True
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+            logging.warning(f'第{result.index}页下载失败:\t{result.error}')
+            if self.archive:
+                self.archive.skip_page(result.index)
+
+        if self.callback:
+            try:
+                self.callback(result)
+            except Exception as e:
+                logging.error('进度回调出错:\t' + str(e))
+        return result
+
+    async def download_pages(self, pages: list[PageResult]) -> list[PageResult]:
+        """
+        并发下载所有页面
+
+        :param pages: 已填好index、url、path的PageResult列表
+        :return: 按页码排序的PageResult列表
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            results = await asyncio.gather(
+                *(self._fetch(session, semaphore, page) for page in pages)
+            )
+        return sorted(results, key=lambda x: x.index)
+
+    def run(self, pages: list[PageResult]) -> list[PageResult]:
+        """在新的事件循环中同步执行download_pages"""
+        return asyncio.run(self.download_pages(pages))
+
+
+def build_pages(
+    directory: str, urls: list[str], archive: Optional[storage.CBZWriter] = None
+) -> list[PageResult]:
+    """按ComicDownloader的文件命名规则生成待下载页面，写入压缩包时路径为压缩包路径"""
+    return [
+        PageResult(
+            index=i + 1,
+            url=url,
+            path=archive.path if archive else os.path.join(directory, f'{i + 1:03d}.jpg'),
+        )
+        for i, url in enumerate(urls)
+    ]
@@ -0,0 +1,410 @@
+"""
+性能测试脚本
+
+用法:
+    python benchmark.py download --pages 200 --latency 0.05 [--failure-rate 0.1]
+    python benchmark.py extract [--fixture 保存的页面.html ...]
+    python benchmark.py throttle --capacity 50 --threads 16
+    python benchmark.py startup [--repeat 5] [--top 10]
+    python benchmark.py partition --pages 2000 --workers 8
+    python benchmark.py logging --threads 16 --records 5000
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def start_image_server(
+    size: int = 200 * 1024,
+    latency: float = 0.05,
+    capacity: Optional[float] = None,
+    failure_rate: float = 0.0,
+) -> ThreadingHTTPServer:
+    """
+    启动一个本地HTTP服务器代替manhua.acimg.cn
+
+    :param size: 每张图片的字节数
+    :param latency: (单位: s) 每个请求的模拟延迟
+    :param capacity: (单位: 请求/s) 超过该速率的请求返回429，None表示不限制
+    :param failure_rate: 随机返回500的请求比例
+    """
+    payload = os.urandom(size)
+    lock = threading.Lock()
+    bucket = {'tokens': capacity or 0.0, 'last': time.monotonic()}
+
+    def admit() -> bool:
+        if capacity is None:
+            return True
+        with lock:
+            now = time.monotonic()
+            bucket['tokens'] = min(capacity, bucket['tokens'] + (now - bucket['last']) * capacity)
+            bucket['last'] = now
+            if bucket['tokens'] < 1:
+                server.throttled += 1
+                return False
+            bucket['tokens'] -= 1
+            return True
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not admit():
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            time.sleep(latency)
+            if random.random() < failure_rate:
+                server.failed += 1
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024  # 避免高并发时连接被丢弃
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.throttled = 0  # 返回429的次数
+    server.failed = 0  # 返回500的次数
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_download(args):
+    import getData
+
+    server = start_image_server(args.size * 1024, args.latency, failure_rate=args.failure_rate)
+    base = f'http://127.0.0.1:{server.server_address[1]}/manhua_detail/0/'
+    urls = [base + f'{i}.jpg/' for i in range(args.pages)]
+    tmp = tempfile.mkdtemp()
+
+    try:
+        downloader = getData.ComicDownloader(
+            max_download_threads=args.threads,
+            max_async_downloads=args.concurrency,
+            download_path=tmp,
+            init_webdrivers=False,
+            cache_path=None,
+        )
+        comic = getData.ComicData(title='bench', comic_id='0')
+        for backend in ('thread', 'async'):
+            chapter = getData.ChapterInfo(comic=comic, title=backend, cid=backend)
+            start = time.perf_counter()
+            results = downloader.download_chapter(chapter, urls=urls, backend=backend)
+            cost = time.perf_counter() - start
+            ok = sum(1 for x in results if x.success)
+            print(f'{backend:<8}{ok}/{len(urls)}页\t{cost:.3f}s\t{len(urls) / cost:.1f}页/s')
+        if args.failure_rate:
+            print(f'服务器返回500 {server.failed}次')
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_throttle(args):
+    import getData
+
+    server = start_image_server(args.size * 1024, args.latency, args.capacity)
+    base = f'http://127.0.0.1:{server.server_address[1]}/manhua_detail/0/'
+    urls = [base + f'{i}.jpg/' for i in range(args.pages)]
+    tmp = tempfile.mkdtemp()
+
+    try:
+        comic = getData.ComicData(title='bench', comic_id='0')
+        for name, rate in (('unlimited', None), ('adaptive', args.rate)):
+            downloader = getData.ComicDownloader(
+                max_download_threads=args.threads,
+                download_path=tmp,
+                init_webdrivers=False,
+                cache_path=None,
+                rate_limit=rate,
+            )
+            chapter = getData.ChapterInfo(comic=comic, title=name, cid=name)
+            throttled = server.throttled
+            start = time.perf_counter()
+            results = downloader.download_chapter(chapter, urls=urls)
+            cost = time.perf_counter() - start
+            ok = sum(1 for x in results if x.success)
+            print(
+                f'{name:<10}{ok}/{len(urls)}页\t{cost:.3f}s\t'
+                f'成功{ok / cost:.1f}页/s\t429 {server.throttled - throttled}次'
+            )
+            for host, stats in downloader.rate_limit_stats().items():
+                print(f'{"":<10}{host} 速率{stats["rate"]:.1f}/s 并发{stats["concurrency"]}')
+            downloader.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+STARTUP_MODULES = ('tkinter', 'sv_ttk', 'requests', 'selenium.webdriver', 'lib', 'getData', 'main')
+
+FIRST_WINDOW_CODE = '''
+import time
+start = time.perf_counter()
+import logging, os, lib, main
+lib.LogSystem(file_level=logging.DEBUG, console_level=None)
+gui = main.GUI()
+gui.build()
+gui.root.update()
+print(time.perf_counter() - start)
+os._exit(0)
+'''
+
+
+def run_python(code: str, cwd: str, *options: str) -> subprocess.CompletedProcess:
+    """在新的解释器中执行代码，能导入本目录的模块"""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run(
+        [sys.executable, *options, '-c', code], cwd=cwd, env=env, capture_output=True, text=True, timeout=120
+    )
+
+
+def timed_runs(code: str, cwd: str, repeat: int) -> tuple[Optional[list[float]], str]:
+    """
+    :return: (每次输出的耗时，出错时为None, 错误信息)
+    """
+    times = []
+    for _ in range(repeat):
+        result = run_python(code, cwd)
+        if result.returncode:
+            lines = result.stderr.strip().splitlines()
+            return None, lines[-1] if lines else f'退出码{result.returncode}'
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return times, ''
+
+
+def bench_startup(args):
+    # 日志等文件写入临时目录
+    tmp = tempfile.mkdtemp()
+    try:
+        print('导入耗时(新解释器，最小值/中位数):')
+        for module in STARTUP_MODULES:
+            code = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+            times, error = timed_runs(code, tmp, args.repeat)
+            if times is None:
+                print(f'  {module:<20}失败: {error}')
+            else:
+                print(f'  {module:<20}{min(times) * 1000:.0f}ms / {statistics.median(times) * 1000:.0f}ms')
+
+        times, error = timed_runs(FIRST_WINDOW_CODE, tmp, args.repeat)
+        if times is None:
+            print(f'首个窗口: 失败(需要图形界面和sv_ttk): {error}')
+        else:
+            print(f'首个窗口: {min(times) * 1000:.0f}ms / {statistics.median(times) * 1000:.0f}ms')
+
+        if args.top:
+            # -X importtime 输出到stderr: import time: self [us] | cumulative | imported package
+            result = run_python('import main', tmp, '-X', 'importtime')
+            if result.returncode:
+                print('import main 失败，以下只包含失败前导入的模块')
+            rows = []
+            for line in result.stderr.splitlines():
+                parts = line.split('|')
+                if len(parts) == 3 and parts[1].strip().isdigit():
+                    rows.append((int(parts[1]), parts[2].rstrip()))
+            print(f'import main 累计耗时最多的{args.top}个模块:')
+            for cumulative, name in sorted(rows, reverse=True)[:args.top]:
+                print(f'  {cumulative / 1000:8.1f}ms {name}')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def make_bing_page(results: int = 50) -> str:
+    """生成类似bing搜索结果的页面"""
+    items = ''.join(
+        f'<li class="b_algo"><h2><a href="https://ac.qq.com/Comic/comicInfo/id/{600000 + i}?from=bing" h="ID=SERP,{i}">'
+        f'漫画{i}</a></h2><p>{"简介" * 200}</p></li>'
+        for i in range(results)
+    )
+    return f'<html><body><ol id="b_results">{items}</ol></body></html>'
+
+
+def make_chapter_page(pages: int = 120) -> str:
+    """生成类似移动端章节页的页面"""
+    items = ''.join(
+        f'<li><img class="lazy" data-src="https://manhua.acimg.cn/manhua_detail/0/abc/{i}.jpg/800">{"<i></i>" * 50}</li>'
+        for i in range(pages)
+    )
+    return f'<html><body><ul class="comic-pic-list">{items}</ul></body></html>'
+
+
+def bench_extract(args):
+    import lib
+    import getData
+
+    if args.fixture:
+        pages = []
+        for path in args.fixture:
+            with open(path, encoding='utf-8') as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [('bing', make_bing_page()), ('chapter', make_chapter_page())]
+
+    extractors = (getData.BING_EXTRACTOR, getData.IMAGE_EXTRACTOR)
+    for name, source in pages:
+        # 旧实现: 每个结果都重新调用findString扫描整页
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for extractor in extractors:
+                for spec in extractor.specs.values():
+                    found = lib.findString(source, *spec)
+                    for _ in found:
+                        lib.findString(source, *spec)
+        old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for extractor in extractors:
+                extractor.extract(source)
+        new = time.perf_counter() - start
+        print(f'{name:<12}{len(source) / 1024:.0f}KB\tfindString {old:.3f}s\tStringExtractor {new:.3f}s')
+
+
+def bench_partition(args):
+    import lib
+
+    urls = [f'https://example.com/{i % (args.pages // 2)}.jpg' for i in range(args.pages)]  # 含重复URL
+
+    # 旧实现: 每个分片都遍历整个列表
+    start = time.perf_counter()
+    chunk_size, remainder = divmod(len(urls), args.workers)
+    pos = 0
+    for i in range(args.workers):
+        end = pos + chunk_size + (1 if i < remainder else 0)
+        chunk = urls[pos:end]
+        {val: idx for idx, val in enumerate(urls) if val in chunk}
+        pos = end
+    old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parts = lib.partition_with_index(urls, args.workers)
+    new = time.perf_counter() - start
+    kept = sum(len(x) for x in parts)
+    print(f'分割{args.pages}页\t旧实现 {old * 1000:.1f}ms\tpartition_with_index {new * 1000:.2f}ms\t保留{kept}页')
+
+    # 少数页面特别慢时，对比静态分段与工作窃取
+    rng = random.Random(1)
+    costs = [args.slow if rng.random() < 0.05 else args.fast for _ in range(args.tasks)]
+
+    def work(index):
+        time.sleep(costs[index])
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=lambda part: [work(i) for i, _ in part], args=(part,))
+        for part in lib.partition_with_index(list(range(args.tasks)), args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    static = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lib.work_stealing_map(work, list(range(args.tasks)), args.workers)
+    stealing = time.perf_counter() - start
+    ideal = sum(costs) / args.workers
+    print(f'{args.tasks}个任务\t静态分段 {static:.2f}s\t工作窃取 {stealing:.2f}s\t理想 {ideal:.2f}s')
+
+
+def bench_logging(args):
+    import lib
+
+    def worker():
+        for i in range(args.records):
+            logging.info(f'第{i}页下载完成')
+            logging.debug(f'第{i}页 图片地址')
+
+    for name, async_logging in (('同步', False), ('队列', True)):
+        tmp = tempfile.mkdtemp()
+        log_system = lib.LogSystem(
+            debug_mode=False, log_dir=tmp, console_level=None,
+            async_logging=async_logging, archive_in_background=False,
+        )
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        emit = time.perf_counter() - start
+        log_system.close()
+        total = time.perf_counter() - start
+        count = args.threads * args.records * 2
+        print(f'{name}\t工作线程耗时 {emit:.2f}s ({emit / count * 1e6:.1f}us/条)\t全部写完 {total:.2f}s')
+        shutil.rmtree(tmp, ignore_errors=True)
+    logging.getLogger().handlers.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='漫画下载器性能测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('download', help='对比线程池与asyncio下载')
+    p.add_argument('--pages', type=int, default=200)
+    p.add_argument('--size', type=int, default=200, help='单张图片大小(KB)')
+    p.add_argument('--latency', type=float, default=0.05, help='模拟延迟(s)')
+    p.add_argument('--threads', type=int, default=4)
+    p.add_argument('--concurrency', type=int, default=64)
+    p.add_argument('--failure-rate', type=float, default=0.0, help='服务器随机返回500的比例')
+    p.set_defaults(func=bench_download)
+
+    p = sub.add_parser('throttle', help='服务器限速时对比不限流与自适应限流')
+    p.add_argument('--pages', type=int, default=300)
+    p.add_argument('--size', type=int, default=20, help='单张图片大小(KB)')
+    p.add_argument('--latency', type=float, default=0.02, help='模拟延迟(s)')
+    p.add_argument('--capacity', type=float, default=50, help='服务器允许的速率(请求/s)')
+    p.add_argument('--threads', type=int, default=16)
+    p.add_argument('--rate', type=float, default=20, help='限流器的初始速率(请求/s)')
+    p.set_defaults(func=bench_throttle)
+
+    p = sub.add_parser('startup', help='导入耗时和首个窗口出现的时间')
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--top', type=int, default=10, help='列出import main中累计耗时最多的模块数')
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser('extract', help='对比findString与StringExtractor')
+    p.add_argument('--fixture', nargs='*', help='保存的页面源码，默认使用生成的页面')
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_extract)
+
+    p = sub.add_parser('partition', help='对比分割方式与工作窃取')
+    p.add_argument('--pages', type=int, default=2000)
+    p.add_argument('--workers', type=int, default=8)
+    p.add_argument('--tasks', type=int, default=400)
+    p.add_argument('--fast', type=float, default=0.002, help='普通任务耗时(s)')
+    p.add_argument('--slow', type=float, default=0.1, help='慢任务耗时(s)')
+    p.set_defaults(func=bench_partition)
+
+    p = sub.add_parser('logging', help='对比同步日志与队列日志')
+    p.add_argument('--threads', type=int, default=16)
+    p.add_argument('--records', type=int, default=5000, help='每个线程的INFO/DEBUG记录数')
+    p.set_defaults(func=bench_logging)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
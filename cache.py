@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional, Tuple
+
+
+class SQLiteStore:
+    """
+    SQLite持久化存储的基类
+
+    同一个数据库文件可以被多个子类共用，每个子类在_init_tables中建立自己的表。
+    连接允许跨线程使用，所有读写由同一把锁串行化。
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: 数据库文件路径，':memory:'表示只存在内存中
+        """
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._lock, self._conn:
+            self._init_tables()
+
+    def _init_tables(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query(query: str) -> str:
+    """
+    统一全半角、大小写和空白，作为缓存键
+
+    getData.title_matches用同样的规范化匹配标题，修改时两者要保持一致
+    """
+    query = unicodedata.normalize('NFKC', query)
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+class SearchCache(SQLiteStore):
+    """
+    搜索结果缓存
+
+    以规范化后的搜索词为键保存搜索结果(ComicData的字段字典)，
+    未找到的结果也会缓存，但使用更短的有效期。
+    条目数超过max_entries时按最近访问时间淘汰。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 7 * 24 * 3600,
+        negative_ttl: float = 3600,
+        max_entries: int = 5000,
+    ):
+        """
+        :param path: 数据库文件路径
+        :param ttl: (单位: s) 找到结果的有效期
+        :param negative_ttl: (单位: s) 未找到结果的有效期
+        :param max_entries: 最多保存的条目数
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        super().__init__(path)
+
+    def _init_tables(self) -> None:
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS search_cache ('
+            'query TEXT PRIMARY KEY, result TEXT, expires REAL, last_access REAL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS search_cache_access ON search_cache(last_access)'
+        )
+
+    def get(self, query: str) -> Tuple[bool, Optional[dict]]:
+        """
+        :return: (是否命中, 结果字典)，命中且结果为None表示之前未找到
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT result, expires FROM search_cache WHERE query=?', (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            if row[1] < now:
+                self._conn.execute('DELETE FROM search_cache WHERE query=?', (key,))
+                return False, None
+            self._conn.execute(
+                'UPDATE search_cache SET last_access=? WHERE query=?', (now, key)
+            )
+        return True, (json.loads(row[0]) if row[0] is not None else None)
+
+    def put(self, query: str, result: Optional[dict]) -> None:
+        """保存搜索结果，result为None表示未找到"""
+        key = normalize_query(query)
+        now = time.time()
+        ttl = self.ttl if result is not None else self.negative_ttl
+        data = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?)',
+                (key, data, now + ttl, now),
+            )
+            self._evict(now)
+
+    def invalidate(self, query: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM search_cache WHERE query=?', (normalize_query(query),))
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM search_cache')
+
+    def _evict(self, now: float) -> None:
+        """删除过期条目，并按最近访问时间淘汰超出max_entries的部分，调用前需持有锁"""
+        self._conn.execute('DELETE FROM search_cache WHERE expires<?', (now,))
+        count = self._conn.execute('SELECT COUNT(*) FROM search_cache').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM search_cache WHERE query IN ('
+                'SELECT query FROM search_cache ORDER BY last_access LIMIT ?)',
+                (count - self.max_entries,),
+            )
+            logging.debug(f'搜索缓存淘汰{count - self.max_entries}条')
+
+
+class ChapterCatalog(SQLiteStore):
+    """
+    按comic_id持久化的章节目录
+
+    记录每个章节第一次出现的时间，以及上次同步时漫画的更新时间，
+    用于只返回新增或变化的章节。
+    """
+
+    def _init_tables(self) -> None:
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS chapter_catalog ('
+            'comic_id TEXT, cid TEXT, title TEXT, app INTEGER, position INTEGER, '
+            'first_seen REAL, last_seen REAL, PRIMARY KEY (comic_id, cid))'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS catalog_sync ('
+            'comic_id TEXT PRIMARY KEY, update_time TEXT, synced_at REAL)'
+        )
+
+    def get_sync(self, comic_id: str) -> Optional[Tuple[Optional[str], float]]:
+        """
+        :return: (上次同步时的update_time, 同步时间)，从未同步过返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT update_time, synced_at FROM catalog_sync WHERE comic_id=?', (comic_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def load(self, comic_id: str) -> list[dict]:
+        """按章节顺序返回已记录的章节"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT cid, title, app, first_seen FROM chapter_catalog '
+                'WHERE comic_id=? ORDER BY position', (comic_id,)
+            ).fetchall()
+        return [
+            {'cid': cid, 'title': title, 'app': bool(app), 'first_seen': first_seen}
+            for cid, title, app, first_seen in rows
+        ]
+
+    def merge(self, comic_id: str, chapters: list[dict], update_time: Optional[str] = None) -> list[dict]:
+        """
+        写入完整的章节列表并记录同步
+
+        不在新列表中的章节(已下架或合并)会被删除，避免与新的位置冲突。
+
+        :param chapters: 按顺序排列的章节，每项包含cid、title、app
+        :param update_time: 本次同步时漫画的更新时间
+        :return: 新增或标题/付费状态发生变化的章节(附带first_seen)
+        """
+        now = time.time()
+        changed = []
+        with self._lock, self._conn:
+            known = {
+                cid: (title, bool(app), first_seen)
+                for cid, title, app, first_seen in self._conn.execute(
+                    'SELECT cid, title, app, first_seen FROM chapter_catalog WHERE comic_id=?',
+                    (comic_id,),
+                )
+            }
+            rows = []
+            for position, chapter in enumerate(chapters):
+                old = known.get(chapter['cid'])
+                first_seen = old[2] if old else now
+                if old is None or old[:2] != (chapter['title'], bool(chapter['app'])):
+                    changed.append(dict(chapter, first_seen=first_seen))
+                rows.append((
+                    comic_id, chapter['cid'], chapter['title'], int(bool(chapter['app'])),
+                    position, first_seen, now,
+                ))
+            removed = known.keys() - {chapter['cid'] for chapter in chapters}
+            self._conn.executemany(
+                'DELETE FROM chapter_catalog WHERE comic_id=? AND cid=?',
+                [(comic_id, cid) for cid in removed],
+            )
+            if removed:
+                logging.info(f'{comic_id} 章节目录中移除{len(removed)}个章节')
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO chapter_catalog VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO catalog_sync VALUES (?, ?, ?)',
+                (comic_id, update_time, now),
+            )
+        return changed
+
+
+class ImageManifest(SQLiteStore):
+    """
+    每个章节(comic_id, cid)的图片清单
+
+    保存按页排序的图片URL、下载后得到的每页大小以及解析/更新时间，
+    重试或重新导出章节时不需要再打开浏览器解析。
+    """
+
+    def _init_tables(self) -> None:
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS image_manifest ('
+            'comic_id TEXT, cid TEXT, urls TEXT, sizes TEXT, resolved_at REAL, updated_at REAL, '
+            'PRIMARY KEY (comic_id, cid))'
+        )
+
+    def get(self, comic_id: str, cid: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """
+        :param max_age: (单位: s) 解析时间超过该值视为过期，None表示永不过期
+        :return: 包含urls、sizes、resolved_at、updated_at的字典，不存在或已过期返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT urls, sizes, resolved_at, updated_at FROM image_manifest '
+                'WHERE comic_id=? AND cid=?', (comic_id, cid)
+            ).fetchone()
+        if row is None:
+            return None
+        if max_age is not None and time.time() - row[2] > max_age:
+            return None
+        return {
+            'urls': json.loads(row[0]),
+            'sizes': json.loads(row[1]),
+            'resolved_at': row[2],
+            'updated_at': row[3],
+        }
+
+    def put(self, comic_id: str, cid: str, urls: list[str]) -> None:
+        """保存新解析的图片列表，原有的大小记录被清空"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO image_manifest VALUES (?, ?, ?, ?, ?, ?)',
+                (comic_id, cid, json.dumps(urls), json.dumps([None] * len(urls)), now, now),
+            )
+
+    def record_sizes(self, comic_id: str, cid: str, sizes: dict[int, int]) -> None:
+        """
+        记录下载得到的图片大小
+
+        :param sizes: {页码(从1开始): 字节数}
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT sizes FROM image_manifest WHERE comic_id=? AND cid=?', (comic_id, cid)
+            ).fetchone()
+            if row is None:
+                return
+            stored = json.loads(row[0])
+            for index, size in sizes.items():
+                if 0 < index <= len(stored):
+                    stored[index - 1] = size
+            self._conn.execute(
+                'UPDATE image_manifest SET sizes=?, updated_at=? WHERE comic_id=? AND cid=?',
+                (json.dumps(stored), time.time(), comic_id, cid),
+            )
+
+    def invalidate(self, comic_id: str, cid: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM image_manifest WHERE comic_id=? AND cid=?', (comic_id, cid)
+            )
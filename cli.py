@@ -0,0 +1,335 @@
+"""
+命令行入口，不依赖Tk界面，适合在无图形界面的服务器或定时任务中批量下载
+
+用法:
+    python -m cli download --title 一人之下 --chapters 10-50 --workers 8 --drivers 2
+    python -m cli download --titles-file titles.txt --new --format cbz
+    python -m cli search --title 一人之下
+    python -m cli chapters --title 一人之下
+
+标准输出每行是一个JSON事件(event字段区分类型)，日志输出到标准错误。
+
+退出码:
+    0 全部成功
+    1 有页面、章节或标题处理失败(其余部分已处理)
+    2 参数错误
+    3 有标题未找到，其余全部成功
+    4 运行出错(如浏览器无法启动)
+    130 被中断
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Optional
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+EXIT_ERROR = 4
+EXIT_INTERRUPTED = 130
+
+
+class Reporter:
+    """把进度以JSON行写到标准输出，可被多个下载线程同时调用"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self.totals: dict[str, int] = {}  # 章节cid -> 页数
+        self.done: dict[str, int] = {}
+
+    def emit(self, event: str, **fields) -> None:
+        line = json.dumps(dict(event=event, time=round(time.time(), 3), **fields), ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def page(self, chapter, result) -> None:
+        """ComicDownloader.progress_callbacks的回调"""
+        with self._lock:
+            done = self.done[chapter.cid] = self.done.get(chapter.cid, 0) + 1
+        self.emit(
+            'page',
+            comic=chapter.comic.title,
+            chapter=chapter.title,
+            index=result.index,
+            success=result.success,
+            skipped=result.skipped,
+            size=result.size,
+            error=result.error,
+            done=done,
+            total=self.totals.get(chapter.cid),
+        )
+
+
+def parse_range(spec: Optional[str], count: int) -> list[int]:
+    """
+    解析章节范围(从1开始，包含两端)
+
+    支持 '10-50'、'1,3,5-7'、'10-'(第10章到最后)、'-5'(最后5章)，None或'all'表示全部
+
+    :return: 从0开始的下标列表
+    """
+    if not spec or spec == 'all':
+        return list(range(count))
+    if spec.startswith('-') and spec[1:].isdigit():
+        return list(range(max(0, count - int(spec[1:])), count))
+    selected = []
+    for part in spec.split(','):
+        part = part.strip()
+        start, sep, end = part.partition('-')
+        try:
+            first = int(start)
+            last = (int(end) if end else count) if sep else first
+        except ValueError:
+            raise ValueError(f'无效的章节范围: {part}')
+        if first < 1 or last < first:
+            raise ValueError(f'无效的章节范围: {part}')
+        selected += [i for i in range(first - 1, min(last, count)) if i not in selected]
+    return selected
+
+
+def read_titles(args) -> list[str]:
+    """命令行和标题文件中的标题，文件中每行一个，忽略空行和#开头的行"""
+    titles = list(args.title or [])
+    if args.titles_file:
+        with open(args.titles_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    titles.append(line)
+    return titles
+
+
+def build_downloader(args):
+    import getData
+
+    return getData.ComicDownloader(
+        max_webdrivers=args.drivers,
+        min_webdrivers=min(1, args.drivers),
+        max_download_threads=args.workers,
+        timeout=args.timeout,
+        download_path=args.output,
+        download_backend='async' if getattr(args, 'backend', None) == 'async' else 'thread',
+        init_webdrivers=False,
+        # --no-cache只是不读取缓存的搜索结果和图片清单，章节目录照常记录，--new依赖它
+        cache_path=args.cache,
+        image_manifest_max_age=0 if args.no_cache else None,
+        max_retries=args.retries,
+        output_format=getattr(args, 'format', 'dir'),
+    )
+
+
+def find_comic(downloader, reporter: Reporter, title: str, use_cache: bool):
+    comic = downloader.search_comic(title, use_cache=use_cache)
+    reporter.emit(
+        'search',
+        query=title,
+        found=comic is not None,
+        title=comic.title if comic else None,
+        comic_id=comic.comic_id if comic else None,
+    )
+    return comic
+
+
+def select_chapters(downloader, reporter: Reporter, comic, args) -> list:
+    """按--new、--chapters和--include-app挑选要下载的章节"""
+    if args.new:
+        chapters = downloader.refresh_chapters(comic)
+        selected = chapters
+    else:
+        chapters = downloader.get_chapters(comic)
+        selected = [chapters[i] for i in parse_range(args.chapters, len(chapters))]
+    if not args.include_app:
+        selected = [x for x in selected if not x.app]
+    reporter.emit('chapters', comic=comic.title, total=len(chapters), selected=len(selected))
+    return selected
+
+
+def download_title(downloader, reporter: Reporter, comic, chapters: list, backend: str) -> dict:
+    """
+    下载一部漫画的选定章节
+
+    :return: {'pages_ok': 成功页数, 'pages_failed': 失败页数, 'chapters_failed': 失败章节数}
+    """
+    stats = {'pages_ok': 0, 'pages_failed': 0, 'chapters_failed': 0}
+
+    def report_chapter(chapter, results):
+        chapter_failed = sum(1 for x in results if not x.success)
+        stats['pages_ok'] += len(results) - chapter_failed
+        stats['pages_failed'] += chapter_failed
+        # 没有解析到图片也算失败
+        if chapter_failed or not results:
+            stats['chapters_failed'] += 1
+        reporter.emit(
+            'chapter',
+            comic=comic.title,
+            chapter=chapter.title,
+            cid=chapter.cid,
+            pages=len(results),
+            failed=chapter_failed,
+            skipped=sum(1 for x in results if x.skipped),
+            success=bool(results) and chapter_failed == 0,
+        )
+
+    if backend == 'pipeline':
+        results = downloader.download_chapters_pipelined(chapters)
+        for chapter in chapters:
+            report_chapter(chapter, results.get(chapter.cid, []))
+        return stats
+
+    for chapter in chapters:
+        try:
+            urls = downloader.get_comic_urls(chapter)
+        except Exception as e:
+            logging.error(chapter.title + ' 解析图片失败:\t' + str(e))
+            urls = []
+        reporter.totals[chapter.cid] = len(urls)
+        reporter.emit('chapter_start', comic=comic.title, chapter=chapter.title, cid=chapter.cid, pages=len(urls))
+        report_chapter(chapter, downloader.download_chapter(chapter, urls=urls) if urls else [])
+    return stats
+
+
+def cmd_download(args, downloader, reporter: Reporter) -> int:
+    start = time.monotonic()
+    downloader.progress_callbacks.append(reporter.page)
+    not_found = []
+    failed_titles = []
+    totals = {'pages_ok': 0, 'pages_failed': 0, 'chapters_failed': 0}
+    for title in args.titles:
+        # 单个标题出错不影响其余标题
+        try:
+            # 缓存的搜索结果中update_time可能已过期，--new需要最新的搜索结果才能发现新章节
+            comic = find_comic(downloader, reporter, title, not (args.no_cache or args.new))
+            if comic is None:
+                not_found.append(title)
+                continue
+            chapters = select_chapters(downloader, reporter, comic, args)
+            stats = download_title(downloader, reporter, comic, chapters, args.backend)
+        except Exception as e:
+            logging.exception(title + ' 处理失败')
+            reporter.emit('error', query=title, error=str(e) or type(e).__name__)
+            failed_titles.append(title)
+            continue
+        for key, value in stats.items():
+            totals[key] += value
+
+    if failed_titles or totals['pages_failed'] or totals['chapters_failed']:
+        status = EXIT_PARTIAL
+    elif not_found:
+        status = EXIT_NOT_FOUND
+    else:
+        status = EXIT_OK
+    reporter.emit(
+        'done',
+        status=status,
+        titles=len(args.titles),
+        not_found=not_found,
+        failed_titles=failed_titles,
+        **totals,
+        elapsed=round(time.monotonic() - start, 3),
+    )
+    return status
+
+
+def cmd_search(args, downloader, reporter: Reporter) -> int:
+    found = [find_comic(downloader, reporter, title, not args.no_cache) for title in args.titles]
+    return EXIT_OK if all(found) else EXIT_NOT_FOUND
+
+
+def cmd_chapters(args, downloader, reporter: Reporter) -> int:
+    status = EXIT_OK
+    for title in args.titles:
+        comic = find_comic(downloader, reporter, title, not args.no_cache)
+        if comic is None:
+            status = EXIT_NOT_FOUND
+            continue
+        for i, chapter in enumerate(downloader.get_chapters(comic)):
+            reporter.emit('chapter_info', comic=comic.title, number=i + 1, chapter=chapter.title, cid=chapter.cid, app=chapter.app)
+    return status
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m cli', description='腾讯动漫下载器命令行')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--title', action='append', help='漫画标题，可重复')
+    common.add_argument('--titles-file', help='标题文件，每行一个')
+    common.add_argument('--drivers', type=int, default=1, help='浏览器数量')
+    common.add_argument('--workers', type=int, default=4, help='图片下载线程数')
+    common.add_argument('--timeout', type=int, default=60, help='(单位: s) 浏览器和请求超时')
+    common.add_argument('--retries', type=int, default=3, help='临时性错误的重试次数')
+    common.add_argument('--output', default='./download', help='下载根目录')
+    common.add_argument('--cache', default='./cache/comic.db', help='缓存数据库路径')
+    common.add_argument('--no-cache', action='store_true', help='不使用缓存的搜索结果和图片清单(章节目录仍会记录)')
+    common.add_argument(
+        '--log-level',
+        type=str.upper,
+        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'),
+        default='WARNING',
+        help='标准错误的日志级别',
+    )
+    common.add_argument('--log-dir', default='log', help='日志文件目录')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('download', parents=[common], help='搜索并下载章节')
+    p.add_argument('--chapters', help="章节范围，如 '10-50'、'1,3,5-7'、'-5'(最后5章)，默认全部")
+    p.add_argument('--new', action='store_true', help='只下载上次同步后新增或变化的章节')
+    p.add_argument('--include-app', action='store_true', help='包含仅限APP阅读的章节')
+    p.add_argument('--format', choices=('dir', 'cbz'), default='dir', help='输出格式')
+    p.add_argument('--backend', choices=('thread', 'async', 'pipeline'), default='thread', help='下载方式')
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser('search', parents=[common], help='只搜索，输出找到的漫画')
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser('chapters', parents=[common], help='列出章节及编号')
+    p.set_defaults(func=cmd_chapters)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        args.titles = read_titles(args)
+    except OSError as e:
+        parser.error(f'无法读取标题文件: {e}')
+    if not args.titles:
+        parser.error('需要 --title 或 --titles-file')
+    if getattr(args, 'chapters', None):
+        try:
+            parse_range(args.chapters, 1)
+        except ValueError as e:
+            parser.error(str(e))
+
+    import lib
+
+    lib.LogSystem(
+        debug_mode=False,
+        log_dir=args.log_dir,
+        console_level=logging.getLevelName(args.log_level),
+        file_level=logging.DEBUG,
+    )
+    reporter = Reporter()
+    downloader = None
+    try:
+        downloader = build_downloader(args)
+        return args.func(args, downloader, reporter)
+    except KeyboardInterrupt:
+        reporter.emit('error', error='interrupted')
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        logging.exception('运行出错')
+        reporter.emit('error', error=str(e) or type(e).__name__)
+        return EXIT_ERROR
+    finally:
+        if downloader is not None:
+            downloader.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
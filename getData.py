@@ -1,17 +1,27 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import queue
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 import requests
 from selenium import webdriver
 from selenium.webdriver.edge.service import Service
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
 import random
 import time
 import json
 import lib
+import cache
+import storage
+import ratelimit
+import retry
+import hashlib
 import os,io
 import logging
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+import threading
+import collections
+import functools
+from typing import Callable, List, Dict, Optional, Tuple
+from dataclasses import dataclass, asdict
+from contextlib import contextmanager
 
 
 @dataclass
@@ -35,6 +45,422 @@ class ChapterInfo:
     cid: str  # 章节cid
     app: bool = False  # 是否为VIP章节
     page_count: Optional[int] = None  # 页数
+    first_seen: Optional[float] = None  # 章节目录中首次出现的时间戳
+
+@dataclass
+class PageResult:
+    """单页下载结果数据类"""
+
+    index: int  # 页码(从1开始)，0表示整个章节失败(如解析图片失败)
+    url: str  # 图片URL
+    path: str  # 保存路径
+    success: bool = False  # 是否下载成功
+    size: int = 0  # 写入字节数
+    error: Optional[str] = None  # 错误信息
+    skipped: bool = False  # 已完整下载过，本次跳过
+
+
+# ---页面文本提取---
+IMAGE_EXTRACTOR = lib.StringExtractor({
+    'images': ('data-src="https://manhua.acimg.cn/manhua_detail/0/', '.jpg/800', 10, -3),
+})
+
+BING_EXTRACTOR = lib.StringExtractor({
+    'id': ('href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 43, -5),
+    'href': ('href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 6, -5),
+})
+
+
+# ---页面就绪条件---
+def _has_elements(by: str, value: str, count: int = 1) -> Callable[[webdriver.Edge], bool]:
+    """页面中至少存在count个匹配元素"""
+    return lambda driver: len(driver.find_elements(by, value)) >= count
+
+
+def _search_result_loaded(driver: webdriver.Edge) -> bool:
+    """搜索结果全部加载完成或无结果，未完成时下滑触发加载"""
+    if driver.find_elements(By.CLASS_NAME, "mlm-status-loading"):
+        return True
+    if driver.find_elements(By.CSS_SELECTOR, '[class*="text-not-found"]'):
+        return True
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    return False
+
+
+READY_CONDITIONS: Dict[str, Callable[[webdriver.Edge], bool]] = {
+    'search': _search_result_loaded,
+    'bing': _has_elements(By.CSS_SELECTOR, '#b_results'),
+    'comic_info': _has_elements(By.TAG_NAME, 'h2'),
+    'chapters': _has_elements(By.CLASS_NAME, 'chapter-link'),
+    'chapter_images': _has_elements(By.CSS_SELECTOR, 'img[data-src^="https://manhua.acimg.cn/manhua_detail/"]'),
+}
+
+
+def title_matches(query: str, title: str) -> bool:
+    """
+    搜索词是否出现在标题中
+
+    与搜索缓存的键使用相同的规范化(全半角、大小写、空白)，
+    保证规范化后相同的搜索词得到相同的匹配结果，缓存不会改变结果。
+    """
+    return cache.normalize_query(query) in cache.normalize_query(title)
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    判断网络/浏览器错误是否为临时性的，值得重试
+
+    连接失败、超时、下载不完整、408/425/429/5xx以及浏览器加载失败会重试;
+    其他HTTP错误(如404)、熔断和等待浏览器超时不重试。
+    """
+    if isinstance(error, retry.CircuitOpenError):
+        return False
+    if isinstance(error, requests.HTTPError):
+        status = retry.http_status(error)
+        return status is None or status in (408, 425, 429) or status >= 500
+    return isinstance(error, (requests.RequestException, retry.IncompleteDownload, WebDriverException))
+
+
+def _tracked(task: str):
+    """方法执行期间计入ComicDownloader的活动任务(见ComicDownloader._running)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self._running(task):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _PooledDriver:
+    """浏览器池中的单个浏览器及其使用记录"""
+
+    def __init__(self, driver: webdriver.Edge):
+        self.driver = driver
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.page_loads = 0
+        self.holder: Optional[str] = None  # 当前持有者
+        self.leased_at: Optional[float] = None  # 借出时间
+        self.overdue_warned = False
+
+
+class WebDriverPool:
+    """
+    可伸缩的浏览器池
+
+    - 按需创建浏览器，最多max_size个，后台保持至少min_size个
+    - 空闲超过idle_timeout秒的浏览器会被关闭
+    - 加载页面达到max_page_loads次的浏览器归还时被回收，限制内存增长
+    - 取出空闲浏览器前先做存活检测，崩溃或卡死的会话会被替换
+    - 记录每次借出的持有者和时长，超过max_lease_time的借出会被警告或回收
+
+    推荐通过lease()借用，保证任何退出路径都会归还:
+        with pool.lease('get_chapters') as driver:
+            driver.get(url)
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], webdriver.Edge],
+        max_size: int = 2,
+        min_size: int = 0,
+        idle_timeout: float = 300,
+        max_page_loads: int = 50,
+        probe_timeout: float = 10,
+        max_lease_time: Optional[float] = None,
+        reclaim_overdue: bool = False,
+    ):
+        """
+        Args:
+            factory: 创建浏览器的函数
+            max_size (int): 浏览器最大数量
+            min_size (int): 预热并保持的最少浏览器数量
+            idle_timeout (float): (单位: s) 空闲浏览器的回收时限
+            max_page_loads (int): 单个浏览器加载页面的最大次数
+            probe_timeout (float): (单位: s) 存活检测的超时时限
+            max_lease_time (float): (单位: s) 单次借出的时限，None表示不检查
+            reclaim_overdue (bool): 超时的借出是否强制回收，否则只警告
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.idle_timeout = idle_timeout
+        self.max_page_loads = max_page_loads
+        self.probe_timeout = probe_timeout
+        self.max_lease_time = max_lease_time
+        self.reclaim_overdue = reclaim_overdue
+
+        self._cond = threading.Condition()
+        self._idle: list[_PooledDriver] = []  # 后进先出，优先使用刚归还的浏览器
+        self._entries: Dict[int, _PooledDriver] = {}  # 所有存活的浏览器
+        self._creating = 0
+        self._closed = False
+
+        # 占用统计
+        self._waiting = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._reclaimed = 0
+        self._replaced = 0
+        self._probe_executor = ThreadPoolExecutor(
+            max_workers=max(1, max_size), thread_name_prefix='DriverProbe'
+        )
+
+        self._maintain_thread = threading.Thread(
+            target=self._maintain, name='DriverPool', daemon=True
+        )
+        self._maintain_thread.start()
+
+    @property
+    def size(self) -> int:
+        with self._cond:
+            return len(self._entries) + self._creating
+
+    def warm(self) -> None:
+        """并行创建浏览器直到满足min_size"""
+        with self._cond:
+            missing = max(0, self.min_size - len(self._entries) - self._creating)
+            self._creating += missing
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            futures = [executor.submit(self._create) for _ in range(missing)]
+            for future in as_completed(futures):
+                try:
+                    self._add_idle(future.result())
+                except Exception as e:
+                    logging.error('浏览器启动失败:\t' + str(e))
+
+    @contextmanager
+    def lease(self, holder: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        借用一个浏览器，离开with块时无论是否出错都会归还
+
+        :param holder: 持有者名称，用于排查泄漏，默认为线程名
+        :param timeout: (单位: s) 最长等待时间，None表示一直等待
+        """
+        driver = self.acquire(timeout, holder)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def acquire(self, timeout: Optional[float] = None, holder: Optional[str] = None) -> webdriver.Edge:
+        """
+        取出一个可用的浏览器，使用完毕必须调用release归还
+
+        :param timeout: (单位: s) 最长等待时间，None表示一直等待
+        :param holder: 持有者名称，用于排查泄漏，默认为线程名
+        :raises TimeoutError: 超时仍没有可用的浏览器
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError('浏览器池已关闭')
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if len(self._entries) + self._creating < self.max_size:
+                        self._creating += 1
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._timeouts += 1
+                        raise TimeoutError(
+                            f'{timeout}s内没有可用的浏览器 当前借出: {self._describe_leases()}'
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if entry is None:
+                entry = self._create()
+            elif not self._is_alive(entry):
+                logging.warning('浏览器已失去响应 重新创建')
+                self._replaced += 1
+                self._discard(entry)
+                continue
+
+            with self._cond:
+                entry.holder = holder or threading.current_thread().name
+                entry.leased_at = time.monotonic()
+                entry.overdue_warned = False
+                self._acquired += 1
+            return entry.driver
+
+    def release(self, driver: webdriver.Edge, broken: bool = False) -> None:
+        """
+        归还浏览器
+
+        :param broken: 浏览器已损坏，直接关闭
+        """
+        with self._cond:
+            entry = self._entries.get(id(driver))
+            if entry is None:
+                return
+            entry.last_used = time.monotonic()
+            entry.holder = None
+            entry.leased_at = None
+            if not (broken or self._closed or entry.page_loads >= self.max_page_loads):
+                self._idle.append(entry)
+                self._cond.notify_all()
+                return
+            if entry.page_loads >= self.max_page_loads:
+                logging.info(f'浏览器已加载{entry.page_loads}个页面 回收')
+        self._discard(entry)
+
+    def record_page_load(self, driver: webdriver.Edge) -> None:
+        """记录一次页面加载，用于达到次数后回收"""
+        with self._cond:
+            entry = self._entries.get(id(driver))
+            if entry is not None:
+                entry.page_loads += 1
+
+    def stats(self) -> dict:
+        """
+        获取浏览器池占用情况
+
+        :return: 包含数量、借出情况和累计计数的字典
+        """
+        with self._cond:
+            now = time.monotonic()
+            leases = [
+                {'holder': x.holder, 'age': now - x.leased_at, 'page_loads': x.page_loads}
+                for x in self._entries.values() if x.leased_at is not None
+            ]
+            return {
+                'max_size': self.max_size,
+                'size': len(self._entries) + self._creating,
+                'idle': len(self._idle),
+                'in_use': len(leases),
+                'creating': self._creating,
+                'waiting': self._waiting,
+                'acquired': self._acquired,
+                'timeouts': self._timeouts,
+                'reclaimed': self._reclaimed,
+                'replaced': self._replaced,
+                'leases': leases,
+            }
+
+    def _describe_leases(self) -> str:
+        now = time.monotonic()
+        return ', '.join(
+            f'{x.holder}({now - x.leased_at:.1f}s)'
+            for x in self._entries.values() if x.leased_at is not None
+        ) or '无'
+
+    def close(self) -> None:
+        """关闭浏览器池，空闲浏览器立即关闭，使用中的在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for entry in idle:
+                del self._entries[id(entry.driver)]
+            self._cond.notify_all()
+        for entry in idle:
+            self._quit(entry)
+        self._probe_executor.shutdown(wait=False)
+
+    def _create(self) -> _PooledDriver:
+        """创建浏览器，调用前需已占用_creating名额"""
+        try:
+            entry = _PooledDriver(self.factory())
+        except Exception:
+            with self._cond:
+                self._creating -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._creating -= 1
+            self._entries[id(entry.driver)] = entry
+        logging.info('新建浏览器 当前数量:\t' + str(self.size))
+        return entry
+
+    def _add_idle(self, entry: _PooledDriver) -> None:
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify_all()
+
+    def _is_alive(self, entry: _PooledDriver) -> bool:
+        future = self._probe_executor.submit(entry.driver.execute_script, 'return 1')
+        try:
+            return future.result(timeout=self.probe_timeout) == 1
+        except Exception:
+            return False
+
+    def _discard(self, entry: _PooledDriver) -> None:
+        with self._cond:
+            self._entries.pop(id(entry.driver), None)
+            self._cond.notify_all()
+        # 卡死的浏览器quit可能阻塞，放到后台线程
+        threading.Thread(target=self._quit, args=(entry,), daemon=True).start()
+
+    def _check_leases(self, now: float) -> list[_PooledDriver]:
+        """警告超时的借出，需要时从池中移除并返回它们，调用前需持有锁"""
+        if not self.max_lease_time:
+            return []
+        overdue = []
+        for entry in list(self._entries.values()):
+            if entry.leased_at is None or now - entry.leased_at <= self.max_lease_time:
+                continue
+            if self.reclaim_overdue:
+                logging.error(f'浏览器被 {entry.holder} 占用{now - entry.leased_at:.1f}s 强制回收')
+                del self._entries[id(entry.driver)]
+                self._reclaimed += 1
+                overdue.append(entry)
+            elif not entry.overdue_warned:
+                logging.warning(f'浏览器被 {entry.holder} 占用{now - entry.leased_at:.1f}s 可能未归还')
+                entry.overdue_warned = True
+        if overdue:
+            self._cond.notify_all()
+        return overdue
+
+    @staticmethod
+    def _quit(entry: _PooledDriver) -> None:
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            logging.debug('关闭浏览器出错:\t' + str(e))
+
+    def _maintain(self) -> None:
+        """后台线程：回收空闲浏览器并补足min_size"""
+        interval = min(30, self.idle_timeout / 2)
+        if self.max_lease_time:
+            interval = min(interval, self.max_lease_time / 2)
+        interval = max(1, interval)
+        while True:
+            with self._cond:
+                self._cond.wait(interval)
+                if self._closed:
+                    return
+                now = time.monotonic()
+                surplus = len(self._entries) + self._creating - self.min_size
+                expired = [
+                    x for x in self._idle if now - x.last_used > self.idle_timeout
+                ][:max(0, surplus)]
+                for entry in expired:
+                    self._idle.remove(entry)
+                    del self._entries[id(entry.driver)]
+                overdue = self._check_leases(now)
+                missing = max(0, self.min_size - len(self._entries) - self._creating)
+                self._creating += missing
+
+            for entry in overdue:
+                self._quit(entry)
+            for entry in expired:
+                logging.info('关闭空闲浏览器')
+                self._quit(entry)
+            for _ in range(missing):
+                try:
+                    self._add_idle(self._create())
+                except Exception as e:
+                    logging.error('浏览器启动失败:\t' + str(e))
 
 
 # ---主类---
@@ -45,10 +471,35 @@ class ComicDownloader:
         self,
         debug: bool = False,
         max_webdrivers: int = 2,
+        min_webdrivers: int = 1,
         max_download_threads: int = 4,
         timeout: int = 60,
         headless: bool = True,
-        download_path=str
+        download_path: str = './download',
+        download_backend: str = 'thread',
+        max_async_downloads: int = 64,
+        init_webdrivers: bool = True,
+        webdriver_idle_timeout: int = 300,
+        webdriver_max_page_loads: int = 50,
+        webdriver_acquire_timeout: Optional[int] = None,
+        webdriver_max_lease_time: Optional[int] = None,
+        reclaim_overdue_webdrivers: bool = False,
+        ready_poll_interval: float = 0.05,
+        cache_path: Optional[str] = './cache/comic.db',
+        search_cache_ttl: int = 7 * 24 * 3600,
+        search_cache_negative_ttl: int = 3600,
+        image_manifest_max_age: Optional[int] = None,
+        verify_downloads: bool = False,
+        content_store: bool = False,
+        output_format: str = 'dir',
+        rate_limit: Optional[float] = 20.0,
+        max_rate_limit: float = 500.0,
+        max_retries: int = 3,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 30.0,
+        retry_budget_ratio: float = 0.5,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0
     ):
         """
         初始化下载器
@@ -56,56 +507,299 @@ class ComicDownloader:
         Args:
             debug (bool): 是否开启调试模式
             maxWebdrivers (int): 浏览器最大数量
+            min_webdrivers (int): 预热并保持的最少浏览器数量
             maxDownloadThreads (int): 图片下载最大线程数量
             timeout (int): (单位: s) 浏览器超时时限
+            download_path (str): 下载根目录
+            download_backend (str): 图片下载方式 'thread'(线程池) 或 'async'(asyncio)
+            max_async_downloads (int): 异步下载时同时进行的最大请求数
+            init_webdrivers (bool): 是否预热浏览器，关闭后浏览器在首次使用时才启动
+            webdriver_idle_timeout (int): (单位: s) 空闲浏览器的回收时限
+            webdriver_max_page_loads (int): 浏览器加载多少个页面后回收重建
+            webdriver_acquire_timeout (int): (单位: s) 等待可用浏览器的时限，默认与timeout相同
+            webdriver_max_lease_time (int): (单位: s) 单次借用浏览器的时限，默认为timeout的5倍
+            reclaim_overdue_webdrivers (bool): 超过借用时限的浏览器是否强制回收，否则只警告
+            ready_poll_interval (float): (单位: s) 检查页面是否就绪的间隔
+            cache_path (str): 缓存数据库路径，None表示不使用缓存
+            search_cache_ttl (int): (单位: s) 搜索结果缓存有效期
+            search_cache_negative_ttl (int): (单位: s) 未找到结果的缓存有效期
+            image_manifest_max_age (int): (单位: s) 章节图片清单的有效期，None表示永不过期
+            verify_downloads (bool): 跳过已下载页面前是否校验sha256，否则只比较大小
+            content_store (bool): 是否使用按内容寻址的图片仓库(download_path/.objects)对图片去重
+            output_format (str): 'dir' 每页一个文件; 'cbz' 每章边下载边写入一个cbz压缩包
+            rate_limit (float): (单位: 请求/s) 每个主机的初始请求速率，之后按延迟和429/5xx自动调整，None表示不限流
+            max_rate_limit (float): (单位: 请求/s) 自动调整的速率上限
+            max_retries (int): 临时性错误的最多重试次数
+            retry_base_delay (float): (单位: s) 第一次重试的最长等待，之后每次翻倍并加随机抖动
+            retry_max_delay (float): (单位: s) 单次重试等待的上限
+            retry_budget_ratio (float): 每章所有页面合计最多重试 页数*该值 次(至少10次)
+            breaker_failure_threshold (int): 同一主机连续失败多少次后熔断
+            breaker_reset_timeout (float): (单位: s) 熔断后多久再试探该主机
         """
         logging.info('主类已启动')
         self.debug = debug
         self.max_webdrivers = max_webdrivers
+        self.min_webdrivers = min_webdrivers
+        self.webdriver_idle_timeout = webdriver_idle_timeout
+        self.webdriver_max_page_loads = webdriver_max_page_loads
+        self.webdriver_acquire_timeout = timeout if webdriver_acquire_timeout is None else webdriver_acquire_timeout
+        self.webdriver_max_lease_time = timeout * 5 if webdriver_max_lease_time is None else webdriver_max_lease_time
+        self.reclaim_overdue_webdrivers = reclaim_overdue_webdrivers
+        self.ready_poll_interval = ready_poll_interval
+
+        self.cache_path = cache_path
+        self.search_cache = cache.SearchCache(
+            cache_path,
+            ttl=search_cache_ttl,
+            negative_ttl=search_cache_negative_ttl,
+        ) if cache_path else None
+        self.chapter_catalog = cache.ChapterCatalog(cache_path) if cache_path else None
+        self.image_manifest = cache.ImageManifest(cache_path) if cache_path else None
+        self.image_manifest_max_age = image_manifest_max_age
+
+        # 每类页面最近的就绪耗时, 超时记为None
+        self.page_ready_times: Dict[str, collections.deque] = collections.defaultdict(
+            lambda: collections.deque(maxlen=200)
+        )
         self.max_download_threads = max_download_threads
         self.timeout = timeout
         self.current_drivers=0
         self.headless = headless
         self.download_path=download_path
+        self.download_backend=download_backend
+        self.output_format=output_format
+        self.max_async_downloads=max_async_downloads
+
+        # 图片下载复用同一个连接池
+        self.session = requests.Session()
+        # 连接池不小于下载线程数，否则多出的连接用完即被丢弃
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, max_download_threads))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.verify_downloads = verify_downloads
+        self._page_manifests: Dict[str, storage.PageManifest] = {}
+        self._page_manifests_lock = threading.Lock()
+        self.content_store = storage.ContentStore(os.path.join(download_path, '.objects')) if content_store else None
+        # 按主机自适应限流，同时约束下载和页面请求
+        self.rate_limiter = ratelimit.RateLimiter(
+            rate=rate_limit,
+            max_rate=max(max_rate_limit, rate_limit),
+            concurrency=max_download_threads,
+            max_concurrency=max(max_download_threads, max_async_downloads),
+        ) if rate_limit else None
+        # 临时性错误按指数退避重试，主机持续失败时熔断
+        self.retry_policy = retry.RetryPolicy(
+            is_transient,
+            max_attempts=max_retries + 1,
+            base_delay=retry_base_delay,
+            max_delay=retry_max_delay,
+        )
+        self.retry_budget_ratio = retry_budget_ratio
+        self.breakers = retry.CircuitBreakers(
+            failure_threshold=breaker_failure_threshold,
+            reset_timeout=breaker_reset_timeout,
+        )
         
         self.initialized=False
 
-        self._init_webdrivers()
-        logging.info('浏览器已启动')
+        self._init_webdrivers(warm=init_webdrivers)
+        if init_webdrivers:
+            logging.info('浏览器已启动')
 
-        # 状态跟踪
-        self.is_running = False
-        self.current_task = None
+        # 状态跟踪，is_running/current_task变化时通知state_callbacks
+        # 任务可以嵌套(如流水线中的get_comic_urls)或并发，按活动任务数判断是否空闲
+        self.idle = threading.Event()  # 没有任务在运行时置位，可用于等待
+        self.idle.set()
+        self.state_callbacks: List[Callable[[Optional[object], bool], None]] = []
+        self._state_lock = threading.Lock()
+        self._active_tasks: List[str] = []
+        self._current_task = None
         self.progress_callbacks = []
 
         # 基础URL配置
         self.mobile_url = "https://m.ac.qq.com"
         self.pc_url = "https://ac.qq.com"
+        self.mobile_user_agent = (
+            "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 "
+            "(KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1"
+        )
+
+    @property
+    def is_running(self) -> bool:
+        """是否有任务在运行"""
+        return bool(self._active_tasks)
 
-    # 建立浏览器队列
-    def _init_webdrivers(self) -> None:
+    @contextmanager
+    def _running(self, task: str):
         """
-        初始化浏览器队列
+        任务运行期间计数，全部任务结束后才置位idle
+
+        嵌套或并发的任务各自计数，内层任务结束不会让外层任务看起来已经空闲，
+        异常退出时同样会减少计数。
         """
-        self.web_drivers_queue = queue.Queue()
-    
-        # 创建一个Edge浏览器实例
-        def create_driver():
-            return webdriver.Edge(options=self._get_random_driver_options())
-        
-        # 使用线程池执行器并行创建浏览器实例
-        with ThreadPoolExecutor() as executor:
-            # 提交任务到线程池，创建多个浏览器实例
-            futures = [executor.submit(create_driver) for _ in range(self.max_webdrivers)]
-            # 等待所有浏览器实例创建完成，并将它们放入队列中
-            for future in as_completed(futures):
-                self._put_webdriver(future.result())
+        with self._state_lock:
+            self._active_tasks.append(task)
+            self._current_task = task
+            self.idle.clear()
+        self._notify_state()
+        try:
+            yield
+        finally:
+            with self._state_lock:
+                self._active_tasks.remove(task)
+                # 任务中途把current_task换成了结果(如search_comic)时保留结果
+                if self._current_task == task:
+                    self._current_task = self._active_tasks[-1] if self._active_tasks else None
+                if not self._active_tasks:
+                    self.idle.set()
+            self._notify_state()
+
+    @property
+    def current_task(self):
+        """当前任务名称，search_comic完成后为找到的ComicData"""
+        return self._current_task
+
+    @current_task.setter
+    def current_task(self, value):
+        if value is not self._current_task:
+            self._current_task = value
+            self._notify_state()
+
+    def _notify_state(self):
+        """在修改状态的线程中调用state_callbacks(current_task, is_running)"""
+        for callback in self.state_callbacks:
+            try:
+                callback(self._current_task, self.is_running)
+            except Exception as e:
+                logging.error('状态回调出错:\t'+str(e))
+
+    # 建立浏览器池
+    def _init_webdrivers(self, warm: bool = True) -> None:
+        """
+        初始化浏览器池
+
+        Args:
+            warm (bool): 是否立即启动min_webdrivers个浏览器
+        """
+        self.web_drivers = WebDriverPool(
+            factory=lambda: webdriver.Edge(options=self._get_random_driver_options()),
+            max_size=self.max_webdrivers,
+            min_size=self.min_webdrivers if warm else 0,
+            idle_timeout=self.webdriver_idle_timeout,
+            max_page_loads=self.webdriver_max_page_loads,
+            max_lease_time=self.webdriver_max_lease_time,
+            reclaim_overdue=self.reclaim_overdue_webdrivers,
+        )
+        if warm:
+            self.web_drivers.warm()
         self.initialized = True
-    def _get_webdriver(self) -> webdriver.Edge:
-        return self.web_drivers_queue.get()
 
-    def _put_webdriver(self,webdriver_:webdriver.Edge):
-        self.web_drivers_queue.put(webdriver_)
+    def warm_webdrivers(self) -> None:
+        """启动min_webdrivers个浏览器并保持，用于init_webdrivers=False时在需要前预热"""
+        self.web_drivers.min_size = min(self.min_webdrivers, self.max_webdrivers)
+        self.web_drivers.warm()
+
+    def _lease_webdriver(self, holder: str):
+        """借用浏览器的上下文管理器，离开with块时自动归还"""
+        return self.web_drivers.lease(holder, self.webdriver_acquire_timeout)
+
+    def webdriver_stats(self) -> dict:
+        """浏览器池占用情况，见WebDriverPool.stats"""
+        return self.web_drivers.stats()
+
+    def _get_webdriver(self, timeout: Optional[float] = None) -> webdriver.Edge:
+        """取出浏览器，必须配对调用_put_webdriver，优先使用_lease_webdriver"""
+        return self.web_drivers.acquire(self.webdriver_acquire_timeout if timeout is None else timeout)
+
+    def _put_webdriver(self,webdriver_:webdriver.Edge,broken:bool=False):
+        self.web_drivers.release(webdriver_,broken)
+
+    def _load_page(self,driver:webdriver.Edge,url:str):
+        """用浏览器加载页面并计入该浏览器的加载次数"""
+        self.web_drivers.record_page_load(driver)
+        driver.set_page_load_timeout(self.timeout)
+        with self._rate_slot(url):
+            driver.get(url)
+
+    def _rate_slot(self,url:str):
+        """url所在主机的限流名额，用with包住整个请求"""
+        return self.rate_limiter.slot(url) if self.rate_limiter else ratelimit.UNLIMITED
+
+    def rate_limit_stats(self) -> Dict[str, dict]:
+        """各主机当前的速率、并发数以及成功/受限/出错次数"""
+        return self.rate_limiter.stats() if self.rate_limiter else {}
+
+    def _retry(self,describe:str,url:str,func:Callable,*args,budget:Optional[retry.RetryBudget]=None):
+        """按重试策略执行func(*args)，url所在主机的熔断器同时生效"""
+        return self.retry_policy.call(func,*args,budget=budget,breaker=self.breakers.get(url),describe=describe)
+
+    def _new_retry_budget(self,pages:int) -> retry.RetryBudget:
+        """一个章节共用的重试预算"""
+        return retry.RetryBudget(max(10,int(pages*self.retry_budget_ratio)))
+
+    def breaker_stats(self) -> Dict[str, dict]:
+        """各主机熔断器的状态和连续失败次数"""
+        return self.breakers.stats()
+
+    def _get_page_source(self,url:str,page:str,holder:str) -> str:
+        """借用浏览器加载页面，等待READY_CONDITIONS[page]后返回源码"""
+        with self._lease_webdriver(holder) as driver:
+            self._load_page(driver,url)
+            self._wait_until_ready(driver,page)
+            return driver.page_source
+
+    def _wait_until_ready(self,driver:webdriver.Edge,page:str,timeout:Optional[float]=None) -> bool:
+        """
+        等待页面满足READY_CONDITIONS中对应的条件
+
+        参数:
+        page -- READY_CONDITIONS的键
+        timeout -- (单位: s) 最长等待时间，默认为timeout
+
+        返回:
+        是否在时限内就绪，超时后页面可能不完整
+        """
+        start=time.monotonic()
+        try:
+            WebDriverWait(
+                driver,
+                self.timeout if timeout is None else timeout,
+                poll_frequency=self.ready_poll_interval
+            ).until(READY_CONDITIONS[page])
+        except TimeoutException:
+            self.page_ready_times[page].append(None)
+            logging.warning(page+' 页面在'+str(self.timeout if timeout is None else timeout)+'s内未就绪')
+            return False
+        cost=time.monotonic()-start
+        self.page_ready_times[page].append(cost)
+        if self.debug:
+            logging.debug(page+f' 页面就绪耗时{cost:.3f}s')
+        return True
+
+    def page_ready_stats(self) -> Dict[str, dict]:
+        """各类页面的就绪耗时统计"""
+        output={}
+        for page,times in list(self.page_ready_times.items()):
+            times=list(times)
+            done=[x for x in times if x is not None]
+            output[page]={
+                'count':len(times),
+                'timeouts':len(times)-len(done),
+                'avg':sum(done)/len(done) if done else None,
+                'max':max(done) if done else None,
+            }
+        return output
+
+    def close(self):
+        """关闭所有浏览器"""
+        self.web_drivers.close()
+        self.session.close()
+        if self.search_cache:
+            self.search_cache.close()
+            self.chapter_catalog.close()
+            self.image_manifest.close()
+        if self.content_store:
+            self.content_store.close()
 
     # 初始化浏览器设置
     def _get_random_driver_options(self) -> webdriver.EdgeOptions:
@@ -191,35 +885,12 @@ class ComicDownloader:
         一个包含ComicData对象的列表，每个对象包含有关搜索结果的详细信息
         """
     
-        # 获取webdriver实例
-        driver = self._get_webdriver()
-        driver: webdriver.Edge
-    
-        # 设置页面加载超时时间
-        driver.set_page_load_timeout(self.timeout)
-    
-        # 构造搜索URL并请求页面
-        driver.get(self.mobile_url + r"/search/result?word=" + title)
-    
-        # 等待页面加载完成，动态加载更多内容
-        while 1:
-            if self.debug:
-                logging.info("下滑")
-            try:
-                tmp=driver.find_element(By.CLASS_NAME, "mlm-status-loading")
-                break
-            except:
-                pass
-            if 'text-not-found' in driver.page_source:
-                break
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(0.02)
-    
-        # 根据类名爬取目录
-        text = driver.page_source
-    
+        # 构造搜索URL，借用浏览器加载页面，未完成时下滑动态加载更多内容，失败时重试
+        url = self.mobile_url + r"/search/result?word=" + title
+        text = self._retry('腾讯搜索', url, self._get_page_source, url, 'search', 'search_comic_by_tencent')
+
         # 使用文本处理更快
-        html = lib.HTMLParser(text)
+        html = lib.HTMLParser(text, indexed=True)
     
         # 获取信息的列表
         comic_title = html.find_elements_by_class_name("comic-title")
@@ -253,8 +924,6 @@ class ComicDownloader:
             )
             search_index.append(tmp)
         
-        # 归还webdriver实例
-        self._put_webdriver(driver)
         return search_index
     #  通过bing搜索
     def search_comic_by_bing(self, title) -> list[ComicData]:
@@ -269,64 +938,69 @@ class ComicDownloader:
         返回:
         - list[ComicData]: 包含漫画数据的列表，每个元素都是一个 ComicData 对象。
         '''
-        # 初始化 WebDriver
-        driver = self._get_webdriver()
-        
-        # 构造并请求搜索 URL
-        driver.get('https://cn.bing.com/search?q=' + title + '%20%E8%85%BE%E8%AE%AF%E6%BC%AB%E7%94%BB')
-        logging.info('搜索: ' + 'https://cn.bing.com/search?q=' + title + '%20%E8%85%BE%E8%AE%AF%E6%BC%AB%E7%94%BB')
-        
-        # 等待页面加载完成
-        time.sleep(1)
+        # 借用 WebDriver，任何退出路径都会归还
+        with self._lease_webdriver('search_comic_by_bing') as driver:
+            # 构造并请求搜索 URL，失败时重试，重试用尽后抛出异常
+            search_url = 'https://cn.bing.com/search?q=' + title + '%20%E8%85%BE%E8%AE%AF%E6%BC%AB%E7%94%BB'
+            self._retry('bing搜索', search_url, self._load_page, driver, search_url)
+            logging.info('搜索: ' + search_url)
+    
+            # 等待页面加载完成
+            self._wait_until_ready(driver, 'bing')
+    
+            # 获取页面源代码
+            source = driver.page_source
+    
+            # 解析页面源代码以查找漫画链接，只扫描一次
+            found = BING_EXTRACTOR.extract(source)
+
+            for url, href in zip(found['id'], found['href']):
+                # 获取链接
+                url = url[:url.find('?')]
+
+                # 获取标题，单个结果加载失败时跳过
+                try:
+                    self._retry('bing结果', href, self._load_page, driver, href)
+                except Exception as e:
+                    logging.warning('加载bing结果失败:\t' + str(e))
+                    continue
+                if not self._wait_until_ready(driver, 'comic_info'):
+                    continue
+                comic_title = lib.clean_text(driver.find_element(By.TAG_NAME, 'h2').get_attribute('innerText'))
         
-        # 获取页面源代码
-        source = driver.page_source
+                # 判断标题
+                if not title_matches(title, comic_title):
+                    continue
         
-        # 解析页面源代码以查找漫画链接
-        lists = lib.findString(source, 'href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 43, -5)
+                tmp = int(url)
         
-        for i in range(len(lists)):
-            # 获取链接
-            try:
-                url = lib.findString(source, 'href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 43, -5)[i]
-                href = lib.findString(source, 'href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 6, -5)[i]
-                url = url[:url.find('?')]
-            except IndexError as e:
-                logging.info('未找到:\t' + str(e))
-                self._put_webdriver(driver)
-                return None
-            except Exception as e:
-                logging.info('未知错误:\t' + str(e))
-                self._put_webdriver(driver)
-                return None
-            
-            # 获取标题
-            comic_title = driver.get(href)
-            time.sleep(0.5)
-            comic_title = lib.clean_text(driver.find_element(By.TAG_NAME, 'h2').get_attribute('innerText'))
-            
-            # 判断标题
-            if title not in comic_title:
-                continue
-            
-            tmp = int(url)
-            
-            self._put_webdriver(driver)
-            return ComicData(title=comic_title, comic_id=url)
+                return ComicData(title=comic_title, comic_id=url)
+
+        logging.info('bing结果中没有匹配的标题')
+        return None
     #  搜索
-    def search_comic(self, title) -> Optional[ComicData]:
+    @_tracked('search_comic')
+    def search_comic(self, title, use_cache: bool = True) -> Optional[ComicData]:
         """
         搜索判断逻辑
+
+        参数:
+        title -- 漫画标题
+        use_cache -- 是否使用搜索缓存，False时强制重新搜索并更新缓存
         """
         logging.info('搜索:\t'+str(title))
-        self.current_task='search_comic'
-        self.is_running = True
+        if use_cache and self.search_cache:
+            hit, data = self.search_cache.get(title)
+            if hit:
+                logging.info('搜索缓存命中:\t'+str(title))
+                return ComicData(**data) if data else None
+
         result = self.search_comic_by_tencent(title)
         
         #查找结果
         comic=None
         for i in result:
-            if title in i.title:
+            if title_matches(title, i.title):
                 comic=i
                 logging.info('在\t腾讯动漫\t找到了')
                 break
@@ -335,21 +1009,26 @@ class ComicDownloader:
         if not comic:
             logging.info('在\t腾讯动漫\t未找到')
 
-            comic=self.search_comic_by_bing(title)
+            try:
+                comic=self.search_comic_by_bing(title)
+            except Exception as e:
+                # 搜索失败不代表没有这部漫画，不写入缓存
+                logging.error('bing搜索失败:\t'+str(e))
+                return None
             if comic:
                 logging.info('在\tbing\t找到了')
             else:
                 logging.info('在\tbing\t未找到')
 
         
+        if self.search_cache:
+            self.search_cache.put(title, asdict(comic) if comic else None)
+
         if not comic:
             logging.info('未找到')
-            self.is_running  = False
-            self.current_task=None
             return None
         else:
             logging.info('找到了:\t'+comic.title+'\n\t'+comic.comic_id+'\n\t'+self._get_comic_link(comic.comic_id))
-            self.is_running=False
             self.current_task=comic
             return comic
     # 获取链接
@@ -358,18 +1037,14 @@ class ComicDownloader:
     def _get_mobile_comic_link(self, comic_id):
         return self.mobile_url + r"/comic/index/id/" + comic_id
     
+    @_tracked('get_chapters')
     def get_chapters(self,comic:ComicData) -> list[ChapterInfo]:
-        self.is_running=True
-        self.current_task='get_chapters'
-        driver=self._get_webdriver()
-        driver.get(self._get_mobile_comic_link(comic.comic_id))
         logging.info('尝试获取章节列表')
+        url=self._get_mobile_comic_link(comic.comic_id)
+        source=self._retry('获取章节列表',url,self._get_page_source,url,'chapters','get_chapters')
 
-        
-        time.sleep(1)
-        source=driver.page_source
-        index_frame=lib.HTMLParser(source).find_element_by_class_name('chapter-wrap-list')
-        pr=lib.HTMLParser(source)
+        pr=lib.HTMLParser(source,indexed=True)
+        index_frame=pr.find_element_by_class_name('chapter-wrap-list')
 
         chapter_title_list=index_frame.get_attribute('innerText').split('\n')
         try:
@@ -408,13 +1083,64 @@ class ComicDownloader:
                 ))
         logging.info('整理完毕')
         
-        self._put_webdriver(driver)
-
-        self.is_running=False
-        self.current_task=None
-        
         return chapter_list
     
+    def refresh_chapters(self,comic:ComicData,force:bool=False) -> list[ChapterInfo]:
+        """
+        增量刷新章节目录
+
+        comic.update_time与上次同步时相同则直接返回空列表，不打开浏览器。
+        注意缓存的搜索结果中update_time可能已过期，追更时应使用search_comic(title, use_cache=False)的结果。
+
+        参数:
+        comic -- 要刷新的漫画
+        force -- 忽略update_time，强制重新获取章节列表
+
+        返回:
+        新增或发生变化的章节
+        """
+        if not self.chapter_catalog:
+            return self.get_chapters(comic)
+
+        if not force and comic.update_time:
+            sync=self.chapter_catalog.get_sync(comic.comic_id)
+            if sync and sync[0]==comic.update_time:
+                logging.info(comic.title+' 未更新 跳过')
+                return []
+
+        chapters=self.get_chapters(comic)
+        changed=self.chapter_catalog.merge(
+            comic.comic_id,
+            [{'cid':x.cid,'title':x.title,'app':x.app} for x in chapters],
+            comic.update_time
+        )
+        logging.info(comic.title+' 新增或变化章节'+str(len(changed))+'个')
+        return [ChapterInfo(comic=comic,**x) for x in changed]
+
+    def refresh_watch_list(self,comics:list[ComicData],force:bool=False) -> dict[str,list[ChapterInfo]]:
+        """
+        并行刷新多部漫画的章节目录，并发数与浏览器数量相同
+
+        返回:
+        以comic_id为键，新增或变化章节为值的字典
+        """
+        output={}
+        with ThreadPoolExecutor(max_workers=self.max_webdrivers,thread_name_prefix='Refresh') as executor:
+            futures={executor.submit(self.refresh_chapters,comic,force):comic for comic in comics}
+            for future in as_completed(futures):
+                comic=futures[future]
+                try:
+                    output[comic.comic_id]=future.result()
+                except Exception as e:
+                    logging.error(comic.title+' 刷新章节失败:\t'+str(e))
+        return output
+
+    def get_catalog(self,comic:ComicData) -> list[ChapterInfo]:
+        """读取已保存的章节目录，不访问网络"""
+        if not self.chapter_catalog:
+            return []
+        return [ChapterInfo(comic=comic,**x) for x in self.chapter_catalog.load(comic.comic_id)]
+
     def _from_cid_to_mobile(self,chapter:ChapterInfo):
         output=self.mobile_url+'/chapter/index/id/'+chapter.comic.comic_id+'/cid/'+chapter.cid
         return output
@@ -422,37 +1148,452 @@ class ComicDownloader:
 
 
 
-    def get_comic_urls(self,chapter:ChapterInfo) -> list[str]:
-        
-        self.current_task='get_comic_urls'
-        self.is_running=True
+    @_tracked('get_comic_urls')
+    def get_comic_urls(self,chapter:ChapterInfo,use_cache:bool=True,max_age:Optional[float]=None) -> list[str]:
+        """
+        获取章节的图片URL列表，优先使用图片清单缓存
+
+        参数:
+        chapter -- 章节
+        use_cache -- 是否使用图片清单，False时重新解析并更新清单
+        max_age -- (单位: s) 清单的最长有效期，默认为image_manifest_max_age
+        """
+        if use_cache and self.image_manifest:
+            manifest=self.image_manifest.get(
+                chapter.comic.comic_id,
+                chapter.cid,
+                self.image_manifest_max_age if max_age is None else max_age
+            )
+            if manifest and manifest['urls']:
+                logging.info(chapter.title+' 使用图片清单 共'+str(len(manifest['urls']))+'张')
+                chapter.page_count=len(manifest['urls'])
+                return manifest['urls']
         
         #pool = ThreadPoolExecutor(max_workers=self.max_download_threads, thread_name_prefix='Thread')
         tmp=self._get_jpg_files(chapter)
         #with open('./debug/test.json','w+',encoding='utf-8') as f:
         #    f.write(json.dumps(tmp,ensure_ascii=False,indent=4))
-        
-        self.current_task=None
-        self.is_running=False
+        chapter.page_count=len(tmp)
+        if tmp and self.image_manifest:
+            self.image_manifest.put(chapter.comic.comic_id,chapter.cid,tmp)
         return tmp
 
     
+    def _parse_jpg_files(self,source:str) -> list[str]:
+        return IMAGE_EXTRACTOR.extract(source)['images']
+
+    def _get_jpg_files_by_http(self,chapter:ChapterInfo) -> list[str]:
+        """不启动浏览器，直接请求移动端章节页面解析图片列表"""
+        url=self._from_cid_to_mobile(chapter)
+        try:
+            with self._rate_slot(url) as slot:
+                response=self.session.get(
+                    url,
+                    headers={'User-Agent':self.mobile_user_agent},
+                    timeout=self.timeout
+                )
+                slot.record(response.status_code,response.headers)
+            response.raise_for_status()
+            response.encoding=response.encoding or 'utf-8'
+        except Exception as e:
+            logging.info('直接请求章节页面失败:\t'+str(e))
+            return []
+        return self._parse_jpg_files(response.text)
+
+    def _get_jpg_files_by_webdriver(self,chapter:ChapterInfo) -> list[str]:
+        url=self._from_cid_to_mobile(chapter)
+        source=self._retry(chapter.title+' 获取图片列表',url,self._get_page_source,url,'chapter_images','_get_jpg_files')
+        return self._parse_jpg_files(source)
+
     def _get_jpg_files(self,chapter:ChapterInfo) ->list[str]:
         
-        driver=self._get_webdriver()
+        imgList=self._get_jpg_files_by_http(chapter)
+        if not imgList:
+            logging.info(chapter.title+' 直接请求未获取到图片 改用浏览器')
+            imgList=self._get_jpg_files_by_webdriver(chapter)
+
+        logging.info(chapter.comic.title+'\t'+chapter.title+' 获取了'+str(len(imgList))+'张图片')
 
-        driver.get(self._from_cid_to_mobile(chapter))
+        return imgList
 
-        time.sleep(3)
+    def _get_chapter_dir(self,chapter:ChapterInfo) -> str:
+        return os.path.join(self.download_path,chapter.comic.title,chapter.title)
 
-        source=driver.page_source
+    def _get_page_manifest(self,directory:str) -> storage.PageManifest:
+        with self._page_manifests_lock:
+            manifest=self._page_manifests.get(directory)
+            if manifest is None:
+                manifest=storage.PageManifest(directory)
+                self._page_manifests[directory]=manifest
+            return manifest
 
-        imgList=lib.findString(source,'data-src="https://manhua.acimg.cn/manhua_detail/0/','.jpg/800',10,-3)
+    def _release_page_manifest(self,chapter:ChapterInfo):
+        """章节结束后释放页面清单，避免下载大量章节时一直占用内存"""
+        with self._page_manifests_lock:
+            self._page_manifests.pop(self._get_chapter_dir(chapter),None)
 
-        logging.info(chapter.comic.title+'\t'+chapter.title+' 获取了'+str(len(imgList))+'张图片')
+    def download(self,chapter:ChapterInfo,file_name:str,url:str) -> int:
+        """
+        下载单张图片
 
-        return imgList
+        先写入同名的.part临时文件，完整后再改名为.jpg并记入章节的页面清单。
+        已存在.part文件时用Range请求续传。
+        启用图片仓库时，文件收入仓库后在章节目录中生成硬链接。
+
+        返回:
+        图片的字节数
+        """
+        directory=self._get_chapter_dir(chapter)
+        path=os.path.join(directory,str(file_name)+'.jpg')
+        part=path+'.part'
+
+        # 图片仓库中已有该URL时直接链接，不访问网络
+        if self.content_store:
+            known=self.content_store.lookup(url)
+            if known:
+                self.content_store.materialize(known[0],path)
+                self._get_page_manifest(directory).record(str(file_name),url,known[1],known[0])
+                return known[1]
+
+        progress=self._stream_to_part(url,part)
+        if progress is None:
+            # 临时文件与服务器不一致，重新下载
+            progress=self._stream_to_part(url,part)
+        size,total,sha256=progress
+        if total is not None and size!=total:
+            raise retry.IncompleteDownload('下载不完整 '+str(size)+'/'+str(total)+' 已保留临时文件以便续传')
+
+        if self.content_store:
+            self.content_store.add(part,sha256,url)
+            self.content_store.materialize(sha256,path)
+        else:
+            os.replace(part,path)
+        self._get_page_manifest(directory).record(str(file_name),url,size,sha256)
+        return size
+
+    def _stream_to_part(self,url:str,part:str) -> Optional[Tuple[int,Optional[int],str]]:
+        """
+        把图片流式写入临时文件，已有临时文件时用Range请求续传
+
+        返回:
+        (文件总字节数, 预期总大小, sha256)，续传位置无效时删除临时文件并返回None
+        """
+        offset=os.path.getsize(part) if os.path.exists(part) else 0
+        headers={'Range':'bytes='+str(offset)+'-'} if offset else {}
+
+        with self._rate_slot(url) as slot, self.session.get(url,headers=headers,stream=True,timeout=self.timeout) as response:
+            slot.record(response.status_code,response.headers)
+            if offset and response.status_code==416:
+                os.remove(part)
+                return None
+            response.raise_for_status()
+
+            hasher=hashlib.sha256()
+            if offset and response.status_code==206:
+                with open(part,'rb') as f:
+                    for chunk in iter(lambda:f.read(1024*1024),b''):
+                        hasher.update(chunk)
+                mode='ab'
+            else:
+                offset=0
+                mode='wb'
+
+            # 预期的总大小
+            total=None
+            if 'Content-Range' in response.headers:
+                total=response.headers['Content-Range'].rpartition('/')[2]
+            elif 'Content-Length' in response.headers:
+                total=int(response.headers['Content-Length'])+offset
+            total=int(total) if total and str(total).isdigit() else None
+            if response.headers.get('Content-Encoding','identity')!='identity':
+                total=None  # 压缩传输时Content-Length不是文件大小
+
+            size=offset
+            with open(part,mode) as f:
+                for chunk in response.iter_content(64*1024):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    size+=len(chunk)
+
+        return size,total,hasher.hexdigest()
+
+    def _get_archive_path(self,chapter:ChapterInfo) -> str:
+        return os.path.join(self.download_path,chapter.comic.title,chapter.title+'.cbz')
+
+    def _fetch_page_bytes(self,url:str) -> bytes:
+        """把单张图片读入内存，用于直接写入压缩包"""
+        if self.content_store:
+            known=self.content_store.lookup(url)
+            if known:
+                return self.content_store.read(known[0])
+
+        with self._rate_slot(url) as slot:
+            response=self.session.get(url,timeout=self.timeout)
+            slot.record(response.status_code,response.headers)
+            response.raise_for_status()
+            data=response.content
+        expected=response.headers.get('Content-Length')
+        if expected and response.headers.get('Content-Encoding','identity')=='identity' and len(data)!=int(expected):
+            raise retry.IncompleteDownload('下载不完整 '+str(len(data))+'/'+expected)
+
+        if self.content_store:
+            self.content_store.add_bytes(data,hashlib.sha256(data).hexdigest(),url)
+        return data
+
+    def _write_page(self,chapter:ChapterInfo,file_name:str,url:str,data:bytes) -> str:
+        """
+        把内存中的图片写入章节目录并记入页面清单
+
+        返回:
+        文件路径
+        """
+        directory=self._get_chapter_dir(chapter)
+        path=os.path.join(directory,file_name+'.jpg')
+        sha256=hashlib.sha256(data).hexdigest()
+        if self.content_store:
+            self.content_store.add_bytes(data,sha256,url)
+            self.content_store.materialize(sha256,path)
+        else:
+            with open(path+'.part','wb') as f:
+                f.write(data)
+            os.replace(path+'.part',path)
+        self._get_page_manifest(directory).record(file_name,url,len(data),sha256)
+        return path
+
+    def _download_page(self,chapter:ChapterInfo,index:int,url:str,archive:Optional[storage.CBZWriter]=None,budget:Optional[retry.RetryBudget]=None) -> PageResult:
+        """下载单页，临时性错误只重试这一页，重试次数计入章节的budget"""
+        file_name=f'{index:03d}'
+        directory=self._get_chapter_dir(chapter)
+        result=PageResult(
+            index=index,
+            url=url,
+            path=archive.path if archive else os.path.join(directory,file_name+'.jpg')
+        )
+        try:
+            describe=chapter.title+' 第'+str(index)+'页'
+            if archive:
+                data=self._retry(describe,url,self._fetch_page_bytes,url,budget=budget)
+                archive.add_page(index,data)
+                result.size=len(data)
+            else:
+                manifest=self._get_page_manifest(directory)
+                if manifest.is_complete(file_name,url,result.path,self.verify_downloads):
+                    result.size=manifest.get(file_name)['size']
+                    result.skipped=True
+                else:
+                    result.size=self._retry(describe,url,self.download,chapter,file_name,url,budget=budget)
+            result.success=True
+        except Exception as e:
+            result.error=str(e)
+            logging.warning(chapter.title+'\t第'+str(index)+'页下载失败:\t'+str(e))
+            if archive:
+                archive.skip_page(index)
+
+        self._notify_progress(chapter,result)
+        return result
+
+    def _notify_progress(self,chapter:ChapterInfo,result:PageResult):
+        for callback in self.progress_callbacks:
+            try:
+                callback(chapter,result)
+            except Exception as e:
+                logging.error('进度回调出错:\t'+str(e))
+
+    def _download_chapter_async(self,chapter:ChapterInfo,urls:Optional[list[str]]=None) -> list[PageResult]:
+        import asyncDownload
+
+        if urls is None:
+            urls=self.get_comic_urls(chapter)
+
+        archive=None
+        manifest=None
+        if self.output_format=='cbz':
+            skipped=self._skip_archived(chapter,urls)
+            if skipped is not None:
+                return skipped
+            directory=os.path.dirname(self._get_archive_path(chapter))
+            if urls:
+                archive=self._open_archive(chapter)
+        else:
+            directory=self._get_chapter_dir(chapter)
+            os.makedirs(directory,exist_ok=True)
+            manifest=self._get_page_manifest(directory)
+
+        downloader=asyncDownload.AsyncDownloader(
+            max_concurrency=self.max_async_downloads,
+            timeout=self.timeout,
+            callback=lambda result:self._notify_progress(chapter,result),
+            manifest=manifest,
+            verify=self.verify_downloads,
+            store=self.content_store,
+            archive=archive,
+            limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            breakers=self.breakers,
+            budget=self._new_retry_budget(len(urls))
+        )
+        results=downloader.run(asyncDownload.build_pages(directory,urls,archive))
+        self._close_archive(chapter,archive,results)
+        self._finish_chapter(chapter,results)
+        return results
+
+    def _skip_archived(self,chapter:ChapterInfo,urls:list[str]) -> Optional[list[PageResult]]:
+        """章节压缩包已存在时返回全部跳过的结果"""
+        path=self._get_archive_path(chapter)
+        if not os.path.exists(path):
+            return None
+        if urls and storage.archive_is_empty(path):
+            # 旧版本在没有图片时会生成空压缩包，删除后重新下载
+            logging.warning(chapter.title+' 压缩包为空 重新下载')
+            os.remove(path)
+            return None
+        logging.info(chapter.title+' 压缩包已存在 跳过')
+        sizes=storage.archive_page_sizes(path)
+        return [PageResult(index=i+1,url=url,path=path,size=sizes.get(i+1,0),success=True,skipped=True) for i,url in enumerate(urls)]
+
+    def _open_archive(self,chapter:ChapterInfo) -> storage.CBZWriter:
+        path=self._get_archive_path(chapter)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        return storage.CBZWriter(path)
+
+    def _close_archive(self,chapter:ChapterInfo,archive:Optional[storage.CBZWriter],results:list[PageResult]):
+        """全部页面成功才生成压缩包，否则删除未完成的文件"""
+        if archive is None:
+            return
+        if not results:
+            # 没有任何页面时不生成空压缩包，否则之后会被当作已完成而跳过
+            archive.abort()
+            logging.warning(chapter.title+' 没有图片 未生成压缩包')
+        elif all(x.success for x in results):
+            archive.close()
+        else:
+            archive.abort()
+            logging.warning(chapter.title+' 有页面下载失败 未生成压缩包')
+
+    def _submit_chapter(self,executor:ThreadPoolExecutor,chapter:ChapterInfo,urls:Optional[list[str]]=None) -> tuple[list,Optional[storage.CBZWriter]]:
+        """
+        解析章节图片并把每一页提交到下载线程池
+
+        返回:
+        (futures, 章节压缩包)，不打包时压缩包为None
+        """
+        if urls is None:
+            urls=self.get_comic_urls(chapter)
+
+        archive=None
+        if self.output_format=='cbz':
+            skipped=self._skip_archived(chapter,urls)
+            if skipped is not None:
+                futures=[]
+                for result in skipped:
+                    future=Future()
+                    future.set_result(result)
+                    futures.append(future)
+                return futures,None
+            if urls:
+                archive=self._open_archive(chapter)
+        else:
+            os.makedirs(self._get_chapter_dir(chapter),exist_ok=True)
+        try:
+            budget=self._new_retry_budget(len(urls))
+            return [executor.submit(self._download_page,chapter,i+1,url,archive,budget) for i,url in enumerate(urls)],archive
+        except BaseException:
+            if archive:
+                archive.abort()
+            raise
+
+    def _failed_chapter(self,chapter:ChapterInfo,error:BaseException) -> list[PageResult]:
+        """整个章节失败时的结果: 只有一条页码为0的失败记录"""
+        message=str(error) or type(error).__name__
+        logging.error(chapter.title+' 下载失败:\t'+message)
+        self._release_page_manifest(chapter)
+        return [PageResult(index=0,url='',path=self._get_chapter_dir(chapter),error=message)]
+
+    def _collect_results(self,chapter:ChapterInfo,submitted:tuple[list,Optional[storage.CBZWriter]]) -> list[PageResult]:
+        futures,archive=submitted
+        results=[future.result() for future in as_completed(futures)]
+        results.sort(key=lambda x:x.index)
+        self._close_archive(chapter,archive,results)
+        self._finish_chapter(chapter,results)
+        return results
+
+    def _finish_chapter(self,chapter:ChapterInfo,results:list[PageResult]):
+        """记录章节下载结果"""
+        self._release_page_manifest(chapter)
+        failed=sum(1 for x in results if not x.success)
+        logging.info(chapter.comic.title+'\t'+chapter.title+' 下载完成 成功'+str(len(results)-failed)+'张 失败'+str(failed)+'张')
+        if self.image_manifest:
+            self.image_manifest.record_sizes(
+                chapter.comic.comic_id,
+                chapter.cid,
+                {x.index:x.size for x in results if x.success and x.size}  # 大小未知(0)时保留原有记录
+            )
+
+    @_tracked('download_chapter')
+    def download_chapter(self,chapter:ChapterInfo,urls:Optional[list[str]]=None,backend:Optional[str]=None) -> list[PageResult]:
+        """
+        并行下载一个章节的全部图片
+
+        参数:
+        chapter -- 要下载的章节
+        urls -- 图片URL列表，默认通过get_comic_urls获取
+        backend -- 'thread' 或 'async'，默认使用download_backend
+
+        返回:
+        按页码排序的PageResult列表
+        """
+        if (backend or self.download_backend)=='async':
+            return self._download_chapter_async(chapter,urls)
+
+        with ThreadPoolExecutor(max_workers=self.max_download_threads,thread_name_prefix='Download') as executor:
+            submitted=self._submit_chapter(executor,chapter,urls)
+            return self._collect_results(chapter,submitted)
+
+    @_tracked('download_chapters')
+    def download_chapters(self,chapters:list[ChapterInfo],backend:Optional[str]=None) -> dict[str,list[PageResult]]:
+        """
+        下载多个章节，所有章节共用一个下载线程池
+
+        返回:
+        以章节cid为键，PageResult列表为值的字典
+        """
+        output={}
+        if (backend or self.download_backend)=='async':
+            for chapter in chapters:
+                try:
+                    output[chapter.cid]=self.download_chapter(chapter,backend='async')
+                except Exception as e:
+                    output[chapter.cid]=self._failed_chapter(chapter,e)
+            return output
+
+        with ThreadPoolExecutor(max_workers=self.max_download_threads,thread_name_prefix='Download') as executor:
+            # 下一章节的图片解析与上一章节的下载同时进行，单个章节出错不影响其余章节
+            submitted=[]
+            for chapter in chapters:
+                try:
+                    submitted.append((chapter,self._submit_chapter(executor,chapter),None))
+                except Exception as e:
+                    submitted.append((chapter,None,e))
+            for chapter,pages,error in submitted:
+                if error is None:
+                    try:
+                        output[chapter.cid]=self._collect_results(chapter,pages)
+                        continue
+                    except Exception as e:
+                        error=e
+                        if pages[1]:
+                            pages[1].abort()
+                output[chapter.cid]=self._failed_chapter(chapter,error)
+        return output
+
+    def download_chapters_pipelined(self,chapters:list[ChapterInfo],**kwargs) -> dict[str,list[PageResult]]:
+        """
+        用解析->下载->写入流水线下载多个章节，参数见pipeline.DownloadPipeline
+
+        返回:
+        以章节cid为键，PageResult列表为值的字典
+        """
+        import pipeline
 
-    def download(self,chapter:ChapterInfo,file_name:str,url:str):
-        with open(self.download_path+'/'+chapter.comic.title+'/'+chapter.title+'/'+str(file_name)+'.jpg','wb+') as f:
-            f.write(requests.get(url).content)
\ No newline at end of file
+        self.pipeline=pipeline.DownloadPipeline(self,**kwargs)
+        return self.pipeline.run(chapters)
@@ -2,13 +2,100 @@ import time
 import logging
 import os
 import zipfile
+import threading
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Callable
 import glob
 import re
+import collections
+import atexit
+import queue
+import logging.handlers
 def dateToTimestamp(date_str):
     return int(time.mktime(time.strptime(date_str, "%Y-%m-%d")))
 
+class _LogFormatter(logging.Formatter):
+    """时间格式为 %Y-%m-%d %H:%M:%S.毫秒，同一秒内的记录复用已格式化的部分"""
+
+    def __init__(self, fmt: str, datefmt: str):
+        super().__init__(fmt, datefmt)
+        self._cache = (None, '')  # (秒, 格式化结果)，整体替换，多个处理器同时使用也安全
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, text = self._cache
+        if second != cached_second:
+            text = time.strftime(datefmt or self.datefmt, time.localtime(second))
+            self._cache = (second, text)
+        return f"{text}.{int(record.msecs):03d}"
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    只把记录放入队列，完整的格式化交给监听线程
+
+    标准QueueHandler.prepare会在调用线程中格式化整条记录，
+    这里只合并消息参数(参数对象之后可能被修改)和异常堆栈。
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class DebugSampler(logging.Filter):
+    """
+    限制DEBUG记录的数量，避免每张图片的调试信息刷满日志
+
+    - rate: 每个调用位置(文件+行号)每秒最多保留的记录数，None表示不限
+    - sample: 每个调用位置每sample条保留1条，1表示全部保留
+    INFO及以上的记录不受影响。被丢弃的数量记录在dropped中。
+    """
+
+    def __init__(self, rate: Optional[float] = None, sample: int = 1):
+        super().__init__()
+        if sample < 1:
+            raise ValueError("sample must be >= 1")
+        self.rate = rate
+        self.sample = sample
+        self.dropped = 0
+        self._sites: dict[tuple, list] = {}  # 调用位置 -> [令牌数, 上次补充时间, 计数]
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        # 同一条记录可能经过多个处理器，只判定一次
+        keep = getattr(record, '_debug_keep', None)
+        if keep is not None:
+            return keep
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [self.rate or 0.0, record.created, 0]
+            site[2] += 1
+            keep = (site[2] - 1) % self.sample == 0
+            if keep and self.rate is not None:
+                site[0] = min(self.rate, site[0] + (record.created - site[1]) * self.rate)
+                site[1] = record.created
+                if site[0] >= 1:
+                    site[0] -= 1
+                else:
+                    keep = False
+            if not keep:
+                self.dropped += 1
+        record._debug_keep = keep
+        return keep
+
+
 # log_system.py
 class LogSystem:
     """
@@ -27,7 +114,8 @@ class LogSystem:
         log_dir='log',
         console_level=logging.INFO,
         file_level=logging.DEBUG,
-        keep_days=7  # 新增参数：保留最近7天的日志
+        keep_days=7,  # 新增参数：保留最近7天的日志
+        max_archive_mb=100  # 归档总大小上限
     )
     """
 
@@ -37,7 +125,12 @@ class LogSystem:
         log_dir: str = 'log',
         console_level: int = logging.INFO,
         file_level: int = logging.DEBUG,
-        keep_days: int = 7
+        keep_days: Optional[int] = 7,
+        max_archive_mb: Optional[float] = None,
+        archive_in_background: bool = True,
+        async_logging: bool = True,
+        debug_rate: Optional[float] = None,
+        debug_sample: int = 1
     ):
         """
         初始化日志系统
@@ -46,20 +139,46 @@ class LogSystem:
         :param log_dir: 日志存放目录
         :param console_level: 控制台日志级别
         :param file_level: 文件日志级别
-        :param keep_days: 保留最近几天的日志（默认7天）
+        :param keep_days: 保留最近几天的日志（默认7天），None表示不清理
+        :param max_archive_mb: 归档总大小上限(MB)，超出时删除最旧的归档，None表示不限
+        :param archive_in_background: 是否在后台线程中归档旧日志，避免拖慢启动
+        :param async_logging: 是否在独立线程中写文件和控制台，调用logging的线程只把记录放入队列
+        :param debug_rate: 每个调用位置每秒最多记录的DEBUG条数，None表示不限
+        :param debug_sample: 每个调用位置每N条DEBUG记录只保留1条
         """
         self.DEBUG = debug_mode
         self.LOG_DIR = log_dir
         self.LOG_CONSOLE_LEVEL = console_level
         self.LOG_FILE_LEVEL = file_level
         self.KEEP_DAYS = keep_days
+        self.MAX_ARCHIVE_MB = max_archive_mb
+        self.ASYNC = async_logging
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.debug_sampler = (
+            DebugSampler(debug_rate, debug_sample)
+            if debug_rate is not None or debug_sample > 1 else None
+        )
         
-        # 初始化时自动清理和归档旧日志
-        self._archive_old_logs()
         self._setup_logging()
 
+        # 初始化时自动清理和归档旧日志，只处理今天之前的文件，不影响新的日志文件
+        if archive_in_background:
+            self.archive_thread = threading.Thread(
+                target=self._archive_old_logs, name='LogArchive', daemon=True
+            )
+            self.archive_thread.start()
+        else:
+            self.archive_thread = None
+            self._archive_old_logs()
+
     def _archive_old_logs(self):
-        """归档所有今天之前的日志文件（增强版）"""
+        """
+        归档所有今天之前的日志文件
+
+        每个日志文件追加到对应日期的归档(archives/logs_日期.zip)后删除，已有的归档不会重写，
+        因此耗时只与尚未归档的文件有关。中途退出时，已在归档中的文件下次直接删除。
+        超过保留天数的日志不再归档，直接删除。
+        """
         try:
             if not os.path.exists(self.LOG_DIR):
                 if self.DEBUG:
@@ -70,84 +189,118 @@ class LogSystem:
             if self.DEBUG:
                 logging.debug(f"开始归档日志，今天日期: {today}")
 
-            # 获取所有.log文件
-            all_logs = glob.glob(os.path.join(self.LOG_DIR, '*.log'))
-            if self.DEBUG:
-                logging.debug(f"找到{len(all_logs)}个日志文件")
-
             # 筛选今天之前的日志
             old_logs = [
-                f for f in all_logs 
+                f for f in glob.glob(os.path.join(self.LOG_DIR, '*.log'))
                 if not os.path.basename(f).startswith(today)
             ]
-            
-            if not old_logs:
+
+            archive_dir = os.path.join(self.LOG_DIR, 'archives')
+            if old_logs:
                 if self.DEBUG:
-                    logging.debug("没有需要归档的旧日志")
-                return
+                    logging.debug(f"找到{len(old_logs)}个需要归档的旧日志")
+                try:
+                    os.makedirs(archive_dir, exist_ok=True)
+                except Exception as e:
+                    logging.error(f"创建归档目录失败: {str(e)}")
+                    return
 
-            if self.DEBUG:
-                logging.debug(f"找到{len(old_logs)}个需要归档的旧日志")
+                # 按日期分组
+                date_groups = {}
+                for log_file in sorted(old_logs):
+                    date_part = os.path.basename(log_file).split('_')[0]
+                    date_groups.setdefault(date_part, []).append(log_file)
 
-            # 创建归档目录
-            archive_dir = os.path.join(self.LOG_DIR, 'archives')
+                for date, logs in date_groups.items():
+                    if self._is_expired(date):
+                        self._remove_files(logs)
+                        continue
+                    self._append_to_archive(os.path.join(archive_dir, f'logs_{date}.zip'), logs)
+            elif self.DEBUG:
+                logging.debug("没有需要归档的旧日志")
+
+            # 清理旧归档
+            self._clean_expired_archives(archive_dir)
+
+        except Exception as e:
+            logging.error(f"日志归档过程中发生未捕获的异常: {str(e)}")
+
+    def _is_expired(self, date: str) -> bool:
+        """date(YYYY-MM-DD)是否超出保留天数，无法解析时视为未过期"""
+        if self.KEEP_DAYS is None:
+            return False
+        try:
+            return dateToTimestamp(date) < time.time() - (self.KEEP_DAYS + 1) * 86400
+        except ValueError:
+            return False
+
+    def _remove_files(self, files: list[str]):
+        for path in files:
             try:
-                os.makedirs(archive_dir, exist_ok=True)
+                os.remove(path)
                 if self.DEBUG:
-                    logging.debug(f"创建归档目录: {archive_dir}")
+                    logging.debug(f"已删除: {path}")
             except Exception as e:
-                logging.error(f"创建归档目录失败: {str(e)}")
-                return
+                logging.error(f"删除文件{path}失败: {str(e)}")
 
-            # 按日期分组
-            date_groups = {}
-            for log_file in old_logs:
-                try:
-                    filename = os.path.basename(log_file)
-                    date_part = filename.split('_')[0]
-                    if date_part not in date_groups:
-                        date_groups[date_part] = []
-                    date_groups[date_part].append(log_file)
-                except Exception as e:
-                    logging.error(f"处理日志文件{log_file}出错: {str(e)}")
-                    continue
+    def _append_to_archive(self, zip_path: str, logs: list[str]):
+        """把日志逐个追加到归档中，每个文件写入后立即删除原文件"""
+        if self.DEBUG:
+            logging.debug(f"正在追加归档: {zip_path}")
+        try:
+            # 'a'模式打开找不到目录的文件时会把它当作普通文件，在末尾追加一个新的归档，
+            # 之后namelist()里没有旧的日志，所以必须先检查
+            if os.path.exists(zip_path) and not zipfile.is_zipfile(zip_path):
+                # 上次追加时被中断，保留损坏的文件以便手动恢复，重新开始一个归档
+                broken = zip_path + f'.{int(time.time())}.corrupt'
+                os.replace(zip_path, broken)
+                logging.error(f"归档已损坏 已改名为: {broken}")
+            zipf = zipfile.ZipFile(zip_path, 'a', zipfile.ZIP_DEFLATED)
+        except Exception as e:
+            logging.error(f"打开归档{zip_path}失败: {str(e)}")
+            return
 
-            # 打包每个日期的日志
-            for date, logs in date_groups.items():
-                zip_path = os.path.join(archive_dir, f'logs_{date}.zip')
-                if self.DEBUG:
-                    logging.debug(f"正在创建归档: {zip_path}")
-                
+        with zipf:
+            archived = set(zipf.namelist())
+            for log_file in logs:
+                name = os.path.basename(log_file)
                 try:
-                    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                        for log_file in logs:
-                            zipf.write(log_file, os.path.basename(log_file))
-                            if self.DEBUG:
-                                logging.debug(f"添加文件到归档: {log_file}")
-                    
-                    # 验证ZIP文件是否创建成功
-                    if not os.path.exists(zip_path):
-                        logging.error(f"归档文件创建失败: {zip_path}")
-                        continue
-                    
-                    # 删除原日志文件
-                    for log_file in logs:
-                        try:
-                            os.remove(log_file)
-                            if self.DEBUG:
-                                logging.debug(f"已删除原文件: {log_file}")
-                        except Exception as e:
-                            logging.error(f"删除文件{log_file}失败: {str(e)}")
-                            
+                    if name not in archived:
+                        zipf.write(log_file, name)
+                        if self.DEBUG:
+                            logging.debug(f"添加文件到归档: {log_file}")
                 except Exception as e:
-                    logging.error(f"创建归档{zip_path}失败: {str(e)}")
+                    logging.error(f"归档{log_file}失败: {str(e)}")
                     continue
+                self._remove_files([log_file])
 
-            # 清理旧归档
-            #self._clean_expired_archives()
+    def _clean_expired_archives(self, archive_dir: str):
+        """删除超过保留天数的归档，总大小超过max_archive_mb时从最旧的开始删除"""
+        if not os.path.isdir(archive_dir):
+            return
+        archives = []  # (日期, 路径, 大小)
+        for name in os.listdir(archive_dir):
+            match = re.fullmatch(r'logs_(\d{4}-\d{2}-\d{2})\.zip(?:\.\d+\.corrupt)?', name)
+            if match:
+                path = os.path.join(archive_dir, name)
+                archives.append((match.group(1), path, os.path.getsize(path)))
+        archives.sort()
 
-        except Exception as e:
-            logging.error(f"日志归档过程中发生未捕获的异常: {str(e)}")
+        kept = []
+        for date, path, size in archives:
+            if self._is_expired(date):
+                self._remove_files([path])
+            else:
+                kept.append((date, path, size))
+
+        if self.MAX_ARCHIVE_MB is not None:
+            total = sum(x[2] for x in kept)
+            limit = self.MAX_ARCHIVE_MB * 1024 * 1024
+            for date, path, size in kept:
+                if total <= limit:
+                    break
+                self._remove_files([path])
+                total -= size
 
     def _setup_logging(self):
         """配置日志系统 (与原代码逻辑一致)"""
@@ -161,41 +314,47 @@ class LogSystem:
                         if f.startswith(today) and f.endswith('.log')]
         log_file = os.path.join(self.LOG_DIR, f'{today}_{len(existing_logs)+1}.log')
         
-        # 清除现有日志处理器
+        # 清除现有日志处理器(包括之前的LogSystem启动的监听线程)
         logger = logging.getLogger()
+        LogSystem._stop_active_listener()
         logger.handlers.clear()
         
-        # 设置日志格式
-        formatter = logging.Formatter(
+        # 设置日志格式(时间带毫秒)
+        formatter = _LogFormatter(
             '[%(asctime)s][%(threadName)s][%(funcName)s][%(levelname)s] %(message)s',
             datefmt=r'%Y-%m-%d %H:%M:%S'
         )
         
-        # 自定义时间格式化函数以支持毫秒
-        def custom_time_format(record, datefmt):
-            created = datetime.fromtimestamp(record.created)
-            # 将毫秒部分拼接到格式化后的时间字符串中
-            base_time_str = created.strftime(datefmt)
-            millisecond = created.microsecond // 1000  # 微秒转毫秒
-            return f"{base_time_str}.{millisecond:03d}"
-        
-        formatter.formatTime = custom_time_format
-        
         # 配置文件处理器(UTF-8编码)
         file_handler = logging.FileHandler(log_file, mode='w+', encoding='utf-8')
         file_handler.setLevel(self.LOG_FILE_LEVEL)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers = [file_handler]
         
         # 配置控制台处理器
         if self.LOG_CONSOLE_LEVEL:
             console_handler = logging.StreamHandler()
             console_handler.setLevel(self.LOG_CONSOLE_LEVEL)
             console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+            handlers.append(console_handler)
+
+        if self.ASYNC:
+            # 处理器在监听线程中执行，工作线程只做一次入队
+            queue_handler = _QueueHandler(queue.SimpleQueue())
+            self.listener = logging.handlers.QueueListener(
+                queue_handler.queue, *handlers, respect_handler_level=True
+            )
+            self.listener.start()
+            LogSystem._active_listener = self.listener
+            handlers = [queue_handler]
+
+        for handler in handlers:
+            if self.debug_sampler:
+                handler.addFilter(self.debug_sampler)
+            logger.addHandler(handler)
         
-        # 设置根记录器级别
-        logger.setLevel(logging.DEBUG)
+        # 根记录器级别取各处理器中最低的，低于它的记录在调用处就被丢弃
+        logger.setLevel(min((x for x in (self.LOG_FILE_LEVEL, self.LOG_CONSOLE_LEVEL) if x), default=logging.DEBUG))
 
         # 调试模式额外输出
         if self.DEBUG:
@@ -205,6 +364,26 @@ class LogSystem:
             logging.debug(f"文件记录级别: {self.LOG_FILE_LEVEL}")
             logging.debug(f"日志保留天数: {self.KEEP_DAYS}天")
 
+    _active_listener: Optional[logging.handlers.QueueListener] = None
+
+    @staticmethod
+    def _stop_active_listener():
+        listener = LogSystem._active_listener
+        LogSystem._active_listener = None
+        if listener is not None:
+            listener.stop()  # 写完队列中剩余的记录
+            for handler in listener.handlers:
+                handler.close()
+
+    def close(self):
+        """停止监听线程并写完剩余的日志，程序退出时会自动调用"""
+        if self.listener is not None and LogSystem._active_listener is self.listener:
+            LogSystem._stop_active_listener()
+        self.listener = None
+
+
+atexit.register(LogSystem._stop_active_listener)
+
 def clean_text(text):
     """
     删除文本中符合以下模式的字符组合：
@@ -234,14 +413,165 @@ import re
 from typing import Optional
 
 
+class _HTMLIndex:
+    """
+    对HTML只扫描一次，建立扁平的标签偏移表和 class -> 元素 索引
+
+    元素按开始标签出现顺序编号，starts/open_ends/ends分别记录
+    开始标签起点、开始标签终点和整个元素(含结束标签)的终点。
+    """
+
+    _TOKEN = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9:-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.S)
+    _CLASS = re.compile(r'\bclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+    _ATTR = re.compile(r'([^\s=/>"\']+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+    _VOID = frozenset((
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+        'link', 'meta', 'param', 'source', 'track', 'wbr',
+    ))
+    _RAW_TEXT = frozenset(('script', 'style', 'textarea'))
+
+    def __init__(self, source: str):
+        self.source = source
+        self.starts: list[int] = []
+        self.open_ends: list[int] = []
+        self.ends: list[int] = []
+        self.attr_spans: list[tuple[int, int]] = []
+        self.by_class: dict[str, list[int]] = {}
+        self._attrs: dict[int, dict[str, str]] = {}
+        self._tokenize()
+
+    def _tokenize(self):
+        source = self.source
+        search = self._TOKEN.search
+        stacks: dict[str, list[int]] = {}
+        pos = 0
+
+        while True:
+            match = search(source, pos)
+            if not match:
+                break
+            pos = match.end()
+            name = match.group(2)
+            if name is None:  # 注释
+                continue
+            name = name.lower()
+
+            if match.group(1):  # 结束标签，与同名的最近开始标签配对
+                stack = stacks.get(name)
+                if stack:
+                    self.ends[stack.pop()] = pos
+                continue
+
+            index = len(self.starts)
+            attr_text = match.group(3)
+            self_closing = attr_text.endswith('/') or name in self._VOID
+            self.starts.append(match.start())
+            self.open_ends.append(pos)
+            self.ends.append(pos if self_closing else len(source))  # 未闭合时延伸到文档末尾
+            self.attr_spans.append(match.span(3))
+
+            if 'class' in attr_text:
+                class_match = self._CLASS.search(attr_text)
+                if class_match:
+                    for class_name in dict.fromkeys((class_match.group(1) or class_match.group(2) or '').split()):
+                        self.by_class.setdefault(class_name, []).append(index)
+
+            if self_closing:
+                continue
+            stacks.setdefault(name, []).append(index)
+            if name in self._RAW_TEXT:
+                # 脚本内容中的 '<' 不是标签，直接跳到结束标签
+                close = source.find('</' + name, pos)
+                if close != -1:
+                    pos = close
+
+    def find(self, class_name: str, start: int, end: int) -> list[int]:
+        """返回起点位于[start, end)内且带有该class的元素编号"""
+        found = self.by_class.get(class_name, [])
+        if start == 0 and end >= len(self.source):
+            return list(found)
+        starts = self.starts
+        return [i for i in found if start <= starts[i] < end]
+
+    def attributes(self, index: int) -> dict[str, str]:
+        """解析并缓存元素开始标签中的属性"""
+        attrs = self._attrs.get(index)
+        if attrs is None:
+            a, b = self.attr_spans[index]
+            attrs = {}
+            for match in self._ATTR.finditer(self.source, a, b):
+                attrs.setdefault(match.group(1), match.group(2) if match.group(2) is not None else match.group(3))
+            self._attrs[index] = attrs
+        return attrs
+
+
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
 class HTMLParser:
-    def __init__(self, outerHTML: str):
-        self.outerHTML = outerHTML  # 假设minimize_html_whitespace已处理
+    """
+    HTML元素
+
+    索引模式下返回的子元素只是共享源文档的视图(源文档+起止偏移)，
+    outerHTML、innerHTML等字符串在读取时才生成。
+    """
+
+    __slots__ = ('_source', '_start', '_end', 'indexed', '_index', '_element')
+
+    def __init__(self, outerHTML: str, indexed: bool = False):
+        """
+        :param outerHTML: 要解析的HTML
+        :param indexed: 索引模式，首次查找时扫描一次文档建立索引，
+                        之后的find_element(s)_by_class_name和get_attribute都是查表。
+                        该模式按完整class名匹配(与浏览器By.CLASS_NAME一致)
+        """
+        self._source = outerHTML  # 假设minimize_html_whitespace已处理
+        self._start = 0
+        self._end = len(outerHTML)
+        self.indexed = indexed
+        self._index: Optional[_HTMLIndex] = None
+        self._element: Optional[int] = None  # 在索引中的元素编号，根节点为None
+
+    @property
+    def outerHTML(self) -> str:
+        if self._start == 0 and self._end == len(self._source):
+            return self._source
+        return self._source[self._start:self._end]
+
+    def _get_index(self) -> _HTMLIndex:
+        if self._index is None:
+            self._index = _HTMLIndex(self._source)
+        return self._index
+
+    def _child(self, element: int) -> 'HTMLParser':
+        index = self._index
+        child = HTMLParser.__new__(HTMLParser)
+        child._source = index.source
+        child._start = index.starts[element]
+        child._end = index.ends[element]
+        child.indexed = True
+        child._index = index
+        child._element = element
+        return child
+
+    def _find_indexed(self, class_name: str) -> list[int]:
+        return self._get_index().find(class_name, self._start, self._end)
+
+    def _inner_span(self) -> tuple[int, int]:
+        """innerHTML在源文档中的起止偏移：第一个'>'之后到最后一个'<'之前"""
+        start = self._source.find('>', self._start, self._end) + 1
+        end = self._source.rfind('<', self._start, self._end)
+        if start == 0 or end == -1 or start >= end:
+            return start, start
+        return start, end
 
     def find_elements_by_class_name(self, class_name: str) -> list['HTMLParser']:
         """
         通过class名查找所有匹配元素并返回由HTMLParser对象构成的列表
         """
+        if self.indexed:
+            return [self._child(i) for i in self._find_indexed(class_name)]
+
         results = []
 
         # 改进后的正则表达式，支持自闭合和普通标签，捕获整个标签
@@ -284,6 +614,10 @@ class HTMLParser:
         """
         通过class名查找第一个匹配元素
         """
+        if self.indexed:
+            found = self._find_indexed(class_name)
+            return self._child(found[0]) if found else None
+
         pattern = r'<([a-zA-Z][a-zA-Z0-9]*)\b([^>]*?class="[^"]*\b' + re.escape(class_name) + r'\b[^"]*"[^>]*)\s*(/?)>'
 
         match = re.search(pattern, self.outerHTML)
@@ -323,20 +657,26 @@ class HTMLParser:
             return self.outerHTML
 
         if attr_name == 'innerHTML':
-            start_tag_end = self.outerHTML.find('>') + 1
-            end_tag_start = self.outerHTML.rfind('<')
-            if start_tag_end == -1 or end_tag_start == -1 or start_tag_end >= end_tag_start:
-                return ""
-            return self.outerHTML[start_tag_end:end_tag_start]
+            start, end = self._inner_span()
+            return self._source[start:end]
 
         if attr_name == 'innerText':
-            inner_html = self.get_attribute('innerHTML')
-            text = re.sub(r'<[^>]*>', '', inner_html)
-            text = clean_text(text)
-            return text
+            # 直接在源文档上跳过标签拼接文本，不生成innerHTML的副本
+            start, end = self._inner_span()
+            pieces = []
+            for match in _TAG_PATTERN.finditer(self._source, start, end):
+                pieces.append(self._source[start:match.start()])
+                start = match.end()
+            pieces.append(self._source[start:end])
+            return clean_text(''.join(pieces))
 
-        pattern = rf'{attr_name}="([^"]*?)"'
-        match = re.search(pattern, self.outerHTML)
+        if self._element is not None:
+            value = self._index.attributes(self._element).get(attr_name)
+            if value is not None:
+                return value
+
+        pattern = re.compile(rf'{attr_name}="([^"]*?)"')
+        match = pattern.search(self._source, self._start, self._end)
         if match:
             return match.group(1)
         return None
@@ -365,6 +705,62 @@ def findString(main_string: str, start_string: str, end_string: str,start_move=0
     
     return list(output.keys())
 
+class StringExtractor:
+    """
+    一次编译、单次扫描的多组 findString
+
+    specs 的每一项与 findString 的参数含义相同:
+        {名称: (start_string, end_string, start_move, end_move)}
+    起止字符串相同的项共享同一组匹配位置，只是截取偏移不同。
+
+    用法:
+        extractor = StringExtractor({
+            'id': ('href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 43, -5),
+            'href': ('href="https://ac.qq.com/Comic/comicInfo/id/', '" h="', 6, -5),
+        })
+        result = extractor.extract(source)  # {'id': [...], 'href': [...]}
+    """
+
+    def __init__(self, specs: dict[str, tuple]):
+        self.specs = {}
+        self._scanners: dict[tuple[str, str], list[tuple[str, int, int]]] = {}
+        for name, spec in specs.items():
+            start_string, end_string, start_move, end_move = (tuple(spec) + (0, 0))[:4]
+            if not start_string:
+                raise ValueError("start_string must not be empty")
+            self.specs[name] = (start_string, end_string, start_move, end_move)
+            self._scanners.setdefault((start_string, end_string), []).append((name, start_move, end_move))
+
+        # 零宽匹配所有起始字符串可能出现的位置
+        starts = sorted({x[0] for x in self._scanners}, key=len, reverse=True)
+        self._pattern = re.compile('(?=' + '|'.join(re.escape(x) for x in starts) + ')')
+
+    def extract(self, source: str) -> dict[str, list[str]]:
+        """扫描一次source，返回每个名称对应的匹配列表(与findString结果一致)"""
+        output = {name: {} for name in self.specs}
+        resume = {key: 0 for key in self._scanners}  # 每组下次可以开始匹配的位置
+        active = dict(self._scanners)
+
+        for match in self._pattern.finditer(source):
+            if not active:
+                break
+            pos = match.start()
+            for key in list(active):
+                start_string, end_string = key
+                if pos < resume[key] or not source.startswith(start_string, pos):
+                    continue
+                end_place = source.find(end_string, pos + len(start_string))
+                if end_place == -1:  # 之后不会再有完整匹配
+                    del active[key]
+                    continue
+                stop = end_place + len(end_string)
+                for name, start_move, end_move in active[key]:
+                    output[name][source[pos + start_move:stop + end_move]] = None
+                resume[key] = stop
+
+        return {name: list(found) for name, found in output.items()}
+
+
 def split_list_with_index(lst: list, n: int) -> list[list[dict]]:
     
     """
@@ -392,25 +788,131 @@ def split_list_with_index(lst: list, n: int) -> list[list[dict]]:
         if start >= length:
             result.append([{}])  # 空字典（如果没有元素）
         else:
-            # 将当前分片的元素转为 {value: index} 字典
-            chunk = lst[start:end]
-            chunk_dict = {val: idx for idx, val in enumerate(lst) if val in chunk}
+            # 将当前分片的元素转为 {value: index} 字典，索引取自分片本身，整体O(n)
+            chunk_dict = {val: idx for idx, val in enumerate(lst[start:end], start)}
             result.append([chunk_dict])  # 用列表包裹字典（符合你的需求）
         start = end
     
     return result
 
 
-import threading
+def partition_with_index(lst: list, n: int) -> list[list[tuple[int, object]]]:
+    """
+    将列表按顺序分成n段，每段是(原始索引, 元素)的列表
+
+    与split_list_with_index不同，重复的元素各自保留自己的索引。
+    各段长度最多相差1，整体O(len(lst))。
+
+    参数：
+    - lst: 要分割的列表。
+    - n: 段数，元素不足时后面的段为空列表。
+    """
+    if n <= 0:
+        raise ValueError("n must be positive")
+
+    chunk_size, remainder = divmod(len(lst), n)
+    result = []
+    start = 0
+    for i in range(n):
+        end = start + chunk_size + (1 if i < remainder else 0)
+        result.append(list(zip(range(start, end), lst[start:end])))
+        start = end
+    return result
+
+
+class WorkStealingQueue:
+    """
+    工作窃取的任务分配
+
+    先用partition_with_index把任务按顺序平均分给每个工作线程，
+    线程从自己队列的头部取任务；自己的做完后，从剩余任务最多的
+    线程队列尾部取走一个，耗时差异很大的页面不会让部分线程空等。
+    取出的任务是(原始索引, 元素)。
+
+    用法:
+        tasks = WorkStealingQueue(urls, workers=4)
+        # 在第i个工作线程中
+        while (task := tasks.get(i)) is not None:
+            index, url = task
+    """
+
+    def __init__(self, items: list, workers: int):
+        self._deques = [collections.deque(x) for x in partition_with_index(items, workers)]
+        self._locks = [threading.Lock() for _ in self._deques]
+        self.stolen = 0  # 被窃取的任务数
+
+    def get(self, worker: int) -> Optional[tuple[int, object]]:
+        """取出第worker个线程的下一个任务，全部完成时返回None"""
+        with self._locks[worker]:
+            if self._deques[worker]:
+                return self._deques[worker].popleft()
+        while True:
+            # 长度只用于挑选对象，窃取时在锁内重新检查
+            victim = max(range(len(self._deques)), key=lambda i: len(self._deques[i]))
+            with self._locks[victim]:
+                if self._deques[victim]:
+                    self.stolen += 1
+                    return self._deques[victim].pop()
+            if not any(self._deques):
+                return None
+
+    def __len__(self) -> int:
+        return sum(len(x) for x in self._deques)
+
+
+def work_stealing_map(func: Callable, items: list, workers: int, name: str = 'Steal') -> list:
+    """
+    在workers个线程中以工作窃取的方式对每个元素调用func
+
+    :return: 与items顺序一致的结果列表
+    :raises: func抛出的第一个异常(在所有线程结束后)
+    """
+    tasks = WorkStealingQueue(items, workers)
+    results = [None] * len(items)
+    errors = []
+
+    def run(worker: int):
+        while True:
+            task = tasks.get(worker)
+            if task is None:
+                return
+            index, item = task
+            try:
+                results[index] = func(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=(i,), name=f'{name}-{i}', daemon=True)
+        for i in range(min(workers, len(items)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
 import threading
 import time
 import queue
+import itertools
+from concurrent.futures import Future
 from typing import Optional, Callable
 
+_WAKE = object()  # 唤醒阻塞在队列上的线程
+
 class DynamicThread:
     def __init__(self, refresh_time=10,auto_back=False,source_queue: queue.Queue=None):
-        '''创建一个动态线程'''
-        self.refresh_time: int = refresh_time  # 修复类型声明
+        '''
+        创建一个动态线程
+
+        线程阻塞等待任务，不再轮询；refresh_time仅为兼容旧代码保留。
+        新代码请使用TaskScheduler。
+        '''
+        self.refresh_time: int = refresh_time
         self.current_running: bool = False
         self.current_func: Optional[Callable] = None  # 使用类型注解
         self.stop_: bool = False
@@ -423,29 +925,227 @@ class DynamicThread:
         self.thread.start()  # 启动线程
 
     def main(self):
-        while True:
+        while not self.stop_:
             self.current_running = False
-            time.sleep(self.refresh_time / 1000)  # 等待指定时间
-            if self.queue.qsize() > 0:
-                self.current_func = self.queue.get()
+            item = self.queue.get()  # 阻塞直到有任务或stop()
+            if item is _WAKE:
+                continue
+            func, future = item
+            if future.set_running_or_notify_cancel():
+                self.current_func = func
                 self.current_running = True
-                self.current_func()
+                try:
+                    future.set_result(func())
+                except BaseException as e:
+                    future.set_exception(e)
                 self.current_func=None
-            if self.stop_:
-                break  # 如果设置了停止标志，退出循环
-            
+        self.current_running = False
+
         if self.auto_back:
             self.source_queue.put(self)
 
-    def add(self, func: Callable):
-        '''设置要运行的函数'''
-        self.queue.put(func)
+    def add(self, func: Callable) -> Future:
+        '''设置要运行的函数，返回可以等待结果或取消的Future'''
+        future = Future()
+        self.queue.put((func, future))
+        return future
 
     def stop(self):
-        '''停止线程'''
+        '''停止线程(当前函数执行完后)'''
         self.stop_ = True
+        self.queue.put(_WAKE)
 
     def get_thread(self) -> threading.Thread:
         '''获取线程对象'''
         return self.thread
 
+
+# 优先级，数值越小越先执行
+PRIORITY_INTERACTIVE = 0  # 用户正在等待的操作，如搜索
+PRIORITY_NORMAL = 10
+PRIORITY_BULK = 20  # 批量下载等后台任务
+
+
+class _ScheduledTask:
+    __slots__ = ('priority', 'seq', 'func', 'args', 'kwargs', 'future')
+
+    def __init__(self, priority, seq, func, args, kwargs, future):
+        self.priority = priority
+        self.seq = seq
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+
+    def __lt__(self, other: '_ScheduledTask') -> bool:
+        # 同一优先级按提交顺序执行
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class WorkerStats:
+    """单个工作线程执行的任务数和忙碌时间"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tasks = 0
+        self.busy_time = 0.0
+        self.current: Optional[str] = None  # 正在执行的函数名
+        self.started = time.monotonic()
+        self._task_start: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def begin(self, name: str) -> None:
+        with self._lock:
+            self.current = name
+            self._task_start = time.monotonic()
+
+    def end(self) -> None:
+        with self._lock:
+            self.busy_time += time.monotonic() - self._task_start
+            self.tasks += 1
+            self.current = None
+            self._task_start = None
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            busy = self.busy_time
+            if self._task_start is not None:
+                busy += now - self._task_start
+            elapsed = now - self.started
+            return {
+                'name': self.name,
+                'tasks': self.tasks,
+                'current': self.current,
+                'busy_time': busy,
+                'utilization': busy / elapsed if elapsed > 0 else 0.0,
+            }
+
+
+class TaskScheduler:
+    """
+    带优先级的任务调度器
+
+    工作线程阻塞在同一个优先队列上，有任务时立即被唤醒，空闲时不占用CPU。
+    优先级数值小的任务先执行(PRIORITY_INTERACTIVE < PRIORITY_NORMAL < PRIORITY_BULK)，
+    因此交互式的搜索可以插到批量下载之前，但不会打断已经开始的任务。
+
+    submit返回concurrent.futures.Future，可以等待结果、添加回调，
+    尚未开始的任务可以通过future.cancel()取消。
+
+    DynamicThread(auto_back=True, source_queue=pool)的用法——从pool中取出空闲线程、
+    add任务、线程结束后放回pool——对应直接调用submit：空闲的工作线程
+    自己从队列中取任务，不需要手动取出和归还。
+
+    用法:
+        scheduler = TaskScheduler(workers=4)
+        future = scheduler.submit(downloader.search_comic, title, priority=PRIORITY_INTERACTIVE)
+        comic = future.result()
+        scheduler.stats()
+        scheduler.shutdown()
+    """
+
+    def __init__(self, workers: int = 4, name: str = 'Scheduler', daemon: bool = True):
+        """
+        :param workers: 工作线程数
+        :param name: 线程名前缀
+        :param daemon: 是否为守护线程
+        """
+        if workers <= 0:
+            raise ValueError("workers must be positive")
+        self.name = name
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending: dict[int, int] = {}  # 优先级 -> 排队中的任务数
+        self._shutdown = False
+        self.workers = [WorkerStats(f'{name}-{i}') for i in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._worker, args=(stats,), name=stats.name, daemon=daemon)
+            for stats in self.workers
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, func: Callable, *args, priority: int = PRIORITY_NORMAL, **kwargs) -> Future:
+        """
+        提交任务
+
+        :param priority: 优先级，数值越小越先执行
+        :return: 任务的Future
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._pending[priority] = self._pending.get(priority, 0) + 1
+            self._queue.put(_ScheduledTask(priority, next(self._seq), func, args, kwargs, future))
+        return future
+
+    def cancel_pending(self, priority: Optional[int] = None) -> int:
+        """
+        取消排队中(尚未开始)的任务
+
+        :param priority: 只取消该优先级的任务，None表示全部
+        :return: 取消的任务数
+        """
+        cancelled = 0
+        with self._queue.mutex:
+            tasks = list(self._queue.queue)
+        for task in tasks:
+            if task.func is not None and (priority is None or task.priority == priority):
+                cancelled += task.future.cancel()
+        return cancelled
+
+    def _worker(self, stats: WorkerStats) -> None:
+        while True:
+            task = self._queue.get()  # 阻塞等待，不轮询
+            if task.func is None:  # 关闭标记
+                break
+            with self._lock:
+                self._pending[task.priority] -= 1
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            stats.begin(getattr(task.func, '__name__', repr(task.func)))
+            try:
+                result = task.func(*task.args, **task.kwargs)
+            except BaseException as e:
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+            finally:
+                stats.end()
+
+    def stats(self) -> dict:
+        """
+        :return: {'pending': {优先级: 排队数}, 'workers': [每个线程的任务数、当前任务和利用率]}
+        """
+        with self._lock:
+            pending = {k: v for k, v in self._pending.items() if v}
+        return {'pending': pending, 'workers': [x.snapshot() for x in self.workers]}
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False) -> None:
+        """
+        停止接受新任务，已排队的任务执行完后线程退出
+
+        :param wait: 是否等待线程退出
+        :param cancel_pending: 是否取消尚未开始的任务
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            if cancel_pending:
+                self.cancel_pending()
+            # 关闭标记排在所有任务之后
+            for _ in self.threads:
+                self._queue.put(_ScheduledTask(float('inf'), next(self._seq), None, (), {}, None))
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def __enter__(self) -> 'TaskScheduler':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
@@ -1,26 +1,14 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
-from selenium import webdriver
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.common.by import By
 import lib
 import logging
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
-import requests
+import queue
 import threading
-import os
 import sv_ttk
 import GUILibs
 import ctypes
 import tkinter as tk
 import tkinter.ttk as ttk
-import getData
 
-logging.info("程序启动")
-
-# 初始化日志系统
-logger = lib.LogSystem(file_level=logging.DEBUG, console_level=logging.INFO)
+# getData(selenium、requests)较重，在后台线程中首次使用时才导入
 
 
 class Tabs(tk.Frame):
@@ -33,11 +21,23 @@ class GUI:
         self.root = tk.Tk()
         self.root.title("动漫下载器")
 
-        self.init_webdriver_thread = threading.Thread(target=self._init_webdriver)
+        # 其他线程不能直接操作Tk控件，通过post放入队列，由Tk线程执行
+        self._ui_queue = queue.Queue()
+        self._drain_scheduled = False
+        self._drain_lock = threading.Lock()
+
+        # 后台任务共用的调度器，搜索优先于预热等后台工作
+        self.scheduler = lib.TaskScheduler(workers=2, name="GUITask")
+
+        # 下载器在后台线程创建，完成(或失败)后置位
+        self._downloader_ready = threading.Event()
+        self._downloader_error = None
+        self.init_webdriver_thread = threading.Thread(target=self._init_webdriver, daemon=True)
         self.init_webdriver_thread.start()
 
         self.current_comic_data = None
         self.initialized = False
+        self._warm_started = False
 
         self.root.resizable(False, False)  # 禁止缩放窗口
 
@@ -55,16 +55,80 @@ class GUI:
         sv_ttk.set_theme("dark")
 
     def _init_webdriver(self):
-        self.comic_downloader = getData.ComicDownloader(headless=True)
-
-    def main(self):
-        # 初始化
+        try:
+            import getData
+
+            # 浏览器在第一次搜索(或开始输入)时才启动
+            self.comic_downloader = getData.ComicDownloader(headless=True, init_webdrivers=False)
+            self.comic_downloader.state_callbacks.append(self._on_downloader_state)
+        except Exception as e:
+            logging.error("下载器初始化失败:\t" + str(e))
+            self._downloader_error = e
+        finally:
+            self._downloader_ready.set()
+
+    def post(self, func, *args):
+        """在Tk线程中执行func(*args)，可以从任意线程调用"""
+        self._ui_queue.put((func, args))
+        with self._drain_lock:
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        try:
+            self.root.after(0, self._drain_ui_queue)
+        except (RuntimeError, tk.TclError):
+            # 窗口已关闭或主循环未运行
+            with self._drain_lock:
+                self._drain_scheduled = False
+
+    def _drain_ui_queue(self):
+        """Tk线程: 执行队列中的全部界面操作"""
+        with self._drain_lock:
+            self._drain_scheduled = False
+        while True:
+            try:
+                func, args = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error("界面更新出错:\t" + str(e))
+
+    def _on_downloader_state(self, task, running: bool):
+        """下载器状态变化(在工作线程中调用)，立即反映到加载页"""
+        self.post(self._show_downloader_state, running)
+
+    def _show_downloader_state(self, running: bool):
+        if running:
+            self._loading_progressbar.start(15)
+        else:
+            self._loading_progressbar.stop()
+
+    def _warm_webdriver(self, args=""):
+        """开始输入搜索词时在后台预热浏览器，只执行一次"""
+        if self._warm_started:
+            return
+        self._warm_started = True
+
+        def warm():
+            self._wait_until_webdriver_init()
+            self.comic_downloader.warm_webdrivers()
+
+        self.scheduler.submit(warm, priority=lib.PRIORITY_BULK)
+
+    def build(self):
+        """创建所有界面，不进入主循环"""
         self._build_tabs()
         self.tab_Frame.switch_to_tab(0)
         self._init_main_page()
         self._init_settings_tab()
         self._init_loading_tab()
 
+    def main(self):
+        # 初始化
+        self.build()
+
         self.root.mainloop()
 
     def _build_tabs(self):
@@ -137,6 +201,7 @@ class GUI:
 
         # 绑定事件
         self.root.bind("<Return>", self.search)
+        self.main_page_entry.bind("<Key>", self._warm_webdriver, add="+")
 
         GUILibs.set_hover(self.main_page_entry, "输入搜索关键词")
 
@@ -170,13 +235,19 @@ class GUI:
         text = self.main_page_entry.get()
         if text == "输入搜索关键词" or text == "":
             return None
-        self.search_thread = threading.Thread(target=self._search_main, args=(text,))
-        self.search_thread.start()
+        self.search_future = self.scheduler.submit(
+            self._search_main, text, priority=lib.PRIORITY_INTERACTIVE
+        )
+        self.search_future.add_done_callback(self._log_task_error)
+
+    @staticmethod
+    def _log_task_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("后台任务出错:\t" + str(future.exception()))
 
     def to_loading_tab(self):
         self.tab_Frame.switch_to_tab(4)
-        self.refresh_thread = threading.Thread(target=self._refresh_loop)
-        self.refresh_thread.start()
+        self._loading_progressbar.start(15)
 
 
 
@@ -216,32 +287,24 @@ class GUI:
         empty.grid(row=1, column=1, columnspan=3, sticky="we", pady=5)
 
     def _wait_until_webdriver_init(self):
-        while 1:
-            time.sleep(0.02)
-            try:
-                tmp=self.comic_downloader
-                del tmp
-                break
-            except:
-                pass
-
-    def _refresh_loop(self):
-        while 1:
-            time.sleep(0.1)
-            if self.tab_Frame.current_tab != 4:
-                break
+        """阻塞到下载器创建完成，创建失败时抛出异常，不能在Tk线程中调用"""
+        self._downloader_ready.wait()
+        if self._downloader_error is not None:
+            raise self._downloader_error
 
     def _wait_until_idle(self):
-        while 1:
-            time.sleep(0.1)
-            if self.tab_Frame.current_tab != 4 or not self.comic_downloader.is_running:
-                break
+        """阻塞到下载器没有任务在运行，不能在Tk线程中调用"""
+        self.comic_downloader.idle.wait()
+
+    def _set_loading_text(self, text: str):
+        self.post(self._loading_info_label.configure, {"text": text})
+
     def _search_main(self,text):
         
-        self.to_loading_tab()
+        self.post(self.to_loading_tab)
         self._wait_until_webdriver_init()
         
-        self._loading_info_label.configure(text="已经初始化 搜索：\""+str(text)+'" 中')
+        self._set_loading_text("已经初始化 搜索：\""+str(text)+'" 中')
         
         self.current_comic_data=self.comic_downloader.search_comic(text)
         
@@ -250,12 +313,16 @@ class GUI:
             return 0
         
         
-        self._loading_info_label.configure(text="已经找到 \""+str(self.current_comic_data.title)+'" 正在解析章节')
+        self._set_loading_text("已经找到 \""+str(self.current_comic_data.title)+'" 正在解析章节')
         
         self.current_chapter_list=self.comic_downloader.get_chapters(self.current_comic_data)
         
         self._wait_until_idle()
         
+        self.post(self._leave_loading_tab)
+
+    def _leave_loading_tab(self):
+        self._loading_progressbar.stop()
         self.tab_Frame.switch_to_tab(0)
         
     def cannot_find_comic(self,title:str):
@@ -268,22 +335,19 @@ class GUI:
         self._loading_info_label = ttk.Label(root, text="浏览器初始化中", anchor="center")
         self._loading_info_label.grid(row=0, column=1, sticky="we")
 
-        def refresh(arg: ttk.Progressbar):
-            while True:
-                arg["value"] += 3
-                arg.update()
-                time.sleep(0.01)
-                if arg["value"] >= 200:
-                    arg["value"] = 0
-
-        progressbar = ttk.Progressbar(
-            root, orient="horizontal", length=100, mode="indeterminate"
+        # 动画由Tk的定时器驱动，只在加载页显示且有任务时运行
+        self._loading_progressbar = ttk.Progressbar(
+            root, orient="horizontal", length=100, mode="indeterminate", maximum=200
         )
 
-        progressbar.grid(row=1, column=1, sticky="we")
-        refresh_thread = threading.Thread(target=refresh, args=(progressbar,))
-        refresh_thread.start()
+        self._loading_progressbar.grid(row=1, column=1, sticky="we")
         root.grid_columnconfigure(1, weight=1)
-mg = GUI()
+if __name__ == "__main__":
+    logging.info("程序启动")
+
+    # 初始化日志系统，旧日志在后台归档
+    logger = lib.LogSystem(file_level=logging.DEBUG, console_level=logging.INFO)
+
+    mg = GUI()
 
-mg.main()
+    mg.main()
@@ -0,0 +1,357 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import retry
+import storage
+from getData import ChapterInfo, ComicDownloader, PageResult
+
+_STOP = object()  # 队列结束标记
+
+
+class StageStats:
+    """单个阶段的工作线程数、处理数量和忙碌时间"""
+
+    def __init__(self, name: str, workers: int, source: Optional[queue.Queue] = None):
+        self.name = name
+        self.workers = workers
+        self.source = source  # 该阶段读取的队列
+        self.processed = 0
+        self.busy_time = 0.0
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable, *args):
+        """执行一项工作并计入忙碌时间"""
+        with self._lock:
+            self.active += 1
+        start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            cost = time.monotonic() - start
+            with self._lock:
+                self.active -= 1
+                self.processed += 1
+                self.busy_time += cost
+
+    def snapshot(self, elapsed: float) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'active': self.active,
+                'processed': self.processed,
+                'queue_depth': self.source.qsize() if self.source else 0,
+                'queue_size': self.source.maxsize if self.source else 0,
+                'utilization': self.busy_time / (elapsed * self.workers) if elapsed > 0 else 0.0,
+            }
+
+
+class _ChapterJob:
+    """一个章节在流水线中的状态"""
+
+    def __init__(
+        self,
+        chapter: ChapterInfo,
+        total: int,
+        archive: Optional[storage.CBZWriter] = None,
+        budget: Optional[retry.RetryBudget] = None,
+    ):
+        self.chapter = chapter
+        self.total = total
+        self.archive = archive
+        self.budget = budget  # 章节所有页面共用的重试预算
+        self.results: list[PageResult] = []
+
+
+class DownloadPipeline:
+    """
+    解析 -> 下载 -> 写入 三阶段流水线
+
+    - 解析: 在浏览器池上获取章节图片列表，线程数为max_webdrivers
+    - 下载: 在下载线程池上获取图片内容，线程数为max_download_threads
+    - 写入: 写入章节目录或cbz压缩包，并在章节完成时收尾
+
+    阶段之间是有界队列，下游跟不上时上游会阻塞(背压)，
+    因此第N+1章的解析与第N章的下载同时进行，而内存中的图片数量有上限。
+    流水线中图片整张读入内存再写入，不使用Range续传，已完成的页面仍会跳过。
+
+    用法:
+        pipeline = DownloadPipeline(downloader)
+        results = pipeline.run(chapters)
+        pipeline.stats()  # 可在运行中从其他线程调用
+    """
+
+    def __init__(
+        self,
+        downloader: ComicDownloader,
+        resolved_depth: int = 2,
+        page_depth: Optional[int] = None,
+        write_depth: Optional[int] = None,
+    ):
+        """
+        :param downloader: 提供浏览器池、下载会话和输出设置的ComicDownloader
+        :param resolved_depth: 已解析但未开始下载的章节数上限
+        :param page_depth: 等待下载的页面数上限，默认为下载线程数的4倍
+        :param write_depth: 等待写入的页面数上限，默认为下载线程数的2倍
+        """
+        self.downloader = downloader
+        self.resolve_workers = max(1, downloader.max_webdrivers)
+        self.fetch_workers = max(1, downloader.max_download_threads)
+
+        self.chapter_queue: queue.Queue = queue.Queue()
+        self.resolved_queue: queue.Queue = queue.Queue(maxsize=resolved_depth)
+        self.page_queue: queue.Queue = queue.Queue(maxsize=page_depth or self.fetch_workers * 4)
+        self.write_queue: queue.Queue = queue.Queue(maxsize=write_depth or self.fetch_workers * 2)
+
+        self.resolve_stats = StageStats('resolve', self.resolve_workers, self.chapter_queue)
+        self.fetch_stats = StageStats('fetch', self.fetch_workers, self.page_queue)
+        self.write_stats = StageStats('write', 1, self.write_queue)
+
+        self.results: dict[str, list[PageResult]] = {}
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._counter_lock = threading.Lock()
+        self._resolvers_left = 0
+        self._fetchers_left = 0
+
+    def stats(self) -> dict:
+        """
+        各阶段的队列深度和利用率
+
+        :return: {'elapsed': 秒, 'resolve': {...}, 'fetch': {...}, 'write': {...}}
+        """
+        if self._started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished or time.monotonic()) - self._started
+        return {
+            'elapsed': elapsed,
+            'resolve': self.resolve_stats.snapshot(elapsed),
+            'fetch': self.fetch_stats.snapshot(elapsed),
+            'write': self.write_stats.snapshot(elapsed),
+        }
+
+    def run(self, chapters: list[ChapterInfo]) -> dict[str, list[PageResult]]:
+        """
+        下载所有章节，阻塞直到完成
+
+        :return: 以章节cid为键，按页码排序的PageResult列表为值的字典
+        """
+        self._started = time.monotonic()
+        self._finished = None
+        self.results = {}
+        self._resolvers_left = self.resolve_workers
+        self._fetchers_left = self.fetch_workers
+
+        for chapter in chapters:
+            self.chapter_queue.put(chapter)
+        for _ in range(self.resolve_workers):
+            self.chapter_queue.put(_STOP)
+
+        threads = [
+            threading.Thread(target=self._resolve_loop, name=f'Resolve-{i}', daemon=True)
+            for i in range(self.resolve_workers)
+        ]
+        threads.append(threading.Thread(target=self._dispatch_loop, name='Dispatch', daemon=True))
+        threads += [
+            threading.Thread(target=self._fetch_loop, name=f'Fetch-{i}', daemon=True)
+            for i in range(self.fetch_workers)
+        ]
+        threads.append(threading.Thread(target=self._write_loop, name='Write', daemon=True))
+
+        with self.downloader._running('pipeline'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self._finished = time.monotonic()
+        logging.info(f'流水线完成 {len(self.results)}个章节 用时{self._finished - self._started:.1f}s')
+        return self.results
+
+    # ---解析阶段---
+    def _resolve(self, chapter: ChapterInfo) -> tuple[list[str], Optional[Exception]]:
+        """:return: (图片URL列表, 解析失败时的异常)"""
+        try:
+            return self.downloader.get_comic_urls(chapter), None
+        except Exception as e:
+            logging.error(chapter.title + ' 解析图片失败:\t' + str(e))
+            return [], e
+
+    def _resolve_loop(self) -> None:
+        try:
+            while True:
+                chapter = self.chapter_queue.get()
+                if chapter is _STOP:
+                    break
+                urls, error = self.resolve_stats.run(self._resolve, chapter)
+                self.resolved_queue.put((chapter, urls, error))
+        finally:
+            # 无论如何都要通知下游，否则run()会一直等待
+            with self._counter_lock:
+                self._resolvers_left -= 1
+                last = self._resolvers_left == 0
+            if last:
+                self.resolved_queue.put(_STOP)
+
+    # ---分发: 把章节拆成页面---
+    def _fail_chapter(self, chapter: ChapterInfo, error: BaseException) -> None:
+        """整个章节失败，交给写入阶段记录一条失败结果"""
+        result = self.downloader._failed_chapter(chapter, error)[0]
+        self.write_queue.put((_ChapterJob(chapter, 1), result, None))
+
+    def _plan(self, chapter: ChapterInfo, urls: list[str]) -> tuple[_ChapterJob, list, list]:
+        """
+        为章节建立任务
+
+        :return: (任务, 已完成可直接记录的页面, 需要下载的页面)
+        """
+        downloader = self.downloader
+        if downloader.output_format == 'cbz':
+            skipped = downloader._skip_archived(chapter, urls)
+            if skipped is not None:
+                return _ChapterJob(chapter, len(skipped)), skipped, []
+            job = _ChapterJob(
+                chapter,
+                len(urls),
+                downloader._open_archive(chapter) if urls else None,
+                downloader._new_retry_budget(len(urls)),
+            )
+        else:
+            os.makedirs(downloader._get_chapter_dir(chapter), exist_ok=True)
+            job = _ChapterJob(chapter, len(urls), budget=downloader._new_retry_budget(len(urls)))
+
+        done, pending = [], []
+        try:
+            directory = downloader._get_chapter_dir(chapter)
+            manifest = None if job.archive or not urls else downloader._get_page_manifest(directory)
+            for i, url in enumerate(urls):
+                result = PageResult(
+                    index=i + 1,
+                    url=url,
+                    path=job.archive.path if job.archive else os.path.join(directory, f'{i + 1:03d}.jpg'),
+                )
+                name = f'{i + 1:03d}'
+                if manifest and manifest.is_complete(name, url, result.path, downloader.verify_downloads):
+                    result.size = manifest.get(name)['size']
+                    result.success = result.skipped = True
+                    done.append(result)
+                else:
+                    pending.append(result)
+        except BaseException:
+            if job.archive:
+                job.archive.abort()
+            raise
+        return job, done, pending
+
+    def _dispatch_loop(self) -> None:
+        try:
+            while True:
+                item = self.resolved_queue.get()
+                if item is _STOP:
+                    break
+                chapter, urls, error = item
+                if error is not None:
+                    self._fail_chapter(chapter, error)
+                    continue
+                # 先完成所有可能出错的检查，再把页面放入队列，出错时章节不会留下一半的页面
+                try:
+                    job, done, pending = self._plan(chapter, urls)
+                except Exception as e:
+                    self._fail_chapter(chapter, e)
+                    continue
+
+                if not urls:
+                    self.write_queue.put((job, None, None))
+                for result in done:
+                    self.write_queue.put((job, result, None))
+                for result in pending:
+                    self.page_queue.put((job, result))
+        finally:
+            for _ in range(self.fetch_workers):
+                self.page_queue.put(_STOP)
+
+    # ---下载阶段---
+    def _fetch(self, job: _ChapterJob, result: PageResult) -> Optional[bytes]:
+        try:
+            return self.downloader._retry(
+                f'{job.chapter.title} 第{result.index}页',
+                result.url,
+                self.downloader._fetch_page_bytes,
+                result.url,
+                budget=job.budget,
+            )
+        except Exception as e:
+            result.error = str(e)
+            logging.warning(f'{job.chapter.title}\t第{result.index}页下载失败:\t{e}')
+            return None
+
+    def _fetch_loop(self) -> None:
+        try:
+            while True:
+                item = self.page_queue.get()
+                if item is _STOP:
+                    break
+                job, result = item
+                data = self.fetch_stats.run(self._fetch, job, result)
+                self.write_queue.put((job, result, data))
+        finally:
+            with self._counter_lock:
+                self._fetchers_left -= 1
+                last = self._fetchers_left == 0
+            if last:
+                self.write_queue.put(_STOP)
+
+    # ---写入阶段---
+    def _write(self, job: _ChapterJob, result: Optional[PageResult], data: Optional[bytes]) -> None:
+        downloader = self.downloader
+        if result is not None:
+            try:
+                if data is not None:
+                    if job.archive:
+                        job.archive.add_page(result.index, data)
+                    else:
+                        downloader._write_page(job.chapter, f'{result.index:03d}', result.url, data)
+                    result.size = len(data)
+                    result.success = True
+            except Exception as e:
+                result.error = str(e)
+                logging.error(f'{job.chapter.title}\t第{result.index}页写入失败:\t{e}')
+            if not result.success and job.archive:
+                try:
+                    job.archive.skip_page(result.index)
+                except Exception as e:
+                    logging.error(f'{job.chapter.title}\t压缩包写入失败:\t{e}')
+            job.results.append(result)
+            downloader._notify_progress(job.chapter, result)
+
+        if len(job.results) >= job.total:
+            self._finish(job)
+
+    def _finish(self, job: _ChapterJob) -> None:
+        """章节的全部页面都已记录: 生成压缩包并记录结果，出错时记为失败"""
+        downloader = self.downloader
+        job.results.sort(key=lambda x: x.index)
+        try:
+            downloader._close_archive(job.chapter, job.archive, job.results)
+            downloader._finish_chapter(job.chapter, job.results)
+        except Exception as e:
+            if job.archive:
+                job.archive.abort()
+            job.results.insert(0, downloader._failed_chapter(job.chapter, e)[0])
+        self.results[job.chapter.cid] = job.results
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self.write_queue.get()
+            if item is _STOP:
+                break
+            try:
+                self.write_stats.run(self._write, *item)
+            except Exception:
+                # 不能让写入线程退出，否则上游会阻塞在已满的队列上
+                logging.exception('写入阶段出错')
@@ -0,0 +1,286 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+class AdaptiveHostLimiter:
+    """
+    单个主机的限流器：令牌桶限制请求速率，AIMD调整速率和并发数
+
+    - 成功且延迟正常: 低于上次受限时的速率(ceiling)时每秒约增加increase，
+      超过ceiling后快速增长以探测新的上限(第一次受限前同样快速增长)
+    - 429/503，或最近error_window次请求中其他5xx/网络错误的比例超过error_threshold:
+      记录ceiling，速率和并发数乘以backoff(每个冷却期最多一次)，有Retry-After时暂停发放令牌
+      (零星的错误不代表主机过载，不降速)
+    - 延迟超过基准的latency_tolerance倍: 不再增加
+    - 最近1秒内请求没有因为限流而等待: 不再增加，避免速率虚高
+    """
+
+    THROTTLE_STATUS = (429, 503)
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        min_rate: float = 0.5,
+        max_rate: float = 500.0,
+        concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        burst: Optional[float] = None,
+        latency_tolerance: float = 2.0,
+        cooldown: float = 0.25,
+        increase: float = 5.0,
+        backoff: float = 0.7,
+        error_window: int = 20,
+        error_threshold: float = 0.25,
+    ):
+        """
+        :param rate: 初始速率(请求/秒)
+        :param concurrency: 初始并发数
+        :param burst: 令牌桶容量，默认等于1秒的速率
+        :param latency_tolerance: 延迟超过最低延迟的多少倍时停止增加
+        :param cooldown: (单位: s) 两次降速之间的最短间隔
+        :param increase: (单位: 请求/s) 低于ceiling时每秒大约增加的速率
+        :param backoff: 受限时速率和并发数乘以的系数
+        :param error_window: 统计错误比例的最近请求数
+        :param error_threshold: 错误比例超过该值时降速
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.burst = burst
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.increase = increase
+        self.backoff = backoff
+        self.ceiling: Optional[float] = None  # 上次受限时的速率
+        self.error_threshold = error_threshold
+        self._outcomes: collections.deque = collections.deque(maxlen=error_window)  # 最近请求是否出错
+
+        self._cond = threading.Condition()
+        self._tokens = burst or max(1.0, rate)
+        self._last_fill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._last_saturated = 0.0  # 上次有请求因限流而等待的时间
+        self.in_flight = 0
+        self.base_latency: Optional[float] = None
+        self.avg_latency: Optional[float] = None
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def _reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数，调用前需持有锁"""
+        now = time.monotonic()
+        capacity = self.burst or max(1.0, self.rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_fill) * self.rate)
+        self._last_fill = now
+        self._tokens -= 1
+        wait = max(0.0, -self._tokens / self.rate, self._paused_until - now)
+        if wait:
+            self._last_saturated = now
+        return wait
+
+    def _try_enter(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        """阻塞直到获得并发名额和令牌"""
+        with self._cond:
+            while not self._try_enter():
+                self._last_saturated = time.monotonic()
+                self._cond.wait()
+            wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, poll: float = 0.01) -> None:
+        """acquire的asyncio版本，不阻塞事件循环"""
+        while True:
+            with self._cond:
+                if self._try_enter():
+                    wait = self._reserve()
+                    break
+                self._last_saturated = time.monotonic()
+            await asyncio.sleep(poll)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def release(
+        self,
+        status: Optional[int] = None,
+        latency: Optional[float] = None,
+        error: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        归还名额并根据结果调整速率
+
+        :param status: HTTP状态码
+        :param latency: (单位: s) 请求耗时
+        :param error: 是否出现网络错误
+        :param retry_after: (单位: s) 服务器要求的等待时间
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            throttled = status in self.THROTTLE_STATUS
+            failed = not throttled and (error or (status is not None and status >= 500))
+            self._outcomes.append(failed)
+            if throttled:
+                self.throttled += 1
+            elif failed:
+                self.errors += 1
+            overloaded = failed and (
+                len(self._outcomes) == self._outcomes.maxlen
+                and sum(self._outcomes) / len(self._outcomes) > self.error_threshold
+            )
+            if throttled or overloaded:
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.ceiling = self.rate
+                    self.rate = max(self.min_rate, self.rate * self.backoff)
+                    self.limit = max(float(self.min_concurrency), self.limit * self.backoff)
+                    logging.info(f'请求受限 速率降为{self.rate:.1f}/s 并发{int(self.limit)}')
+            elif not failed:
+                self.successes += 1
+                slow = False
+                if latency is not None:
+                    self.base_latency = latency if self.base_latency is None else min(self.base_latency, latency)
+                    self.avg_latency = latency if self.avg_latency is None else self.avg_latency * 0.9 + latency * 0.1
+                    slow = self.avg_latency > self.base_latency * self.latency_tolerance
+                if slow or now - self._last_saturated > 1:
+                    # 延迟上升说明接近主机的承受能力; 没有请求在等待说明瓶颈不在限流; 都保持当前速率
+                    pass
+                elif self.ceiling is None or self.rate >= self.ceiling:
+                    self.rate = min(self.max_rate, self.rate + 1)
+                    self.limit = min(float(self.max_concurrency), self.limit + 1)
+                else:
+                    # 每秒约有rate次成功，每次增加increase/rate
+                    self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+                    self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                'rate': self.rate,
+                'concurrency': int(self.limit),
+                'ceiling': self.ceiling,
+                'in_flight': self.in_flight,
+                'avg_latency': self.avg_latency,
+                'base_latency': self.base_latency,
+                'successes': self.successes,
+                'throttled': self.throttled,
+                'errors': self.errors,
+            }
+
+
+class _LimiterSlot:
+    """一次请求占用的名额，用于with语句"""
+
+    def __init__(self, limiter: AdaptiveHostLimiter):
+        self.limiter = limiter
+        self.status: Optional[int] = None
+        self.retry_after: Optional[float] = None
+        self._start = 0.0
+
+    def record(self, status: int, headers: Optional[dict] = None) -> None:
+        """记录响应状态码，headers中的Retry-After会被采用"""
+        self.status = status
+        value = (headers or {}).get('Retry-After')
+        if value and str(value).isdigit():
+            self.retry_after = float(value)
+
+    def __enter__(self):
+        self.limiter.acquire()
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter.release(
+            status=self.status,
+            latency=time.monotonic() - self._start,
+            error=exc_type is not None and self.status is None,
+            retry_after=self.retry_after,
+        )
+        return False
+
+    async def __aenter__(self):
+        await self.limiter.acquire_async()
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class _UnlimitedSlot:
+    """未启用限流时使用的名额，不做任何限制"""
+
+    def record(self, status: int, headers: Optional[dict] = None) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+UNLIMITED = _UnlimitedSlot()
+
+
+class RateLimiter:
+    """
+    按主机划分的自适应限流器
+
+    用法:
+        limiter = RateLimiter(rate=20, concurrency=4)
+        with limiter.slot(url) as slot:
+            response = session.get(url)
+            slot.record(response.status_code, response.headers)
+    """
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: 每个主机的AdaptiveHostLimiter参数
+        """
+        self.kwargs = kwargs
+        self.hosts: dict[str, AdaptiveHostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> AdaptiveHostLimiter:
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self.hosts.get(host)
+            if limiter is None:
+                limiter = self.hosts[host] = AdaptiveHostLimiter(**self.kwargs)
+            return limiter
+
+    def slot(self, url: str) -> _LimiterSlot:
+        return _LimiterSlot(self.get(url))
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            hosts = dict(self.hosts)
+        return {host: limiter.snapshot() for host, limiter in hosts.items()}
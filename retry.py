@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+
+class IncompleteDownload(IOError):
+    """收到的数据少于Content-Length，可以重试(续传)"""
+
+
+class CircuitOpenError(RuntimeError):
+    """主机熔断中，请求未发出"""
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """从requests/aiohttp的异常中取出HTTP状态码"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """异常对应响应中的Retry-After(秒)"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    return float(value) if value and str(value).isdigit() else None
+
+
+class RetryBudget:
+    """
+    一项任务(如一个章节)的重试预算
+
+    所有页面共用，预算用完后失败的页面不再重试，
+    避免主机持续出错时每一页都重试到上限。
+    """
+
+    def __init__(self, max_retries: int):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def spend(self) -> bool:
+        """消耗一次重试，预算不足时返回False"""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            return self.max_retries - self.used
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器
+
+    - closed: 正常放行，连续失败failure_threshold次后打开
+    - open: 直接拒绝请求，reset_timeout秒后进入half_open
+    - half_open: 只放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        :param failure_threshold: 打开前允许的连续失败次数
+        :param reset_timeout: (单位: s) 打开后多久允许试探
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0  # 打开的次数
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self) -> None:
+        """
+        请求前调用
+
+        :raises CircuitOpenError: 熔断中
+        """
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return
+            wait = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            raise CircuitOpenError(f'主机熔断中 {wait:.0f}s后重试')
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != 'closed':
+                logging.info('主机已恢复 熔断关闭')
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or (
+                self.state == 'closed' and self.failures >= self.failure_threshold
+            ):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logging.error(f'连续失败{self.failures}次 熔断{self.reset_timeout:.0f}s')
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'opened': self.opened}
+
+
+class CircuitBreakers:
+    """按主机划分的熔断器"""
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: 每个主机的CircuitBreaker参数
+        """
+        self.kwargs = kwargs
+        self.hosts: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self.hosts.get(host)
+            if breaker is None:
+                breaker = self.hosts[host] = CircuitBreaker(**self.kwargs)
+            return breaker
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            hosts = dict(self.hosts)
+        return {host: breaker.snapshot() for host, breaker in hosts.items()}
+
+
+class RetryPolicy:
+    """
+    指数退避+随机抖动的重试策略
+
+    第n次重试前等待 uniform(0, min(max_delay, base_delay * 2**n)) 秒(full jitter)，
+    服务器给出Retry-After时至少等待该时间。
+    只重试retryable判定为临时性的错误; 只有临时性错误计入熔断器的失败次数，
+    429和其他错误(如404)说明主机在线，视为成功。
+    """
+
+    def __init__(
+        self,
+        retryable: Callable[[BaseException], bool],
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        """
+        :param retryable: 判断异常是否值得重试
+        :param max_attempts: 包括第一次在内的最多尝试次数
+        :param base_delay: (单位: s) 第一次重试的最长等待
+        :param max_delay: (单位: s) 单次等待的上限
+        """
+        self.retryable = retryable
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def using(self, retryable: Callable[[BaseException], bool]) -> 'RetryPolicy':
+        """退避参数相同、错误判断不同的策略"""
+        return RetryPolicy(retryable, self.max_attempts, self.base_delay, self.max_delay)
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """第attempt次(从0开始)重试前的等待时间"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        server = retry_after(error) if error is not None else None
+        return max(delay, min(server, self.max_delay)) if server else delay
+
+    def _should_retry(
+        self,
+        error: BaseException,
+        attempt: int,
+        budget: Optional[RetryBudget],
+        breaker: Optional[CircuitBreaker],
+    ) -> bool:
+        retryable = self.retryable(error)
+        if breaker:
+            # 非临时性错误和429说明主机能正常响应
+            if retryable and http_status(error) != 429:
+                breaker.failure()
+            else:
+                breaker.success()
+        if not retryable:
+            return False
+        return attempt + 1 < self.max_attempts and (budget is None or budget.spend())
+
+    def call(
+        self,
+        func: Callable,
+        *args,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        describe: str = '',
+        **kwargs,
+    ):
+        """
+        执行func，临时性错误时按策略重试
+
+        :param budget: 任务的重试预算
+        :param breaker: 目标主机的熔断器，熔断中直接抛出CircuitOpenError
+        :param describe: 日志中的操作名称
+        """
+        attempt = 0
+        while True:
+            if breaker:
+                breaker.before()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, budget, breaker):
+                    raise
+                delay = self.delay(attempt, e)
+                attempt += 1
+                logging.info(f'{describe} 第{attempt}次重试 {delay:.1f}s后:\t{str(e) or type(e).__name__}')
+                time.sleep(delay)
+                continue
+            if breaker:
+                breaker.success()
+            return result
+
+    async def call_async(
+        self,
+        func: Callable,
+        *args,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        describe: str = '',
+        **kwargs,
+    ):
+        """call的asyncio版本，func为协程函数"""
+        attempt = 0
+        while True:
+            if breaker:
+                breaker.before()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, budget, breaker):
+                    raise
+                delay = self.delay(attempt, e)
+                attempt += 1
+                logging.info(f'{describe} 第{attempt}次重试 {delay:.1f}s后:\t{str(e) or type(e).__name__}')
+                await asyncio.sleep(delay)
+                continue
+            if breaker:
+                breaker.success()
+            return result
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zipfile
+from typing import Optional, Tuple
+
+from cache import SQLiteStore
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件的sha256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class PageManifest:
+    """
+    章节目录中记录已完成页面的清单(.pages.jsonl)
+
+    每页记录URL、大小和sha256，只有下载完整并改名后才会写入，
+    重新运行时据此跳过已完成的页面。
+    清单只追加不改写，每完成一页追加一行，后写入的记录覆盖同名的旧记录；
+    中断时最多留下不完整的最后一行，读取时忽略。
+    旧版本整体改写的.pages.json会被读入并转换为.pages.jsonl。
+    """
+
+    FILE_NAME = '.pages.jsonl'
+    LEGACY_FILE_NAME = '.pages.json'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILE_NAME)
+        self._lock = threading.Lock()
+        self.pages: dict[str, dict] = {}
+        self._broken_tail = False  # 最后一行不完整，下次追加前先换行
+        legacy = self._load_legacy()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    self._broken_tail = not line.endswith('\n')
+                    try:
+                        page = json.loads(line)
+                        self.pages[page.pop('name')] = page
+                    except Exception:
+                        logging.warning(f'页面清单中有损坏的记录 已忽略: {self.path}')
+        if legacy:
+            self._migrate_legacy()
+
+    def _load_legacy(self) -> bool:
+        """读入旧版本的.pages.json，返回是否存在旧清单"""
+        legacy = os.path.join(self.directory, self.LEGACY_FILE_NAME)
+        if not os.path.exists(legacy):
+            return False
+        try:
+            with open(legacy, encoding='utf-8') as f:
+                self.pages.update(json.load(f))
+        except Exception as e:
+            logging.warning(f'页面清单损坏 已忽略: {legacy}\t{e}')
+        return True
+
+    def _migrate_legacy(self) -> None:
+        """把合并后的记录整体写入.pages.jsonl再删除旧清单，中途中断时下次重新转换"""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for name, page in self.pages.items():
+                f.write(json.dumps(dict(page, name=name), ensure_ascii=False) + '\n')
+        os.replace(tmp, self.path)
+        self._broken_tail = False
+        os.remove(os.path.join(self.directory, self.LEGACY_FILE_NAME))
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return self.pages.get(name)
+
+    def is_complete(self, name: str, url: str, path: str, verify: bool = False) -> bool:
+        """
+        判断页面是否已经完整下载
+
+        :param verify: 是否重新计算sha256校验，否则只比较大小
+        """
+        page = self.get(name)
+        if not page or page.get('url') != url:
+            return False
+        try:
+            if os.path.getsize(path) != page['size']:
+                return False
+        except OSError:
+            return False
+        return not verify or file_sha256(path) == page['sha256']
+
+    def record(self, name: str, url: str, size: int, sha256: str) -> None:
+        page = {'url': url, 'size': size, 'sha256': sha256}
+        line = json.dumps(dict(page, name=name), ensure_ascii=False) + '\n'
+        with self._lock:
+            self.pages[name] = page
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if self._broken_tail:
+                    f.write('\n')
+                    self._broken_tail = False
+                f.write(line)
+
+
+class ContentStore(SQLiteStore):
+    """
+    按内容寻址的图片仓库
+
+    每张图片按sha256只保存一份(root/objects/ab/abcdef...)，章节目录中的文件
+    是指向仓库对象的硬链接，文件系统不支持硬链接时退化为复制。
+    index.db记录 URL -> sha256，已知的URL不需要再访问网络。
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: 仓库根目录
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        super().__init__(os.path.join(root, 'index.db'))
+
+    def _init_tables(self) -> None:
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS url_index (url TEXT PRIMARY KEY, sha256 TEXT, size INTEGER)'
+        )
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def lookup(self, url: str) -> Optional[Tuple[str, int]]:
+        """
+        :return: 已知URL对应的(sha256, 大小)，对象不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT sha256, size FROM url_index WHERE url=?', (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.object_path(row[0])):
+            return None
+        return row[0], row[1]
+
+    def add(self, path: str, sha256: str, url: Optional[str] = None) -> str:
+        """
+        把下载完成的文件收入仓库，已有相同内容时直接删除该文件
+
+        :return: 仓库中对象的路径
+        """
+        target = self.object_path(sha256)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        size = os.path.getsize(path)
+        if os.path.exists(target):
+            os.remove(path)
+            logging.debug(f'重复图片 {sha256[:12]} 已去重')
+        else:
+            os.replace(path, target)
+        self._index_url(url, sha256, size)
+        return target
+
+    def materialize(self, sha256: str, dest: str) -> None:
+        """在dest处生成指向仓库对象的硬链接"""
+        source = self.object_path(sha256)
+        tmp = dest + '.link'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(source, tmp)
+        except OSError:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+
+    def stats(self) -> dict:
+        """仓库中的对象数量、占用空间和已索引的URL数量"""
+        count = size = 0
+        for directory, _, files in os.walk(self.objects_dir):
+            for name in files:
+                count += 1
+                size += os.path.getsize(os.path.join(directory, name))
+        with self._lock:
+            urls = self._conn.execute('SELECT COUNT(*) FROM url_index').fetchone()[0]
+        return {'objects': count, 'bytes': size, 'urls': urls}
+
+    def read(self, sha256: str) -> bytes:
+        with open(self.object_path(sha256), 'rb') as f:
+            return f.read()
+
+    def add_bytes(self, data: bytes, sha256: str, url: Optional[str] = None) -> str:
+        """把内存中的图片收入仓库"""
+        target = self.object_path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f'{target}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, target)
+        self._index_url(url, sha256, len(data))
+        return target
+
+    def _index_url(self, url: Optional[str], sha256: str, size: int) -> None:
+        if url:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO url_index VALUES (?, ?, ?)', (url, sha256, size)
+                )
+
+
+def archive_is_empty(path: str) -> bool:
+    """cbz中没有任何页面(或无法读取)"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return not archive.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return True
+
+
+class CBZWriter:
+    """
+    边下载边写入的章节CBZ
+
+    页面按页码顺序写入压缩包，提前到达的页面暂存在内存中；
+    暂存超过max_pending字节时不再等待，直接写入页码最小的暂存页
+    (文件名仍按页码编号，阅读器按文件名排序)，整个章节不会同时留在内存里。
+    写入过程中使用.part文件，全部完成后才改名为.cbz。
+    """
+
+    def __init__(self, path: str, max_pending: int = 32 * 1024 * 1024, ext: str = '.jpg'):
+        """
+        :param path: 输出的cbz路径
+        :param max_pending: 乱序页面最多暂存的字节数
+        :param ext: 页面文件扩展名
+        """
+        self.path = path
+        self.part = path + '.part'
+        self.max_pending = max_pending
+        self.ext = ext
+        self.pages = 0
+        self._lock = threading.Lock()
+        self._next = 1
+        self._pending: dict[int, bytes] = {}
+        self._pending_bytes = 0
+        self._skipped: set[int] = set()
+        self._written: set[int] = set()  # 提前(不按顺序)写入的页码
+        # jpg已经是压缩格式，直接存储
+        self._zip = zipfile.ZipFile(self.part, 'w', zipfile.ZIP_STORED)
+
+    def add_page(self, index: int, data: bytes) -> None:
+        """
+        :param index: 页码(从1开始)
+        """
+        with self._lock:
+            self._pending[index] = data
+            self._pending_bytes += len(data)
+            self._flush()
+
+    def skip_page(self, index: int) -> None:
+        """该页不会到达(下载失败)，不再等待它"""
+        with self._lock:
+            self._skipped.add(index)
+            self._flush()
+
+    def _flush(self) -> None:
+        while True:
+            if self._next in self._pending:
+                self._write(self._next)
+            elif self._next not in self._skipped and self._next not in self._written:
+                break
+            # 已经越过的页码不再需要记录
+            self._skipped.discard(self._next)
+            self._written.discard(self._next)
+            self._next += 1
+        while self._pending_bytes > self.max_pending:
+            self._write(min(self._pending))
+
+    def _write(self, index: int) -> None:
+        data = self._pending.pop(index)
+        self._pending_bytes -= len(data)
+        if index > self._next:
+            self._written.add(index)
+        info = zipfile.ZipInfo(f'{index:03d}{self.ext}', date_time=time.localtime()[:6])
+        self._zip.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+        self.pages += 1
+
+    def close(self) -> None:
+        """写入剩余页面并生成最终的cbz"""
+        with self._lock:
+            for index in sorted(self._pending):
+                self._write(index)
+            self._zip.close()
+        os.replace(self.part, self.path)
+
+    def abort(self) -> None:
+        """放弃写入并删除未完成的文件"""
+        with self._lock:
+            self._pending.clear()
+            self._pending_bytes = 0
+            self._zip.close()
+        if os.path.exists(self.part):
+            os.remove(self.part)
+
+
+def archive_page_sizes(path: str) -> dict[int, int]:
+    """cbz中每一页的大小 {页码: 字节数}，无法读取时返回空字典"""
+    sizes = {}
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                stem = os.path.splitext(info.filename)[0]
+                if stem.isdigit():
+                    sizes[int(stem)] = info.file_size
+    except (OSError, zipfile.BadZipFile):
+        pass
+    return sizes
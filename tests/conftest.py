@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 项目是平铺的模块，不是包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def serve_handler():
+    """
+    在本地启动HTTP服务器，返回 serve(handler_class) -> 根地址
+
+    handler_class: BaseHTTPRequestHandler的子类，用于模拟限流、断流等服务器行为
+    """
+    servers = []
+
+    def serve(handler_class: type[BaseHTTPRequestHandler]) -> str:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """不在测试输出中打印访问日志"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, data: bytes, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def serve_pages(serve_handler):
+    """
+    在本地启动HTTP服务器，返回 serve(pages) -> 根地址
+
+    pages: {路径: (状态码, 正文)}，正文为str或bytes，未列出的路径返回404
+    """
+
+    def serve(pages: dict[str, tuple[int, str | bytes]]) -> str:
+        class Handler(QuietHandler):
+            def do_GET(self):
+                status, body = pages.get(self.path, (404, 'not found'))
+                data = body.encode('utf-8') if isinstance(body, str) else body
+                self.send_body(status, data, {'Content-Type': 'text/html; charset=utf-8'})
+
+        return serve_handler(Handler)
+
+    return serve
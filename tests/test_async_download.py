@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+import asyncDownload
+from conftest import QuietHandler
+
+
+def counting_handler(delay: float, missing: set[str] = frozenset()):
+    """每个请求等待delay秒，记录同时处理的最大请求数"""
+    state = {'active': 0, 'peak': 0, 'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            with lock:
+                state['active'] += 1
+                state['requests'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            try:
+                time.sleep(delay)
+                if self.path in missing:
+                    self.send_body(404, b'not found')
+                else:
+                    self.send_body(200, self.path.encode() * 100)
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+    return Handler, state
+
+
+def test_async_downloader_bounds_concurrency(tmp_path, serve_handler):
+    handler, state = counting_handler(0.05)
+    base = serve_handler(handler)
+    urls = [f'{base}/{i}.jpg' for i in range(20)]
+
+    downloader = asyncDownload.AsyncDownloader(max_concurrency=4, timeout=5)
+    results = downloader.run(asyncDownload.build_pages(str(tmp_path), urls))
+
+    assert [x.index for x in results] == list(range(1, 21))
+    assert all(x.success for x in results)
+    assert state['requests'] == 20
+    assert 1 < state['peak'] <= 4
+    for i, result in enumerate(results):
+        with open(result.path, 'rb') as f:
+            assert f.read() == f'/{i}.jpg'.encode() * 100
+
+
+def test_async_downloader_reports_failed_pages(tmp_path, serve_handler):
+    handler, state = counting_handler(0, missing={'/2.jpg'})
+    base = serve_handler(handler)
+    urls = [f'{base}/{i}.jpg' for i in range(1, 4)]
+    reported = []
+
+    downloader = asyncDownload.AsyncDownloader(max_concurrency=2, timeout=5, callback=reported.append)
+    results = downloader.run(asyncDownload.build_pages(str(tmp_path), urls))
+
+    assert [x.success for x in results] == [True, False, True]
+    assert '404' in results[1].error
+    assert state['requests'] == 3  # 404不是临时性错误，不重试
+    assert sorted(x.index for x in reported) == [1, 2, 3]
+    assert not (tmp_path / '002.jpg').exists()
+
+
+def resumable_handler(data: bytes, cut: int, pause: float):
+    """第一次请求只发送前cut字节，等待pause秒后断开连接，之后的请求按Range正常返回"""
+    ranges = []
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            ranges.append(self.headers.get('Range'))
+            if len(ranges) > 1:
+                start = int(self.headers['Range'][len('bytes='):-1]) if self.headers.get('Range') else 0
+                headers = {'Content-Range': f'bytes {start}-{len(data) - 1}/{len(data)}'} if start else {}
+                self.send_body(206 if start else 200, data[start:], headers)
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            for i in range(0, cut, 16 * 1024):
+                self.wfile.write(data[i:min(cut, i + 16 * 1024)])
+            self.wfile.flush()
+            time.sleep(pause)
+            self.close_connection = True
+
+    return Handler, ranges
+
+
+def download_interrupted(tmp_path, serve_handler, cut: int, pause: float):
+    data = bytes(range(256)) * 1200
+    handler, ranges = resumable_handler(data, cut, pause)
+    base = serve_handler(handler)
+
+    downloader = asyncDownload.AsyncDownloader(max_concurrency=1, timeout=5)
+    result, = downloader.run(asyncDownload.build_pages(str(tmp_path), [base + '/big.jpg']))
+
+    assert result.success and result.size == len(data)
+    assert (tmp_path / '001.jpg').read_bytes() == data
+    assert not (tmp_path / '001.jpg.part').exists()
+    return ranges
+
+
+@pytest.mark.parametrize('cut', [1, 100 * 1024, 299 * 1024])
+def test_async_downloader_resumes_from_received_bytes(tmp_path, serve_handler, cut):
+    # 断开前已读到的数据都写入了.part，重试只请求剩余部分
+    assert download_interrupted(tmp_path, serve_handler, cut, 0.2) == [None, f'bytes={cut}-']
+
+
+@pytest.mark.parametrize('cut', [1, 100 * 1024, 299 * 1024])
+def test_async_downloader_resume_is_best_effort(tmp_path, serve_handler, cut):
+    # 数据和断开同时到达时，aiohttp缓冲区中尚未读取的部分会丢失，
+    # 续传从.part中实际写入的位置开始，结果仍然完整
+    ranges = download_interrupted(tmp_path, serve_handler, cut, 0)
+    assert len(ranges) == 2 and ranges[0] is None
+    assert ranges[1] is None or 0 < int(ranges[1][len('bytes='):-1]) <= cut
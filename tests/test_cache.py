@@ -0,0 +1,71 @@
+import types
+
+import pytest
+
+import cache
+import getData
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_search_cache_ttl(clock):
+    store = cache.SearchCache(':memory:', ttl=100, negative_ttl=10)
+    store.put('One  Piece', {'title': 'ONE PIECE', 'comic_id': '1'})
+    assert store.get('one piece') == (True, {'title': 'ONE PIECE', 'comic_id': '1'})
+    clock[0] += 99
+    assert store.get('One Piece')[0]
+    clock[0] += 2
+    assert store.get('One Piece') == (False, None)
+
+
+def test_search_cache_negative_ttl(clock):
+    store = cache.SearchCache(':memory:', ttl=100, negative_ttl=10)
+    store.put('missing', None)
+    assert store.get('missing') == (True, None)
+    clock[0] += 11
+    assert store.get('missing') == (False, None)
+
+
+def test_search_cache_lru_eviction(clock):
+    store = cache.SearchCache(':memory:', max_entries=2)
+    store.put('a', {'title': 'a'})
+    clock[0] += 1
+    store.put('b', {'title': 'b'})
+    clock[0] += 1
+    assert store.get('a')[0]  # a比b更近被访问
+    clock[0] += 1
+    store.put('c', {'title': 'c'})
+    assert store.get('a')[0]
+    assert not store.get('b')[0]
+    assert store.get('c')[0]
+
+
+def test_search_cache_key_matches_title_matching():
+    store = cache.SearchCache(':memory:')
+    store.put('ＯＮＥ　ＰＩＥＣＥ', {'title': 'ONE PIECE'})
+    assert store.get('one piece')[0]
+    assert getData.title_matches('ＯＮＥ　ＰＩＥＣＥ', 'One  Piece')
+    assert not getData.title_matches('one piece film', 'ONE PIECE')
+
+
+def chapters(cids):
+    return [{'cid': cid, 'title': cid.upper(), 'app': False} for cid in cids]
+
+
+def test_chapter_catalog_merge():
+    catalog = cache.ChapterCatalog(':memory:')
+    assert [x['cid'] for x in catalog.merge('1', chapters('abc'))] == ['a', 'b', 'c']
+    changed = catalog.merge('1', [{'cid': 'a', 'title': 'A', 'app': True}] + chapters('bcd'))
+    assert [x['cid'] for x in changed] == ['a', 'd']
+
+
+def test_chapter_catalog_removes_missing_chapters():
+    catalog = cache.ChapterCatalog(':memory:')
+    catalog.merge('1', chapters('abcd'))
+    catalog.merge('1', chapters('xbd'))
+    assert [x['cid'] for x in catalog.load('1')] == ['x', 'b', 'd']
@@ -0,0 +1,176 @@
+import json
+
+import pytest
+
+import cli
+import getData
+import lib
+
+
+class FakeDownloader:
+    """记录调用的ComicDownloader替身，不打开浏览器也不访问网络"""
+
+    def __init__(self, comics: dict, failing_pages: set = frozenset(), broken: set = frozenset()):
+        self.comics = comics  # 标题 -> 章节数
+        self.failing_pages = failing_pages  # 下载失败的(章节cid, 页码)
+        self.broken = broken  # 处理时抛出异常的标题
+        self.progress_callbacks = []
+        self.searches = []
+        self.refreshed = []
+        self.downloaded = []
+        self.closed = False
+
+    def search_comic(self, title, use_cache=True):
+        self.searches.append((title, use_cache))
+        if title in self.broken:
+            raise RuntimeError('浏览器崩溃')
+        if title not in self.comics:
+            return None
+        return getData.ComicData(title, str(len(self.searches)))
+
+    def get_chapters(self, comic):
+        return [getData.ChapterInfo(comic, f'第{i}话', f'{comic.title}-{i}') for i in range(1, self.comics[comic.title] + 1)]
+
+    def refresh_chapters(self, comic):
+        self.refreshed.append(comic.title)
+        return self.get_chapters(comic)[-1:]
+
+    def get_comic_urls(self, chapter):
+        return [f'http://img/{chapter.cid}/{i}' for i in range(1, 3)]
+
+    def download_chapter(self, chapter, urls=None):
+        self.downloaded.append(chapter.cid)
+        results = []
+        for i, url in enumerate(urls, 1):
+            result = getData.PageResult(index=i, url=url, path='', size=10)
+            result.success = (chapter.cid, i) not in self.failing_pages
+            results.append(result)
+            for callback in self.progress_callbacks:
+                callback(chapter, result)
+        return results
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def run(monkeypatch, capsys, tmp_path):
+    """run(downloader, *argv) -> (退出码, JSON事件列表)"""
+    monkeypatch.setattr(lib, 'LogSystem', lambda **kwargs: None)
+
+    def run(downloader, *argv):
+        monkeypatch.setattr(cli, 'build_downloader', lambda args: downloader)
+        status = cli.main(list(argv) + ['--cache', str(tmp_path / 'cache.db')])
+        events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        return status, events
+
+    return run
+
+
+@pytest.mark.parametrize('spec, expected', [
+    (None, [0, 1, 2, 3, 4]),
+    ('all', [0, 1, 2, 3, 4]),
+    ('2-3', [1, 2]),
+    ('1,3,5-7', [0, 2, 4]),
+    ('4-', [3, 4]),
+    ('-2', [3, 4]),
+    ('3,2-3', [2, 1]),
+    ('9', []),
+])
+def test_parse_range(spec, expected):
+    assert cli.parse_range(spec, 5) == expected
+
+
+@pytest.mark.parametrize('spec', ['0', '3-2', 'a-b', '1,,2'])
+def test_parse_range_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        cli.parse_range(spec, 5)
+
+
+def test_download_success(run):
+    downloader = FakeDownloader({'一人之下': 3})
+    status, events = run(downloader, 'download', '--title', '一人之下', '--chapters', '2-3')
+    assert status == cli.EXIT_OK
+    assert downloader.downloaded == ['一人之下-2', '一人之下-3']
+    assert downloader.searches == [('一人之下', True)]
+    assert downloader.closed
+    done = events[-1]
+    assert done['event'] == 'done' and done['pages_ok'] == 4 and done['pages_failed'] == 0
+    assert [x['done'] for x in events if x['event'] == 'page'] == [1, 2, 1, 2]
+
+
+def test_download_page_failure_is_partial(run):
+    downloader = FakeDownloader({'a': 2}, failing_pages={('a-1', 2)})
+    status, events = run(downloader, 'download', '--title', 'a')
+    assert status == cli.EXIT_PARTIAL
+    assert events[-1]['pages_failed'] == 1 and events[-1]['chapters_failed'] == 1
+
+
+def test_download_not_found(run):
+    status, events = run(FakeDownloader({'a': 1}), 'download', '--title', 'a', '--title', 'missing')
+    assert status == cli.EXIT_NOT_FOUND
+    assert events[-1]['not_found'] == ['missing']
+
+
+def test_download_title_error_continues(run):
+    downloader = FakeDownloader({'a': 1, 'b': 1}, broken={'a'})
+    status, events = run(downloader, 'download', '--title', 'a', '--title', 'b')
+    assert status == cli.EXIT_PARTIAL
+    assert downloader.downloaded == ['b-1']
+    assert events[-1]['failed_titles'] == ['a']
+
+
+def test_downloader_error(monkeypatch, capsys):
+    def fail(args):
+        raise RuntimeError('浏览器无法启动')
+
+    monkeypatch.setattr(lib, 'LogSystem', lambda **kwargs: None)
+    monkeypatch.setattr(cli, 'build_downloader', fail)
+    assert cli.main(['search', '--title', 'a']) == cli.EXIT_ERROR
+    assert json.loads(capsys.readouterr().out)['error'] == '浏览器无法启动'
+
+
+@pytest.mark.parametrize('no_cache', [False, True])
+def test_new_searches_without_cache(run, no_cache):
+    downloader = FakeDownloader({'a': 3})
+    argv = ['download', '--title', 'a', '--new'] + (['--no-cache'] if no_cache else [])
+    status, events = run(downloader, *argv)
+    assert status == cli.EXIT_OK
+    # 缓存的搜索结果中update_time可能已过期，--new必须重新搜索
+    assert downloader.searches == [('a', False)]
+    assert downloader.refreshed == ['a']
+    assert downloader.downloaded == ['a-3']
+
+
+def test_search_and_chapters_commands(run):
+    status, events = run(FakeDownloader({'a': 2}), 'search', '--title', 'a', '--title', 'b')
+    assert status == cli.EXIT_NOT_FOUND
+    assert [x['found'] for x in events] == [True, False]
+
+    status, events = run(FakeDownloader({'a': 2}), 'chapters', '--title', 'a')
+    assert status == cli.EXIT_OK
+    assert [x['number'] for x in events if x['event'] == 'chapter_info'] == [1, 2]
+
+
+@pytest.mark.parametrize('argv', [
+    ['download'],
+    ['download', '--title', 'a', '--chapters', '5-1'],
+    ['download', '--title', 'a', '--log-level', 'verbose'],
+    ['download', '--title', 'a', '--titles-file', 'missing.txt'],
+])
+def test_usage_errors(run, argv):
+    with pytest.raises(SystemExit) as error:
+        run(FakeDownloader({}), *argv)
+    assert error.value.code == cli.EXIT_USAGE
+
+
+def test_build_downloader_keeps_catalog_with_no_cache(tmp_path):
+    args = cli.build_parser().parse_args(
+        ['download', '--title', 'a', '--no-cache', '--cache', str(tmp_path / 'c.db'), '--output', str(tmp_path)]
+    )
+    downloader = cli.build_downloader(args)
+    try:
+        assert downloader.chapter_catalog is not None
+        assert downloader.image_manifest_max_age == 0
+    finally:
+        downloader.close()
@@ -0,0 +1,171 @@
+import os
+
+import pytest
+
+import getData
+from conftest import QuietHandler
+
+PAGES = {f'/img/{i}.jpg': (200, bytes([i]) * (1000 + i)) for i in range(1, 4)}
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    downloader = getData.ComicDownloader(
+        init_webdrivers=False,
+        download_path=str(tmp_path / 'download'),
+        cache_path=None,
+        timeout=5,
+        max_retries=0,
+    )
+    yield downloader
+    downloader.close()
+
+
+def chapter(cid: str) -> getData.ChapterInfo:
+    return getData.ChapterInfo(getData.ComicData('示例漫画', '505430'), '第' + cid + '话', cid)
+
+
+def page_urls(base: str) -> list[str]:
+    return [base + path for path in PAGES]
+
+
+@pytest.mark.parametrize('backend', ['thread', 'async'])
+def test_download_chapters_isolates_failed_chapter(downloader, serve_pages, backend):
+    base = serve_pages(PAGES)
+
+    def get_comic_urls(chapter):
+        if chapter.cid == '2':
+            raise RuntimeError('解析失败')
+        return page_urls(base)
+
+    downloader.get_comic_urls = get_comic_urls
+    output = downloader.download_chapters([chapter('1'), chapter('2'), chapter('3')], backend=backend)
+
+    for cid in ('1', '3'):
+        assert [x.index for x in output[cid]] == [1, 2, 3]
+        assert all(x.success and x.size == 1000 + x.index for x in output[cid])
+        assert all(os.path.getsize(x.path) == x.size for x in output[cid])
+    failed, = output['2']
+    assert failed.index == 0 and not failed.success and failed.error == '解析失败'
+
+
+@pytest.mark.parametrize('backend', ['thread', 'async'])
+def test_page_manifest_released_after_chapter(downloader, serve_pages, backend):
+    base = serve_pages(PAGES)
+    results = downloader.download_chapter(chapter('1'), page_urls(base), backend=backend)
+    assert all(x.success for x in results)
+    assert downloader._page_manifests == {}
+
+    # 清单已写入磁盘，重新下载时仍然跳过已完成的页面
+    results = downloader.download_chapter(chapter('1'), page_urls(base), backend=backend)
+    assert all(x.skipped for x in results)
+    assert downloader._page_manifests == {}
+
+
+def range_handler(data: bytes, mode: str = 'honor'):
+    """mode: honor 按Range返回206，ignore 忽略Range返回200，reject 对Range返回416"""
+    ranges = []
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            ranges.append(self.headers.get('Range'))
+            start = int(self.headers['Range'][len('bytes='):-1]) if self.headers.get('Range') else 0
+            if not start or mode == 'ignore':
+                self.send_body(200, data)
+            elif mode == 'reject':
+                self.send_body(416, b'', {'Content-Range': f'bytes */{len(data)}'})
+            else:
+                self.send_body(206, data[start:], {'Content-Range': f'bytes {start}-{len(data) - 1}/{len(data)}'})
+
+    return Handler, ranges
+
+
+@pytest.mark.parametrize('mode, part, expected_ranges', [
+    ('honor', bytes(range(100)), ['bytes=100-']),
+    ('ignore', bytes(range(100)), ['bytes=100-']),
+    ('reject', b'stale' * 100, ['bytes=500-', None]),
+])
+def test_download_resumes_part_file(downloader, serve_handler, mode, part, expected_ranges):
+    data = bytes(range(256)) * 40
+    handler, ranges = range_handler(data, mode)
+    base = serve_handler(handler)
+    target = chapter('1')
+    directory = downloader._get_chapter_dir(target)
+    os.makedirs(directory)
+    with open(os.path.join(directory, '001.jpg.part'), 'wb') as f:
+        f.write(part)
+
+    assert downloader.download(target, '001', base + '/1.jpg') == len(data)
+    assert ranges == expected_ranges
+    with open(os.path.join(directory, '001.jpg'), 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(os.path.join(directory, '001.jpg.part'))
+    assert downloader._get_page_manifest(directory).get('001')['size'] == len(data)
+
+
+@pytest.mark.parametrize('backend', ['thread', 'async'])
+def test_content_store_shares_pages_between_chapters(tmp_path, serve_handler, backend):
+    requests_seen = []
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            self.send_body(200, b'cover' if self.path.startswith('/cover') else self.path.encode())
+
+    base = serve_handler(Handler)
+    downloader = getData.ComicDownloader(
+        init_webdrivers=False,
+        download_path=str(tmp_path / 'download'),
+        cache_path=None,
+        timeout=5,
+        max_retries=0,
+        content_store=True,
+    )
+    try:
+        # 两个章节共用同一张封面(URL不同)，第2章的第2页与第1章相同(URL相同)
+        first = downloader.download_chapter(chapter('1'), [base + '/cover?1', base + '/p1'], backend=backend)
+        second = downloader.download_chapter(chapter('2'), [base + '/cover?2', base + '/p1'], backend=backend)
+        stats = downloader.content_store.stats()
+    finally:
+        downloader.close()
+
+    assert all(x.success for x in first + second)
+    assert stats['objects'] == 2 and stats['urls'] == 3
+    assert requests_seen.count('/p1') == 1  # 已知URL直接链接，不访问网络
+    assert os.path.samefile(first[0].path, second[0].path)
+    with open(second[1].path, 'rb') as f:
+        assert f.read() == b'/p1'
+
+
+@pytest.mark.parametrize('mode', ['thread', 'async', 'pipeline'])
+def test_skipped_archive_keeps_recorded_sizes(tmp_path, serve_pages, mode):
+    base = serve_pages(PAGES)
+    urls = page_urls(base)
+    downloader = getData.ComicDownloader(
+        init_webdrivers=False,
+        download_path=str(tmp_path / 'download'),
+        cache_path=str(tmp_path / 'cache.db'),
+        timeout=5,
+        max_retries=0,
+        output_format='cbz',
+    )
+    target = chapter('1')
+
+    def download():
+        if mode == 'pipeline':
+            return downloader.download_chapters_pipelined([target])['1']
+        return downloader.download_chapter(target, backend=mode)
+
+    try:
+        downloader.image_manifest.put('505430', '1', urls)
+        assert all(x.success and not x.skipped for x in download())
+        sizes = [1000 + i for i in range(1, 4)]
+        assert downloader.image_manifest.get('505430', '1')['sizes'] == sizes
+
+        # 压缩包已存在时跳过，大小取自压缩包，不能用0覆盖已记录的大小
+        skipped = download()
+        assert all(x.skipped for x in skipped)
+        assert [x.size for x in skipped] == sizes
+        assert downloader.image_manifest.get('505430', '1')['sizes'] == sizes
+    finally:
+        downloader.close()
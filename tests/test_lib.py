@@ -0,0 +1,213 @@
+import threading
+import time
+
+import pytest
+
+import getData
+import lib
+from conftest import read_fixture
+
+NESTED = (
+    '<div class="wrap"><ul class="list">'
+    '<li class="item first"><a class="link" href="/a">A</a></li>'
+    '<li class="item"><a class="link" href="/b">B<span>!</span></a></li>'
+    '<li class="item"><img class="pic" src="c.jpg"/></li>'
+    '</ul></div>'
+)
+
+
+# 正则模式按单词匹配class(comic-pic也会匹配comic-pic-list)，索引模式按完整class名匹配，
+# 正则模式也不认识不带/的void标签(<img ...>)，这里只比较两者都没有歧义的情况
+@pytest.mark.parametrize('source, class_name', [
+    (NESTED, 'item'),
+    (NESTED, 'link'),
+    (NESTED, 'pic'),
+    (NESTED, 'missing'),
+    (read_fixture('chapter.html'), 'chapter-title'),
+    (read_fixture('chapter.html'), 'chapter-next'),
+    (read_fixture('chapter.html'), 'preload'),
+], ids=lambda x: x if len(x) < 20 else 'page')
+def test_indexed_parser_matches_regex_parser(source, class_name):
+    plain = lib.HTMLParser(source).find_elements_by_class_name(class_name)
+    indexed = lib.HTMLParser(source, indexed=True).find_elements_by_class_name(class_name)
+    assert [x.outerHTML for x in indexed] == [x.outerHTML for x in plain]
+    for a, b in zip(plain, indexed):
+        for attr in ('href', 'src', 'data-src', 'innerText', 'innerHTML'):
+            assert b.get_attribute(attr) == a.get_attribute(attr)
+
+
+def test_indexed_parser_matches_whole_class_names():
+    source = read_fixture('chapter.html')
+    indexed = lib.HTMLParser(source, indexed=True).find_elements_by_class_name('comic-pic')
+    assert len(indexed) == 13
+    # <img>是void标签，不会延伸到之后的内容
+    assert all(x.outerHTML.startswith('<img') and '</' not in x.outerHTML for x in indexed)
+    assert len(lib.HTMLParser(source, indexed=True).find_elements_by_class_name('comic-pic-item')) == 13
+
+
+def test_indexed_parser_nested_lookup():
+    root = lib.HTMLParser(NESTED, indexed=True)
+    items = root.find_elements_by_class_name('item')
+    assert [x.find_element_by_class_name('link').get_attribute('href') if x.find_element_by_class_name('link') else None
+            for x in items] == ['/a', '/b', None]
+    assert root.find_element_by_class_name('list').get_attribute('innerText') == 'AB!'
+
+
+def test_indexed_parser_returns_views_of_the_page():
+    source = read_fixture('chapter.html')
+    root = lib.HTMLParser(source, indexed=True)
+    first = root.find_element_by_class_name('comic-pic')
+    # 子元素共用整页源码，只在读取outerHTML时切片
+    assert first._source is root._source
+    assert root._source[first._start:first._end] == first.outerHTML
+    assert not hasattr(first, '__dict__')
+
+
+BING_PAGE = ''.join(
+    f'<li><a href="https://ac.qq.com/Comic/comicInfo/id/{500000 + i}?from=bing" h="ID=SERP,{i}">漫画{i}</a></li>'
+    for i in range(20)
+) + '<a href="https://ac.qq.com/Comic/comicInfo/id/500000?from=bing" h="ID=SERP,dup">重复</a>'
+
+
+@pytest.mark.parametrize('source', [read_fixture('chapter.html'), BING_PAGE, '', 'no match here'])
+@pytest.mark.parametrize('extractor', [getData.IMAGE_EXTRACTOR, getData.BING_EXTRACTOR])
+def test_string_extractor_matches_find_string(extractor, source):
+    result = extractor.extract(source)
+    for name, spec in extractor.specs.items():
+        assert result[name] == lib.findString(source, *spec)
+
+
+def test_string_extractor_overlapping_specs():
+    extractor = lib.StringExtractor({'a': ('<b>', '</b>', 0, 0), 'b': ('<b>x', '</b>', 3, -4)})
+    source = '<b>x1</b><b>y</b><b>x2'
+    result = extractor.extract(source)
+    assert result['a'] == lib.findString(source, '<b>', '</b>')
+    assert result['b'] == lib.findString(source, '<b>x', '</b>', 3, -4)
+
+
+def block_scheduler(scheduler: lib.TaskScheduler, gate: threading.Event) -> None:
+    """占住所有工作线程直到gate被设置，让之后提交的任务排队"""
+    started = threading.Semaphore(0)
+
+    def hold():
+        started.release()
+        gate.wait(10)
+
+    for _ in scheduler.threads:
+        scheduler.submit(hold)
+    for _ in scheduler.threads:
+        assert started.acquire(timeout=5)
+
+
+def test_scheduler_runs_by_priority():
+    order = []
+    gate = threading.Event()
+    scheduler = lib.TaskScheduler(workers=1)
+    try:
+        block_scheduler(scheduler, gate)
+        futures = [
+            scheduler.submit(order.append, 'bulk-1', priority=lib.PRIORITY_BULK),
+            scheduler.submit(order.append, 'normal'),
+            scheduler.submit(order.append, 'bulk-2', priority=lib.PRIORITY_BULK),
+            scheduler.submit(order.append, 'search', priority=lib.PRIORITY_INTERACTIVE),
+        ]
+        assert scheduler.stats()['pending'] == {lib.PRIORITY_BULK: 2, lib.PRIORITY_NORMAL: 1, lib.PRIORITY_INTERACTIVE: 1}
+        gate.set()
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        gate.set()
+        scheduler.shutdown()
+    assert order == ['search', 'normal', 'bulk-1', 'bulk-2']
+
+
+def test_scheduler_future_results_and_errors():
+    with lib.TaskScheduler(workers=2) as scheduler:
+        assert scheduler.submit(pow, 2, 10).result(timeout=5) == 1024
+        with pytest.raises(ZeroDivisionError):
+            scheduler.submit(lambda: 1 / 0).result(timeout=5)
+        assert scheduler.submit(sorted, [3, 1], reverse=True).result(timeout=5) == [3, 1]
+    assert sum(x['tasks'] for x in scheduler.stats()['workers']) == 3
+
+
+def test_scheduler_cancel_pending():
+    gate = threading.Event()
+    scheduler = lib.TaskScheduler(workers=1)
+    try:
+        block_scheduler(scheduler, gate)
+        bulk = [scheduler.submit(time.sleep, 0, priority=lib.PRIORITY_BULK) for _ in range(3)]
+        normal = scheduler.submit(time.sleep, 0)
+        assert scheduler.cancel_pending(lib.PRIORITY_BULK) == 3
+    finally:
+        gate.set()
+        scheduler.shutdown()
+    assert normal.done() and not normal.cancelled()
+    assert all(x.cancelled() for x in bulk)
+    assert scheduler.stats()['pending'] == {}
+    with pytest.raises(RuntimeError):
+        scheduler.submit(time.sleep, 0)
+
+
+def test_scheduler_shutdown_cancels_queued_tasks():
+    gate = threading.Event()
+    scheduler = lib.TaskScheduler(workers=1)
+    try:
+        block_scheduler(scheduler, gate)
+        queued = scheduler.submit(time.sleep, 0)
+        threading.Timer(0.05, gate.set).start()
+        scheduler.shutdown(cancel_pending=True)
+    finally:
+        gate.set()
+        scheduler.shutdown()
+    assert queued.cancelled()
+    assert not any(x.is_alive() for x in scheduler.threads)
+
+
+def test_scheduler_idle_workers_block():
+    scheduler = lib.TaskScheduler(workers=2)
+    try:
+        time.sleep(0.2)
+        # 空闲的工作线程阻塞在队列上，不会空转
+        assert all(x['tasks'] == 0 and x['utilization'] == 0 for x in scheduler.stats()['workers'])
+        assert scheduler.submit(len, 'abc').result(timeout=1) == 3
+    finally:
+        scheduler.shutdown()
+
+
+def test_partition_with_index_keeps_duplicates():
+    parts = lib.partition_with_index(['a', 'b', 'a', 'c', 'a'], 2)
+    assert parts == [[(0, 'a'), (1, 'b'), (2, 'a')], [(3, 'c'), (4, 'a')]]
+    assert lib.partition_with_index([], 2) == [[], []]
+
+
+def test_split_list_with_index_is_unchanged():
+    assert lib.split_list_with_index(['a', 'b', 'c', 'd', 'e'], 2) == [[{'a': 0, 'b': 1, 'c': 2}], [{'d': 3, 'e': 4}]]
+    assert lib.split_list_with_index(['a'], 3) == [[{'a': 0}], [{}], [{}]]
+    with pytest.raises(ValueError):
+        lib.split_list_with_index([], 0)
+
+
+def test_work_stealing_map_keeps_order():
+    assert lib.work_stealing_map(lambda x: x * 2, list(range(50)), 4) == [x * 2 for x in range(50)]
+
+
+def test_work_stealing_balances_slow_items():
+    # 第一个线程分到的都是慢任务，其余线程做完后从它的队列尾部窃取
+    tasks = lib.WorkStealingQueue(list(range(12)), 3)
+    assert tasks.get(1) == (4, 4)
+    for _ in range(3):
+        tasks.get(1)
+    assert tasks.get(1) == (3, 3) and tasks.stolen == 1
+    taken = [tasks.get(2) for _ in range(len(tasks))]
+    assert tasks.get(0) is None and tasks.get(2) is None
+    assert sorted(x[0] for x in taken) == [0, 1, 2, 8, 9, 10, 11]
+
+
+def test_work_stealing_map_raises_first_error():
+    def func(x):
+        if x == 7:
+            raise ValueError(x)
+        return x
+
+    with pytest.raises(ValueError):
+        lib.work_stealing_map(func, list(range(20)), 3)
@@ -0,0 +1,228 @@
+import glob
+import logging
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+import lib
+
+
+@pytest.fixture
+def make_log(tmp_path):
+    """创建LogSystem，结束时停止监听线程并恢复根记录器"""
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    systems = []
+
+    def make(**kwargs) -> lib.LogSystem:
+        options = dict(
+            debug_mode=False,
+            log_dir=str(tmp_path / 'log'),
+            console_level=None,
+            archive_in_background=False,
+        )
+        options.update(kwargs)
+        system = lib.LogSystem(**options)
+        systems.append(system)
+        return system
+
+    yield make
+    for system in systems:
+        system.close()
+    for handler in root.handlers:
+        handler.close()
+    root.handlers[:] = saved_handlers
+    root.setLevel(saved_level)
+
+
+def read_log(system: lib.LogSystem) -> str:
+    path, = glob.glob(os.path.join(system.LOG_DIR, '*.log'))
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_async_logging_writes_after_close(make_log):
+    system = make_log()
+    assert system.listener is not None and lib.LogSystem._active_listener is system.listener
+
+    thread = threading.Thread(target=lambda: logging.info('来自%s', '工作线程'), name='Worker-1')
+    thread.start()
+    thread.join()
+    try:
+        raise ValueError('坏数据')
+    except ValueError:
+        logging.exception('解析失败')
+    system.close()
+
+    text = read_log(system)
+    assert '[Worker-1]' in text and '来自工作线程' in text  # 线程名取自调用线程
+    assert '解析失败' in text and 'ValueError: 坏数据' in text
+    assert lib.LogSystem._active_listener is None
+
+
+def test_slow_handler_does_not_block_caller(make_log):
+    system = make_log()
+    file_handler, = system.listener.handlers
+    emit = file_handler.emit
+
+    def slow_emit(record):
+        time.sleep(0.02)
+        emit(record)
+
+    file_handler.emit = slow_emit
+    start = time.monotonic()
+    for i in range(20):
+        logging.info('第%d页', i)
+    assert time.monotonic() - start < 0.2  # 写文件共需约0.4秒
+    system.close()
+    assert all(f'第{i}页' in read_log(system) for i in range(20))
+
+
+def test_new_log_system_replaces_listener(make_log):
+    first = make_log()
+    logging.info('first')
+    second = make_log()
+    logging.info('second')
+    assert lib.LogSystem._active_listener is second.listener
+    first.close()  # 已被替换的实例不能停止新的监听线程
+    assert lib.LogSystem._active_listener is second.listener
+    second.close()
+
+    logs = sorted(glob.glob(os.path.join(first.LOG_DIR, '*.log')))
+    assert len(logs) == 2
+    with open(logs[0], encoding='utf-8') as f:
+        assert 'first' in f.read()
+    with open(logs[1], encoding='utf-8') as f:
+        assert 'second' in f.read()
+
+
+def test_sync_logging(make_log):
+    system = make_log(async_logging=False)
+    assert system.listener is None
+    logging.warning('直接写入')
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+    assert '直接写入' in read_log(system)
+
+
+def test_debug_sampler_keeps_every_nth_record(make_log):
+    system = make_log(debug_sample=3)
+    for i in range(9):
+        logging.debug('page %d', i)
+    logging.info('info')
+    system.close()
+
+    text = read_log(system)
+    assert [i for i in range(9) if f'page {i}\n' in text] == [0, 3, 6]
+    assert 'info' in text
+    assert system.debug_sampler.dropped == 6
+
+
+def make_record(level=logging.DEBUG, lineno=1, created=0.0) -> logging.LogRecord:
+    record = logging.LogRecord('root', level, 'a.py', lineno, 'msg', None, None)
+    record.created = created
+    return record
+
+
+def test_debug_sampler_rate_per_call_site():
+    sampler = lib.DebugSampler(rate=2)
+    kept = [sampler.filter(make_record(created=0.1 * i)) for i in range(10)]
+    assert sum(kept) == 3  # 初始2条 + 1秒内补充的2*0.9条
+    assert sampler.filter(make_record(lineno=2, created=0.9))  # 其他调用位置不受影响
+    assert sampler.filter(make_record(logging.INFO, created=0.9))
+    assert sampler.dropped == 7
+
+
+def test_debug_sampler_decides_once_per_record():
+    sampler = lib.DebugSampler(sample=2)
+    record = make_record()
+    assert sampler.filter(record) and sampler.filter(record)  # 多个处理器看到相同结果
+    other = make_record()
+    assert not sampler.filter(other) and not sampler.filter(other)
+    assert sampler.dropped == 1
+    with pytest.raises(ValueError):
+        lib.DebugSampler(sample=0)
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def write_old_log(log_dir, date: str, text: str) -> str:
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, f'{date}_1.log')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def archive_names(path) -> list[str]:
+    with zipfile.ZipFile(path) as archive:
+        return sorted(archive.namelist())
+
+
+def test_old_logs_are_appended_to_archive(make_log, tmp_path):
+    log_dir = tmp_path / 'log'
+    date = days_ago(1)
+    zip_path = log_dir / 'archives' / f'logs_{date}.zip'
+    os.makedirs(zip_path.parent)
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.writestr(f'{date}_0.log', 'earlier run')
+    log = write_old_log(log_dir, date, 'yesterday')
+
+    make_log()
+    assert not os.path.exists(log)
+    assert archive_names(zip_path) == [f'{date}_0.log', f'{date}_1.log']
+    with zipfile.ZipFile(zip_path) as archive:
+        assert archive.read(f'{date}_1.log') == b'yesterday'
+
+
+def test_truncated_archive_is_kept_aside(make_log, tmp_path):
+    log_dir = tmp_path / 'log'
+    date = days_ago(1)
+    zip_path = log_dir / 'archives' / f'logs_{date}.zip'
+    os.makedirs(zip_path.parent)
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(f'{date}_0.log', 'earlier run')
+    truncated = zip_path.read_bytes()[:-10]  # 追加时被中断，目录没有写完
+    zip_path.write_bytes(truncated)
+    write_old_log(log_dir, date, 'yesterday')
+
+    make_log()
+    corrupt, = glob.glob(str(zip_path) + '.*.corrupt')
+    with open(corrupt, 'rb') as f:
+        kept = f.read()
+    # 旧日志留在改名后的文件中，新的归档只包含这次的日志
+    assert kept == truncated and b'earlier run' in kept
+    assert archive_names(zip_path) == [f'{date}_1.log']
+
+
+def test_expired_logs_and_archives_are_removed(make_log, tmp_path):
+    log_dir = tmp_path / 'log'
+    archive_dir = log_dir / 'archives'
+    os.makedirs(archive_dir)
+    old, recent = days_ago(10), days_ago(2)
+    for date in (old, recent):
+        with zipfile.ZipFile(archive_dir / f'logs_{date}.zip', 'w') as archive:
+            archive.writestr('x.log', 'x')
+    (archive_dir / f'logs_{old}.zip.1.corrupt').write_bytes(b'broken')
+    expired_log = write_old_log(log_dir, days_ago(9), 'expired')
+
+    make_log(keep_days=7)
+    assert not os.path.exists(expired_log)
+    assert sorted(os.listdir(archive_dir)) == [f'logs_{recent}.zip']
+
+
+def test_archive_size_limit_removes_oldest(make_log, tmp_path):
+    archive_dir = tmp_path / 'log' / 'archives'
+    os.makedirs(archive_dir)
+    dates = [days_ago(i) for i in (3, 2, 1)]
+    for date in dates:
+        (archive_dir / f'logs_{date}.zip').write_bytes(b'x' * 400_000)
+
+    make_log(max_archive_mb=1)
+    assert sorted(os.listdir(archive_dir)) == [f'logs_{date}.zip' for date in dates[1:]]
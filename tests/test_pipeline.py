@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import getData
+import pipeline
+
+
+@pytest.fixture
+def make_downloader(tmp_path):
+    downloaders = []
+
+    def make(**kwargs) -> getData.ComicDownloader:
+        options = dict(
+            init_webdrivers=False,
+            download_path=str(tmp_path / 'download'),
+            cache_path=None,
+            timeout=5,
+            max_retries=0,
+            max_download_threads=2,
+        )
+        options.update(kwargs)
+        downloader = getData.ComicDownloader(**options)
+        downloaders.append(downloader)
+        return downloader
+
+    yield make
+    for downloader in downloaders:
+        downloader.close()
+
+
+def chapter(cid: str) -> getData.ChapterInfo:
+    return getData.ChapterInfo(getData.ComicData('示例漫画', '505430'), '第' + cid + '话', cid)
+
+
+def fake_network(downloader, pages: int, broken: set[str] = frozenset()):
+    """章节cid在broken中时解析失败，URL以/bad结尾的页面下载失败"""
+
+    def get_comic_urls(chapter):
+        if chapter.cid in broken:
+            raise RuntimeError('解析失败')
+        return [f'http://img/{chapter.cid}/{i}' for i in range(pages)]
+
+    def fetch(url):
+        if url.endswith('/bad'):
+            raise requests.HTTPError('404')
+        return url.encode()
+
+    downloader.get_comic_urls = get_comic_urls
+    downloader._fetch_page_bytes = fetch
+
+
+def run_with_timeout(pipe: pipeline.DownloadPipeline, chapters, timeout: float = 10):
+    """流水线出错时不能卡住，超时视为失败"""
+    output = {}
+    thread = threading.Thread(target=lambda: output.update(pipe.run(chapters)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '流水线没有结束'
+    return output
+
+
+def test_pipeline_downloads_all_chapters(make_downloader):
+    downloader = make_downloader()
+    fake_network(downloader, 5)
+    pipe = pipeline.DownloadPipeline(downloader)
+    results = run_with_timeout(pipe, [chapter('1'), chapter('2')])
+
+    for cid in ('1', '2'):
+        assert [x.index for x in results[cid]] == [1, 2, 3, 4, 5]
+        assert all(x.success for x in results[cid])
+        with open(results[cid][0].path, 'rb') as f:
+            assert f.read() == f'http://img/{cid}/0'.encode()
+    stats = pipe.stats()
+    assert stats['fetch']['processed'] == 10 and stats['write']['processed'] == 10
+    assert not downloader.is_running
+
+
+def test_pipeline_bounds_pages_in_memory(make_downloader):
+    downloader = make_downloader()
+    fake_network(downloader, 40)
+    fetched = written = peak = 0
+    lock = threading.Lock()
+    fetch = downloader._fetch_page_bytes
+    write_page = downloader._write_page
+
+    def counting_fetch(url):
+        nonlocal fetched, peak
+        data = fetch(url)
+        with lock:
+            fetched += 1
+            peak = max(peak, fetched - written)
+        return data
+
+    def slow_write(*args):
+        nonlocal written
+        time.sleep(0.005)  # 写入比下载慢，下载阶段应被阻塞
+        with lock:
+            written += 1
+        return write_page(*args)
+
+    downloader._fetch_page_bytes = counting_fetch
+    downloader._write_page = slow_write
+    pipe = pipeline.DownloadPipeline(downloader, write_depth=3)
+    results = run_with_timeout(pipe, [chapter('1'), chapter('2')])
+
+    assert all(x.success for x in results['1'] + results['2'])
+    # 已下载未写入的页面: 写入队列3个 + 每个下载线程手上1个 + 正在写入的1个
+    assert peak <= 3 + 2 + 1
+
+
+def test_pipeline_isolates_resolve_failure(make_downloader):
+    downloader = make_downloader()
+    fake_network(downloader, 3, broken={'2'})
+    results = run_with_timeout(pipeline.DownloadPipeline(downloader), [chapter('1'), chapter('2'), chapter('3')])
+
+    failed, = results['2']
+    assert failed.index == 0 and failed.error == '解析失败'
+    assert all(x.success for x in results['1'] + results['3'])
+
+
+@pytest.mark.parametrize('output_format', ['dir', 'cbz'])
+def test_pipeline_page_failure(make_downloader, output_format):
+    downloader = make_downloader(output_format=output_format)
+    fake_network(downloader, 3)
+    downloader.get_comic_urls = lambda chapter: ['http://img/1', 'http://img/bad', 'http://img/3']
+    results = run_with_timeout(pipeline.DownloadPipeline(downloader), [chapter('1')])['1']
+
+    assert [x.success for x in results] == [True, False, True]
+    archive = downloader._get_archive_path(chapter('1'))
+    # 有页面失败时不生成压缩包，下次运行重新下载
+    assert not os.path.exists(archive) and not os.path.exists(archive + '.part')
+
+
+def test_pipeline_survives_write_errors(make_downloader):
+    downloader = make_downloader()
+    fake_network(downloader, 4)
+    write_page = downloader._write_page
+
+    def write(chapter, file_name, url, data):
+        if file_name == '002':
+            raise OSError('磁盘已满')
+        return write_page(chapter, file_name, url, data)
+
+    downloader._write_page = write
+    results = run_with_timeout(pipeline.DownloadPipeline(downloader), [chapter('1'), chapter('2')])
+
+    for cid in ('1', '2'):
+        assert [x.success for x in results[cid]] == [True, False, True, True]
+        assert results[cid][1].error == '磁盘已满'
+
+
+def test_pipeline_chapter_without_pages(make_downloader):
+    downloader = make_downloader(output_format='cbz')
+    fake_network(downloader, 0)
+    results = run_with_timeout(pipeline.DownloadPipeline(downloader), [chapter('1')])
+    assert results == {'1': []}
+    assert not os.path.exists(downloader._get_archive_path(chapter('1')))
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+import getData
+import ratelimit
+from conftest import QuietHandler
+
+
+def test_throttle_backs_off_once_per_cooldown():
+    limiter = ratelimit.AdaptiveHostLimiter(rate=20, concurrency=8, cooldown=10)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(status=429)
+    snapshot = limiter.snapshot()
+    assert snapshot['throttled'] == 3
+    assert snapshot['rate'] == pytest.approx(14) and snapshot['concurrency'] == 5
+    assert snapshot['ceiling'] == 20
+
+
+def test_retry_after_pauses_new_requests():
+    limiter = ratelimit.AdaptiveHostLimiter(rate=100)
+    limiter.acquire()
+    limiter.release(status=429, retry_after=0.3)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.25
+    limiter.release(status=200)
+
+
+def test_scattered_errors_do_not_back_off():
+    limiter = ratelimit.AdaptiveHostLimiter(rate=20, error_window=20, error_threshold=0.25)
+    for i in range(40):
+        limiter.acquire()
+        limiter.release(status=500 if i % 10 == 0 else 200)
+    assert limiter.snapshot()['errors'] == 4
+    assert limiter.snapshot()['rate'] >= 20
+
+
+def test_sustained_errors_back_off():
+    limiter = ratelimit.AdaptiveHostLimiter(rate=20, error_window=20, error_threshold=0.25, cooldown=0)
+    for i in range(21):
+        limiter.acquire()
+        limiter.release(error=i % 2 == 0)  # 最近20次中一半失败
+    assert limiter.snapshot()['rate'] < 20
+
+
+def test_concurrency_limit():
+    limiter = ratelimit.AdaptiveHostLimiter(rate=1000, concurrency=2)
+    active = peak = 0
+    lock = threading.Lock()
+
+    def request():
+        nonlocal active, peak
+        with ratelimit._LimiterSlot(limiter) as slot:
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            slot.record(503)  # 受限时并发数不再增加
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak <= 2
+
+
+def test_rate_limiter_is_per_host():
+    limiter = ratelimit.RateLimiter(rate=20)
+    with limiter.slot('http://a.example/1') as slot:
+        slot.record(429, {'Retry-After': '0'})
+    with limiter.slot('http://b.example/1') as slot:
+        slot.record(200)
+    stats = limiter.stats()
+    assert stats['a.example']['throttled'] == 1 and stats['a.example']['rate'] < 20
+    assert stats['b.example']['throttled'] == 0
+
+
+def throttling_handler(capacity: int):
+    """每秒超过capacity个请求时返回429和Retry-After: 1"""
+    state = {'served': 0, 'throttled': 0, 'recent': []}
+    lock = threading.Lock()
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            now = time.monotonic()
+            with lock:
+                state['recent'] = [x for x in state['recent'] if now - x < 1] + [now]
+                over = len(state['recent']) > capacity
+                state['throttled' if over else 'served'] += 1
+            if over:
+                self.send_body(429, b'slow down', {'Retry-After': '1'})
+            else:
+                self.send_body(200, self.path.encode())
+
+    return Handler, state
+
+
+def test_downloader_adapts_to_throttling_server(tmp_path, serve_handler):
+    handler, state = throttling_handler(capacity=40)
+    base = serve_handler(handler)
+    downloader = getData.ComicDownloader(
+        init_webdrivers=False,
+        download_path=str(tmp_path / 'download'),
+        cache_path=None,
+        timeout=5,
+        max_download_threads=8,
+        rate_limit=200,
+        max_retries=10,
+        retry_base_delay=0.05,
+        retry_max_delay=2,
+        retry_budget_ratio=2,
+    )
+    try:
+        chapter = getData.ChapterInfo(getData.ComicData('示例漫画', '505430'), '第1话', '1')
+        results = downloader.download_chapter(chapter, [f'{base}/{i}.jpg' for i in range(120)])
+        host = downloader.rate_limiter.stats()[base[len('http://'):]]
+    finally:
+        downloader.close()
+
+    assert all(x.success for x in results)
+    assert state['served'] == 120 and state['throttled'] > 0
+    # 限流器记录了429并降速，之后没有一直撞到服务器的上限
+    assert host['throttled'] > 0 and host['ceiling'] is not None
+    assert host['rate'] < 200
+    assert state['throttled'] < 120
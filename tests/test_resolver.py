@@ -0,0 +1,39 @@
+import getData
+from conftest import read_fixture
+
+
+def make_downloader(tmp_path, base_url: str) -> getData.ComicDownloader:
+    downloader = getData.ComicDownloader(
+        init_webdrivers=False,
+        download_path=str(tmp_path / 'download'),
+        cache_path=None,
+        timeout=5,
+        max_retries=0,
+    )
+    downloader.mobile_url = base_url
+    return downloader
+
+
+def test_get_jpg_files_by_http_parses_saved_chapter(tmp_path, serve_pages):
+    base = serve_pages({'/chapter/index/id/505430/cid/1': (200, read_fixture('chapter.html'))})
+    downloader = make_downloader(tmp_path, base)
+    chapter = getData.ChapterInfo(getData.ComicData('示例漫画', '505430'), '第1话', '1')
+    try:
+        urls = downloader._get_jpg_files_by_http(chapter)
+    finally:
+        downloader.close()
+
+    # 页面中有12张图片，末尾重复的预加载图片不计入；URL去掉尺寸后缀800
+    assert len(urls) == 12
+    assert urls[0] == 'https://manhua.acimg.cn/manhua_detail/0/12_08_45_7f3a9c00e1b2_1000.jpg/'
+    assert urls[-1] == 'https://manhua.acimg.cn/manhua_detail/0/12_08_45_7f3a9c11e1b2_1011.jpg/'
+
+
+def test_get_jpg_files_by_http_returns_empty_on_error(tmp_path, serve_pages):
+    base = serve_pages({})
+    downloader = make_downloader(tmp_path, base)
+    chapter = getData.ChapterInfo(getData.ComicData('示例漫画', '505430'), '第1话', '1')
+    try:
+        assert downloader._get_jpg_files_by_http(chapter) == []
+    finally:
+        downloader.close()
@@ -0,0 +1,178 @@
+import collections
+import types
+
+import pytest
+import requests
+
+import getData
+import retry
+from conftest import QuietHandler
+
+
+class Transient(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    fake = types.SimpleNamespace(monotonic=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s))
+    monkeypatch.setattr(retry, 'time', fake)
+    return now
+
+
+def flaky(failures: int, error=Transient):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error('fail')
+        return 'ok'
+
+    return func, calls
+
+
+def policy(**kwargs):
+    return retry.RetryPolicy(lambda e: isinstance(e, Transient), base_delay=0.01, **kwargs)
+
+
+def test_retry_policy_retries_transient_errors(clock):
+    func, calls = flaky(2)
+    assert policy(max_attempts=4).call(func) == 'ok'
+    assert len(calls) == 3
+
+
+def test_retry_policy_gives_up_after_max_attempts(clock):
+    func, calls = flaky(10)
+    with pytest.raises(Transient):
+        policy(max_attempts=3).call(func)
+    assert len(calls) == 3
+
+
+def test_retry_policy_does_not_retry_other_errors(clock):
+    func, calls = flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        policy().call(func)
+    assert len(calls) == 1
+
+
+def test_retry_budget_is_shared(clock):
+    budget = retry.RetryBudget(2)
+    func, calls = flaky(10)
+    with pytest.raises(Transient):
+        policy(max_attempts=10).call(func, budget=budget)
+    assert len(calls) == 3 and budget.remaining == 0
+    func, calls = flaky(1)
+    with pytest.raises(Transient):
+        policy(max_attempts=10).call(func, budget=budget)
+    assert len(calls) == 1
+
+
+def test_retry_delay_respects_retry_after():
+    error = Exception()
+    error.response = types.SimpleNamespace(headers={'Retry-After': '5'})
+    assert policy(max_delay=30).delay(0, error) >= 5
+    assert policy(max_delay=3).delay(0, error) == 3
+
+
+def test_circuit_breaker_transitions(clock):
+    breaker = retry.CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.failure()
+    assert breaker.state == 'closed'
+    breaker.failure()
+    assert breaker.state == 'open'
+    with pytest.raises(retry.CircuitOpenError):
+        breaker.before()
+
+    clock[0] += 10
+    breaker.before()  # 试探请求
+    assert breaker.state == 'half_open'
+    with pytest.raises(retry.CircuitOpenError):
+        breaker.before()  # 同时只允许一个试探
+    breaker.failure()
+    assert breaker.state == 'open' and breaker.opened == 2
+
+    clock[0] += 10
+    breaker.before()
+    breaker.success()
+    assert breaker.snapshot() == {'state': 'closed', 'failures': 0, 'opened': 2}
+    breaker.before()
+
+
+def test_retry_policy_opens_breaker(clock):
+    breaker = retry.CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    func, calls = flaky(10)
+    with pytest.raises(retry.CircuitOpenError):
+        policy(max_attempts=10).call(func, breaker=breaker)
+    assert len(calls) == 3
+
+
+def test_non_transient_error_closes_half_open_breaker(clock):
+    breaker = retry.CircuitBreaker(failure_threshold=1, reset_timeout=1)
+    breaker.failure()
+    clock[0] += 1
+    func, _ = flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        policy().call(func, breaker=breaker)
+    assert breaker.state == 'closed'
+
+
+def test_circuit_breakers_per_host():
+    breakers = retry.CircuitBreakers(failure_threshold=1)
+    assert breakers.get('http://a/x') is breakers.get('http://a/y')
+    breakers.get('http://a/x').failure()
+    assert breakers.stats() == {'a': {'state': 'open', 'failures': 1, 'opened': 1}}
+    assert breakers.get('http://b/x').state == 'closed'
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+@pytest.mark.parametrize('error, expected', [
+    (http_error(500), True),
+    (http_error(429), True),
+    (http_error(404), False),
+    (requests.ConnectionError('reset'), True),
+    (retry.IncompleteDownload('short'), True),
+    (retry.CircuitOpenError('open'), False),
+    (TimeoutError('没有可用的浏览器'), False),
+])
+def test_is_transient(error, expected):
+    assert getData.is_transient(error) is expected
+
+
+def test_download_retries_only_transient_pages(tmp_path, serve_handler):
+    attempts = collections.Counter()
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            attempts[self.path] += 1
+            if self.path == '/missing.jpg':
+                self.send_body(404, b'not found')
+            elif attempts[self.path] <= 2:
+                self.send_body(500, b'busy')
+            else:
+                self.send_body(200, self.path.encode())
+
+    base = serve_handler(Handler)
+    downloader = getData.ComicDownloader(
+        init_webdrivers=False,
+        download_path=str(tmp_path / 'download'),
+        cache_path=None,
+        timeout=5,
+        max_retries=3,
+        retry_base_delay=0.01,
+        retry_budget_ratio=1,
+    )
+    try:
+        chapter = getData.ChapterInfo(getData.ComicData('示例漫画', '505430'), '第1话', '1')
+        results = downloader.download_chapter(chapter, [base + '/1.jpg', base + '/missing.jpg', base + '/3.jpg'])
+    finally:
+        downloader.close()
+
+    assert [x.success for x in results] == [True, False, True]
+    assert attempts == {'/1.jpg': 3, '/missing.jpg': 1, '/3.jpg': 3}
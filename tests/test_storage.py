@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import storage
+
+
+def test_page_manifest_appends_and_reloads(tmp_path):
+    manifest = storage.PageManifest(str(tmp_path))
+    manifest.record('001', 'u1', 3, 'a')
+    manifest.record('002', 'u2', 4, 'b')
+    manifest.record('001', 'u1', 5, 'c')  # 后写入的记录覆盖旧记录
+    assert storage.PageManifest(str(tmp_path)).pages == {
+        '001': {'url': 'u1', 'size': 5, 'sha256': 'c'},
+        '002': {'url': 'u2', 'size': 4, 'sha256': 'b'},
+    }
+
+
+def test_page_manifest_ignores_broken_last_line(tmp_path):
+    manifest = storage.PageManifest(str(tmp_path))
+    manifest.record('001', 'u1', 3, 'a')
+    with open(manifest.path, 'a', encoding='utf-8') as f:
+        f.write('{"name": "002", "ur')  # 写入中途中断
+
+    manifest = storage.PageManifest(str(tmp_path))
+    assert list(manifest.pages) == ['001']
+    manifest.record('003', 'u3', 6, 'c')
+    assert list(storage.PageManifest(str(tmp_path)).pages) == ['001', '003']
+
+
+def test_page_manifest_reads_legacy_json(tmp_path):
+    legacy = tmp_path / storage.PageManifest.LEGACY_FILE_NAME
+    legacy.write_text(json.dumps({
+        '001': {'url': 'u1', 'size': 3, 'sha256': 'a'},
+        '002': {'url': 'u2', 'size': 4, 'sha256': 'b'},
+    }), encoding='utf-8')
+    (tmp_path / '001.jpg').write_bytes(b'abc')
+
+    manifest = storage.PageManifest(str(tmp_path))
+    assert manifest.is_complete('001', 'u1', str(tmp_path / '001.jpg'))
+    assert not legacy.exists()
+    manifest.record('003', 'u3', 5, 'c')
+    assert sorted(storage.PageManifest(str(tmp_path)).pages) == ['001', '002', '003']
+
+
+def test_page_manifest_new_records_win_over_legacy(tmp_path):
+    # 转换中途中断时两个清单同时存在，.pages.jsonl中的记录更新
+    (tmp_path / storage.PageManifest.LEGACY_FILE_NAME).write_text(
+        json.dumps({'001': {'url': 'old', 'size': 1, 'sha256': 'a'}}), encoding='utf-8'
+    )
+    (tmp_path / storage.PageManifest.FILE_NAME).write_text(
+        json.dumps({'name': '001', 'url': 'new', 'size': 2, 'sha256': 'b'}) + '\n', encoding='utf-8'
+    )
+    assert storage.PageManifest(str(tmp_path)).get('001')['url'] == 'new'
+    assert storage.PageManifest(str(tmp_path)).get('001')['url'] == 'new'
+    assert os.listdir(tmp_path) == [storage.PageManifest.FILE_NAME]
+
+
+def sha256_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_content_store_deduplicates_files(tmp_path):
+    store = storage.ContentStore(str(tmp_path / 'store'))
+    try:
+        for name, url in (('a', 'u1'), ('b', 'u2')):
+            (tmp_path / name).write_bytes(b'same image')
+            store.add(str(tmp_path / name), sha256_of(b'same image'), url)
+            store.materialize(sha256_of(b'same image'), str(tmp_path / (name + '.jpg')))
+        store.add_bytes(b'other', sha256_of(b'other'), 'u3')
+
+        assert store.stats() == {'objects': 2, 'bytes': len(b'same image') + len(b'other'), 'urls': 3}
+        assert store.lookup('u2') == (sha256_of(b'same image'), len(b'same image'))
+        assert store.lookup('unknown') is None
+        a, b = os.stat(tmp_path / 'a.jpg'), os.stat(tmp_path / 'b.jpg')
+        assert (a.st_ino, a.st_dev) == (b.st_ino, b.st_dev)
+        assert not (tmp_path / 'a').exists() and not (tmp_path / 'b').exists()
+    finally:
+        store.close()
+
+
+def test_content_store_lookup_needs_object(tmp_path):
+    store = storage.ContentStore(str(tmp_path))
+    try:
+        store.add_bytes(b'x', sha256_of(b'x'), 'u1')
+        os.remove(store.object_path(sha256_of(b'x')))
+        assert store.lookup('u1') is None  # 对象被删除后需要重新下载
+    finally:
+        store.close()
+
+
+def names(path):
+    with zipfile.ZipFile(path) as archive:
+        return archive.namelist()
+
+
+def test_cbz_writer_orders_pages(tmp_path):
+    path = str(tmp_path / 'c.cbz')
+    writer = storage.CBZWriter(path)
+    for index in (3, 1, 4, 2):
+        writer.add_page(index, b'page%d' % index)
+    writer.close()
+    assert names(path) == ['001.jpg', '002.jpg', '003.jpg', '004.jpg']
+    assert not os.path.exists(path + '.part')
+
+
+def test_cbz_writer_skipped_pages(tmp_path):
+    path = str(tmp_path / 'c.cbz')
+    writer = storage.CBZWriter(path)
+    writer.add_page(3, b'3')
+    writer.skip_page(2)
+    assert writer._pending  # 还在等第1页
+    writer.add_page(1, b'1')
+    assert not writer._pending
+    writer.close()
+    assert names(path) == ['001.jpg', '003.jpg']
+
+
+def test_cbz_writer_overflow_resumes_in_order(tmp_path):
+    path = str(tmp_path / 'c.cbz')
+    writer = storage.CBZWriter(path, max_pending=10)
+    writer.add_page(2, b'x' * 6)
+    writer.add_page(3, b'x' * 6)  # 超出暂存上限，第2页提前写入
+    writer.add_page(1, b'x')
+    assert writer._next == 4 and not writer._pending
+    for index in range(4, 8):
+        writer.add_page(index, b'y')
+        assert not writer._pending
+    writer.close()
+    assert sorted(names(path)) == [f'{i:03d}.jpg' for i in range(1, 8)]
+
+
+def test_cbz_writer_abort(tmp_path):
+    path = str(tmp_path / 'c.cbz')
+    writer = storage.CBZWriter(path)
+    writer.add_page(1, b'1')
+    writer.abort()
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.part')
+
+
+def test_archive_is_empty(tmp_path):
+    path = str(tmp_path / 'c.cbz')
+    zipfile.ZipFile(path, 'w').close()
+    assert storage.archive_is_empty(path)
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('001.jpg', b'1')
+    assert not storage.archive_is_empty(path)
+
+
+def test_archive_page_sizes(tmp_path):
+    path = str(tmp_path / 'c.cbz')
+    writer = storage.CBZWriter(path)
+    writer.add_page(2, b'22')
+    writer.add_page(1, b'1')
+    writer.close()
+    assert storage.archive_page_sizes(path) == {1: 1, 2: 2}
+    assert storage.archive_page_sizes(str(tmp_path / 'missing.cbz')) == {}
+
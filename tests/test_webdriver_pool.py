@@ -0,0 +1,180 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import getData
+
+
+class FakeDriver:
+    """只实现浏览器池用到的execute_script和quit"""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.alive = True
+        self.closed = False
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise RuntimeError('会话已崩溃')
+        return 1
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs) -> tuple[getData.WebDriverPool, list[FakeDriver]]:
+        created = []
+        counter = itertools.count(1)
+
+        def factory():
+            driver = FakeDriver(next(counter))
+            created.append(driver)
+            return driver
+
+        pool = getData.WebDriverPool(factory, **kwargs)
+        pools.append(pool)
+        return pool, created
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def wait_until(predicate, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_pool_creates_drivers_on_demand(make_pool):
+    pool, created = make_pool(max_size=2)
+    assert pool.size == 0
+    first = pool.acquire()
+    second = pool.acquire()
+    assert len(created) == 2 and first is not second
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()['timeouts'] == 1
+
+    pool.release(first)
+    assert pool.acquire(timeout=0.05) is first  # 复用刚归还的浏览器，不新建
+    assert len(created) == 2
+
+
+def test_pool_waiter_gets_released_driver(make_pool):
+    pool, created = make_pool(max_size=1)
+    driver = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)))
+    waiter.start()
+    assert wait_until(lambda: pool.stats()['waiting'] == 1)
+    pool.release(driver)
+    waiter.join()
+    assert got == [driver]
+
+
+def test_pool_warm_keeps_min_size(make_pool):
+    pool, created = make_pool(max_size=3, min_size=2)
+    pool.warm()
+    assert pool.stats()['idle'] == 2 and len(created) == 2
+
+
+def test_pool_recycles_after_max_page_loads(make_pool):
+    pool, created = make_pool(max_size=1, max_page_loads=2)
+    driver = pool.acquire()
+    pool.record_page_load(driver)
+    pool.release(driver)
+    assert pool.acquire() is driver
+
+    pool.record_page_load(driver)
+    pool.release(driver)
+    assert wait_until(lambda: driver.closed)
+    assert pool.acquire() is created[1]
+
+
+def test_pool_replaces_unresponsive_driver(make_pool):
+    pool, created = make_pool(max_size=1, probe_timeout=1)
+    driver = pool.acquire()
+    pool.release(driver)
+    driver.alive = False
+
+    replacement = pool.acquire()
+    assert replacement is created[1]
+    assert pool.stats()['replaced'] == 1
+    assert wait_until(lambda: driver.closed)
+
+
+def test_pool_release_broken_driver(make_pool):
+    pool, created = make_pool(max_size=1)
+    driver = pool.acquire()
+    pool.release(driver, broken=True)
+    assert pool.size == 0
+    assert pool.acquire() is created[1]
+
+
+def test_pool_closes_idle_drivers(make_pool):
+    pool, created = make_pool(max_size=2, idle_timeout=0.1)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert wait_until(lambda: pool.size == 0)
+    assert all(x.closed for x in created)
+
+
+def test_pool_close(make_pool):
+    pool, created = make_pool(max_size=2)
+    idle, busy = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    assert idle.closed and not busy.closed
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    pool.release(busy)  # 关闭后归还的浏览器直接关闭
+    assert wait_until(lambda: busy.closed)
+
+
+def test_lease_returns_driver_on_error(make_pool):
+    pool, created = make_pool(max_size=1)
+    with pytest.raises(ValueError):
+        with pool.lease('get_chapters') as driver:
+            assert pool.stats()['leases'][0]['holder'] == 'get_chapters'
+            raise ValueError
+    assert pool.stats()['in_use'] == 0
+    with pool.lease() as again:
+        assert again is driver
+        assert pool.stats()['leases'][0]['holder'] == threading.current_thread().name
+
+
+def test_timeout_reports_current_holders(make_pool):
+    pool, created = make_pool(max_size=1)
+    with pool.lease('search'):
+        with pytest.raises(TimeoutError, match='search'):
+            pool.acquire(timeout=0.01)
+
+
+def test_overdue_lease_is_reclaimed(make_pool):
+    pool, created = make_pool(max_size=1, max_lease_time=0.2, reclaim_overdue=True)
+    leaked = pool.acquire(holder='leaky')
+    assert wait_until(lambda: pool.stats()['reclaimed'] == 1)
+    assert wait_until(lambda: leaked.closed)
+    with pool.lease(timeout=1) as driver:
+        assert driver is created[1]
+    pool.release(leaked)  # 已回收的浏览器归还时忽略
+    assert pool.size == 1
+
+
+def test_overdue_lease_is_only_warned_by_default(make_pool, caplog):
+    pool, created = make_pool(max_size=1, max_lease_time=0.2)
+    driver = pool.acquire(holder='slow')
+    assert wait_until(lambda: 'slow' in caplog.text)
+    assert pool.stats()['reclaimed'] == 0 and not driver.closed
+    pool.release(driver)